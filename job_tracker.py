@@ -41,10 +41,211 @@ import time
 import argparse
 import tempfile
 import glob
+import zlib
+import struct
+import multiprocessing
+import json
+import copy
+import itertools
+import threading
+import pipes
+import select
+import math
+import heapq
+import BaseHTTPServer
+import SocketServer
+import resource
 
 
 MPI_CMD_LIST = ['mpirun', 'mpiexec', 'mpirun_rsh', 'mpiexec_mpt']
 
+CGROUP_MEMORY_ROOTS = ['/cgroup/memory/pbspro', '/sys/fs/cgroup/memory/pbspro']
+
+PROC_READ_SIZE = 8192
+
+RESCAN_TICKS = 10
+
+RAW_LAYOUT_START = 7
+
+LEGACY_RAW_LAYOUT_START = 5
+
+CLOCK_MONOTONIC = 1
+
+RAW_BINARY_EXT = '.jtr'
+
+RAW_LAYOUT_EXT = '.jtl'
+
+RAW_MAGIC = b'JTR1'
+
+RAW_LAYOUT_MAGIC = b'JTL1'
+
+RAW_LAYOUT_READ_SIZE = 65536
+
+RAW_HEADER_FORMAT = '<4sIII'
+
+RAW_HEADER_SIZE = struct.calcsize(RAW_HEADER_FORMAT)
+
+# time, job_mem, node_mem, node_load, cgroup_mem, mono_time, interval (until
+# the next scheduled sample, how long the sample stays valid)
+RAW_RECORD_FORMAT = '<dqqfqdf'
+
+RAW_RECORD_SIZE = struct.calcsize(RAW_RECORD_FORMAT)
+
+RAW_FLAG_NODE_MEM_LOAD_ONLY = 1
+
+RAW_LAYOUT_MAX_RUN = 64
+
+RAW_SUMMARY_EXT = '.idx'
+
+RAW_AGGREGATE_FILE = 'aggregate.jta'
+
+RAW_AGGREGATE_MAGIC = b'JTA1'
+
+# node index followed by the fields of RAW_RECORD_FORMAT
+RAW_AGGREGATE_FORMAT = '<H' + RAW_RECORD_FORMAT[1:]
+
+RAW_AGGREGATE_SIZE = struct.calcsize(RAW_AGGREGATE_FORMAT)
+
+RAW_AGGREGATE_NODES_EXT = '.nodes'
+
+RAW_AGGREGATE_TOTALS_EXT = '.totals'
+
+# magic, hostname length, record count
+STREAM_HEADER_FORMAT = '<4sII'
+
+STREAM_HEADER_SIZE = struct.calcsize(STREAM_HEADER_FORMAT)
+
+STREAM_MAGIC = b'JTF1'
+
+STREAM_TIMEOUT = 30.0
+
+REDUCE_MAGIC = b'JTP1'
+
+# bucket, node count, 4 sums, 4 maxima, node holding each maximum
+REDUCE_RECORD_FORMAT = '<qI8d64s64s64s64s'
+
+REDUCE_RECORD_SIZE = struct.calcsize(REDUCE_RECORD_FORMAT)
+
+# Buckets a late source may hold up a reduction, and hold its last value for
+REDUCE_GRACE = 2
+
+# Seconds between attempts to reach a parent that could not be sent to, and
+# the most partials kept for it meanwhile
+REDUCE_RETRY = 5.0
+
+REDUCE_MAX_UNSENT = 1024
+
+RAW_REDUCED_FILE = 'reduced_totals.csv'
+
+RAW_OVERHEAD_EXT = '.ovh'
+
+RAW_LAYOUT_SUMMARY_EXT = '.jls'
+
+# processor (field 39 of /proc/<pid>/task/<tid>/stat) counted from the state field
+TASK_STAT_PROCESSOR = 36
+
+# Task stat files kept open by the task layout (at most half the soft limit
+# on open files), the stat files of further threads are opened per sample
+TASK_STAT_MAX_OPEN = 1024
+
+# --report points out nodes whose running threads shared a core in more
+# than this share of the samples, or that migrate more than this per thread
+LAYOUT_OVERSUBSCRIBED_PERCENT = 10.0
+
+LAYOUT_MIGRATIONS_PER_THREAD = 0.1
+
+PLOT_LAYOUT_EXT = '_node_layout.npz'
+
+# Every plot data file gets a pyramid of coarser levels next to it, each
+# level's buckets hold PLOT_PYRAMID_FACTOR times the samples of the level
+# below, down to about PLOT_PYRAMID_MIN_BUCKETS buckets
+PLOT_PYRAMID_EXT = '.pyr.npz'
+
+PLOT_PYRAMID_FACTOR = 4
+
+PLOT_PYRAMID_MIN_BUCKETS = 256
+
+# LTTB walks its buckets one by one, finer levels only keep min/max/mean
+PLOT_LTTB_MAX_POINTS = 32768
+
+# --render_plots puts a job's plot data and figures here unless --plot_dir is given
+PLOT_RENDER_DIR = 'plots'
+
+# Samples of a node --gen_plot_data reads at a time, and the stretch of
+# the grid the job totals are worked out for at once
+PLOT_STREAM_CHUNK = 4096
+
+# Weight of the newest sample in the smoothed collector overhead
+OVERHEAD_SMOOTHING = 0.3
+
+# Samples --max_overhead ignores at the start and after each change it made
+OVERHEAD_SETTLE_SAMPLES = 5
+
+# Share of --max_overhead below which a raised interval is halved again
+OVERHEAD_RECOVER = 0.5
+
+METRICS_PREFIX = 'job_tracker_'
+
+METRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# metric name -> (help text, unit)
+METRICS_HELP = {'sample_time_seconds': ('Wall clock time of the last sample.', 'seconds'),
+                'sample_interval_seconds': ('Sampling interval in effect for the last sample.', 'seconds'),
+                'job_rss_bytes': ('Resident set size of the job\'s processes on the node.', 'bytes'),
+                'node_memory_used_bytes': ('Node memory in use, without buffers and page cache.', 'bytes'),
+                'node_load1': ('One minute load average of the node.', ''),
+                'cgroup_memory_usage_bytes': ('Memory usage of the job\'s cgroup on the node.', 'bytes'),
+                'running_threads': ('Running threads of the job on each core.', '')}
+
+REPORT_CACHE_FILE = 'report_cache.json'
+
+REPORT_CACHE_VERSION = 1
+
+# Written by the first host into the job directory, --ingest files the job
+# under the executable it names
+JOB_INFO_FILE = 'job_info.json'
+
+# The job history lives in this file in the home directory unless
+# --history_db is given, every job's totals are kept at about
+# HISTORY_SERIES_POINTS points
+HISTORY_DB_FILE = '.job_tracker_history.db'
+
+HISTORY_SCHEMA_VERSION = 1
+
+HISTORY_SERIES_POINTS = 256
+
+HISTORY_COLUMNS = ['job_mem', 'node_mem', 'node_load', 'cgroup_mem']
+
+HISTORY_SCHEMA = ['CREATE TABLE jobs (jobid TEXT PRIMARY KEY, jobname TEXT, executable TEXT, node_type TEXT, directory TEXT, start_time REAL, end_time REAL, duration REAL, nodes INTEGER, '
+                  'job_mem INTEGER, job_mem_time REAL, node_mem INTEGER, node_mem_time REAL, node_load REAL, node_load_time REAL, cgroup_mem INTEGER, cgroup_mem_time REAL, '
+                  'nodes_job_mem_max INTEGER, nodes_job_mem_mean REAL, nodes_node_mem_max INTEGER, nodes_node_mem_mean REAL, nodes_node_load_max REAL, nodes_node_load_mean REAL, '
+                  'nodes_cgroup_mem_max INTEGER, nodes_cgroup_mem_mean REAL, ingest_time REAL)',
+                  'CREATE TABLE nodes (jobid TEXT, node TEXT, node_type TEXT, start_time REAL, end_time REAL, '
+                  'job_mem INTEGER, job_mem_time REAL, node_mem INTEGER, node_mem_time REAL, node_load REAL, node_load_time REAL, cgroup_mem INTEGER, cgroup_mem_time REAL, PRIMARY KEY (jobid, node))',
+                  'CREATE TABLE series (jobid TEXT PRIMARY KEY, time BLOB, job_mem BLOB, node_mem BLOB, node_load BLOB, cgroup_mem BLOB)',
+                  'CREATE INDEX jobs_executable ON jobs (executable, start_time)',
+                  'CREATE INDEX jobs_start ON jobs (start_time)',
+                  'CREATE INDEX nodes_node ON nodes (node, start_time)',
+                  'CREATE INDEX nodes_type ON nodes (node_type, jobid)']
+
+# --live flags nodes whose last sample is this much older than the newest
+LIVE_STALE_SECONDS = 10
+
+# Rewrite the summary sidecar every N samples, index one offset per N seconds
+RAW_SUMMARY_WRITE_SAMPLES = 100
+
+RAW_SUMMARY_INDEX_SECONDS = 60.0
+
+LAUNCHER_COMM_LIST = MPI_CMD_LIST + ['sh', 'bash', 'csh', 'tcsh', 'ksh', 'zsh', 'time', 'ssh', 'pbs_attach', 'pbs_tmrsh', 'orted', 'hydra_pmi_proxy', 'mpispawn']
+
+LAUNCH_STATUS = 'JT_STATUS'
+
+AGGREGATOR_STATUS = 'JT_AGGREGATOR'
+
+SSH_REMOTE_SETUP = 'source /etc/profile.d/modules.sh && module load use.projects utils && '
+
+PAGE_SIZE_KB = os.sysconf('SC_PAGE_SIZE') / 1024
+
 
 
 def getComputeNodeType(compute_node_name):
@@ -72,135 +273,787 @@ def getNumberComputeCores(compute_node_type):
     return number_compute_node_cores
 
 
-class ExecuteCmd(object):
+def get_monotonic_clock():
+    if hasattr(time, 'monotonic'):
+       return time.monotonic
+    try:
+       import ctypes
+       import ctypes.util
+       librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+    except (ImportError, OSError):
+       return time.time
+
+    class timespec(ctypes.Structure):
+          _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    ts = timespec()
+    def clock_monotonic():
+        if librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+           errno = ctypes.get_errno()
+           raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return clock_monotonic
+
+
+monotonic = get_monotonic_clock()
+
+
+def rawLayoutStart(row):
+    # Rows written before the monotonic time/interval columns were added
+    # go straight from the cgroup column to the tid,core pairs. Both kinds
+    # have an odd length, so the length only settles rows too short for the
+    # two columns; longer ones have a tid (an integer) where the monotonic
+    # time (a float, maybe without a '.') would be.
+    if LEGACY_RAW_LAYOUT_START <= len(row) < RAW_LAYOUT_START:
+       return LEGACY_RAW_LAYOUT_START
+    if len(row) >= RAW_LAYOUT_START and str(row[LEGACY_RAW_LAYOUT_START]).strip().isdigit():
+       return LEGACY_RAW_LAYOUT_START
+    return RAW_LAYOUT_START
+
+
+def node_phase(hostname, interval, jitter):
+    return (zlib.crc32(hostname.encode('utf-8')) & 0xffff) / 65536.0 * jitter * interval
+
+
+def collector_options(args):
+    options = ' --interval ' + str(args.interval) + ' --jitter ' + str(args.jitter) + ' --rescan_ticks ' + str(args.rescan_ticks) + ' --format ' + args.format
+    if args.adaptive:
+       options = options + ' --adaptive --max_interval ' + str(args.max_interval) + ' --sensitivity ' + str(args.sensitivity)
+       if args.min_interval:
+          options = options + ' --min_interval ' + str(args.min_interval)
+    if args.collection_time:
+       options = options + ' --collection_time ' + str(args.collection_time[0])
+    options = options + ' --stream_batch ' + str(args.stream_batch)
+    if args.stream:
+       options = options + ' --stream ' + args.stream
+    if args.metrics_port is not None:
+       options = options + ' --metrics_port ' + str(args.metrics_port)
+    if args.max_overhead:
+       options = options + ' --max_overhead ' + str(args.max_overhead)
+    options = options + ' --task_layout ' + args.task_layout
+    if args.reduce:
+       options = options + ' --reduce'
+       if args.reduce_bucket:
+          options = options + ' --reduce_bucket ' + str(args.reduce_bucket)
+    options = options + ' --fanout ' + str(args.fanout) + ' --launch_window ' + str(args.launch_window) + ' --launch_retries ' + str(args.launch_retries) + ' --launch_timeout ' + str(args.launch_timeout) + ' --launch_transport ' + args.launch_transport
+    return options
+
+
+def proc_pread(fd, size, offset):
+    if hasattr(os, 'pread'):
+       data = os.pread(fd, size, offset)
+    else:
+       os.lseek(fd, offset, os.SEEK_SET)
+       data = os.read(fd, size)
+    if not isinstance(data, str):
+       data = data.decode('utf-8', 'replace')
+    return data
+
+
+class ProcFile(object):
+
+      def __init__(self, path, size=PROC_READ_SIZE):
+          self.path = path
+          self.size = size
+          self.fd = os.open(path, os.O_RDONLY)
+
+      def read(self):
+          return proc_pread(self.fd, self.size, 0)
+
+      def readAll(self):
+          chunks = []
+          offset = 0
+          while True:
+              data = proc_pread(self.fd, self.size, offset)
+              if not data:
+                 break
+              chunks.append(data)
+              offset = offset + len(data)
+          return "".join(chunks)
+
+      def close(self):
+          if self.fd is not None:
+             os.close(self.fd)
+             self.fd = None
+
+
+class ProcSampler(object):
+
+      # Reads node and process accounting straight out of /proc and the cgroup
+      # filesystem. Handles are opened once and re-read with pread, so steady
+      # state sampling never forks.
+      def __init__(self, pbsjobid=None):
+          self.meminfo = ProcFile('/proc/meminfo')
+          self.loadavg = ProcFile('/proc/loadavg')
+          self.cgroup_dir = ProcSampler.findCgroupDir(self, pbsjobid)
+          self.cgroup_usage = None
+          self.cgroup_procs = None
+          self.cgroup_procs_are_tasks = False
+          if self.cgroup_dir is not None:
+             self.cgroup_usage = ProcFile(os.path.join(self.cgroup_dir, 'memory.usage_in_bytes'))
+             for procs_file in ['cgroup.procs', 'tasks']:
+                 if os.path.exists(os.path.join(self.cgroup_dir, procs_file)):
+                    self.cgroup_procs = ProcFile(os.path.join(self.cgroup_dir, procs_file))
+                    self.cgroup_procs_are_tasks = procs_file == 'tasks'
+                    break
+          self.statm = {}
+
+
+      def findCgroupDir(self, pbsjobid):
+          if not pbsjobid:
+             return None
+          for cgroup_root in CGROUP_MEMORY_ROOTS:
+              cgroup_dir = os.path.join(cgroup_root, pbsjobid)
+              if os.path.exists(os.path.join(cgroup_dir, 'memory.usage_in_bytes')):
+                 return cgroup_dir
+          return None
+
+
+      def getNodeMemory(self):
+          # Same value as the "-/+ buffers/cache" used column of free
+          meminfo = {}
+          for line in self.meminfo.read().splitlines():
+              data = line.split()
+              if len(data) >= 2:
+                 meminfo[data[0].rstrip(':')] = int(data[1])
+          return meminfo['MemTotal'] - meminfo['MemFree'] - meminfo.get('Buffers', 0) - meminfo.get('Cached', 0)
+
+
+      def getNodeLoad(self):
+          return float(self.loadavg.read().split()[0])
+
+
+      def getLastPid(self):
+          # Last field of /proc/loadavg only moves when a process is created
+          return self.loadavg.read().split()[-1]
+
+
+      def getCgroupMemory(self):
+          if self.cgroup_usage is None:
+             return 0
+          return int(self.cgroup_usage.read().strip())/1024
+
 
-      def __init__(self, cmd):
-          self.f = ExecuteCmd.getFileHandler(self, cmd)
+      def getProcessMemory(self, pid):
+          try:
+             if pid not in self.statm:
+                self.statm[pid] = ProcFile(os.path.join('/proc', pid, 'statm'), 256)
+             return int(self.statm[pid].read().split()[1]) * PAGE_SIZE_KB
+          except (OSError, IOError, IndexError, ValueError):
+             self.releaseProcess(pid)
+             return None
 
-      def getFileHandler(self, cmd):
-          return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
 
+      def releaseProcess(self, pid):
+          if pid in self.statm:
+             self.statm.pop(pid).close()
+
+
+      def getProcessArgs(self, pid):
+          try:
+             f = open(os.path.join('/proc', pid, 'cmdline'), 'rb')
+             try:
+                cmdline = f.read()
+             finally:
+                f.close()
+          except (OSError, IOError):
+             return ""
+          if not isinstance(cmdline, str):
+             cmdline = cmdline.decode('utf-8', 'replace')
+          return cmdline.replace('\0', ' ').strip()
+
+
+      def getProcessStatus(self, pid):
+          # (comm, ppid, tgid) of a process, read once when it is first seen
+          status = {}
+          try:
+             f = open(os.path.join('/proc', pid, 'status'), 'r')
+             try:
+                for line in f:
+                    data = line.split(':', 1)
+                    if len(data) == 2 and data[0] in ('Name', 'PPid', 'Tgid'):
+                       status[data[0]] = data[1].strip()
+                       if len(status) == 3:
+                          break
+             finally:
+                f.close()
+             return (status['Name'], status['PPid'], status['Tgid'])
+          except (OSError, IOError, KeyError):
+             return None
+
+
+      def listPids(self):
+          return [pid for pid in os.listdir('/proc') if pid.isdigit()]
+
+
+      def listCgroupPids(self):
+          if self.cgroup_procs is None:
+             return None
+          try:
+             pids = self.cgroup_procs.readAll().split()
+          except (OSError, IOError):
+             return None
+          if self.cgroup_procs_are_tasks:
+             # tasks lists every thread, only thread group leaders show up
+             # in /proc and have a status of their own
+             leaders = set(self.listPids())
+             pids = [pid for pid in pids if pid in leaders]
+          return pids
+
+
+class SampleScheduler(object):
+
+      # Samples on absolute monotonic deadlines (start + n*interval), so the
+      # time spent sampling does not accumulate into drift. Deadlines that
+      # have already passed are skipped and counted as overruns.
+      def __init__(self, interval, phase=0.0):
+          self.interval = interval
+          self.start = monotonic()
+          self.deadline = self.start + phase
+          self.ticks = 0
+          self.overruns = 0
+
+
+      def wait(self):
+          delay = self.deadline - monotonic()
+          if delay > 0.0:
+             time.sleep(delay)
+
+
+      def advance(self):
+          self.ticks = self.ticks + 1
+          self.deadline = self.deadline + self.interval
+          late = monotonic() - self.deadline
+          if late > 0.0:
+             missed = int(late / self.interval) + 1
+             self.overruns = self.overruns + missed
+             self.deadline = self.deadline + missed * self.interval
+
+
+      def elapsed(self):
+          return monotonic() - self.start
+
+
+      def summary(self):
+          return "job_tracker: %d samples, %d missed ticks (overruns) at %.3fs interval" % (self.ticks, self.overruns, self.interval)
+
+
+class AdaptiveInterval(object):
+
+      # Drops back to the minimum interval as soon as any watched value moves
+      # by more than the sensitivity (relative), otherwise doubles the
+      # interval up to the maximum.
+      def __init__(self, min_interval, max_interval, sensitivity):
+          self.min_interval = min_interval
+          self.max_interval = max(min_interval, max_interval)
+          self.sensitivity = sensitivity
+          self.interval = min_interval
+          self.previous = None
+
+
+      def update(self, values):
+          values = [float(value) for value in values]
+          if self.previous is not None:
+             changed = False
+             for value, previous in zip(values, self.previous):
+                 if abs(value - previous) > self.sensitivity * max(abs(previous), 1.0):
+                    changed = True
+                    break
+             if changed:
+                self.interval = self.min_interval
+             else:
+                self.interval = min(self.interval * 2.0, self.max_interval)
+          self.previous = values
+          return self.interval
+
+
+def getAdaptiveInterval(args):
+    if not args.adaptive:
+       return None
+    return AdaptiveInterval(args.min_interval or args.interval, args.max_interval, args.sensitivity)
+
+
+def getSampleScheduler(args, hostname, adaptive):
+    if adaptive is not None:
+       interval = adaptive.interval
+    else:
+       interval = args.interval
+    return SampleScheduler(interval, node_phase(hostname, interval, args.jitter))
+
+
+class OverheadMonitor(object):
+
+      # Measures what every sample costs: wall and CPU time of taking and
+      # writing it, the collector's RSS and the bytes it wrote, one row per
+      # sample in host.ovh. With --max_overhead the collector's CPU share is
+      # kept under budget, first by dropping the per-thread task layout and
+      # then by doubling the sampling interval up to --max_interval. Below
+      # OVERHEAD_RECOVER of the budget the interval is halved again, down to
+      # where it was raised from; the task layout stays off. The collection
+      # loop keeps its interval at or above floor.
+      def __init__(self, filename, agent, max_overhead, max_interval):
+          self.f = open(filename,'wb',1)
+          self.writer = csv.writer(self.f)
+          self.agent = agent
+          self.max_overhead = max_overhead
+          self.max_interval = max_interval
+          self.statm = ProcFile('/proc/self/statm', 256)
+          try:
+             self.io = ProcFile('/proc/self/io', 1024)
+          except (OSError, IOError):
+             self.io = None
+          self.floor = 0.0
+          self.base = None
+          self.smoothed = None
+          self.settle = OVERHEAD_SETTLE_SAMPLES
+          self.start_mono = monotonic()
+          self.start_cpu = self.cpu_time()
+          self.last_mono = self.start_mono
+          self.last_cpu = self.start_cpu
+          self.last_written = self.bytes_written()
+
+
+      def cpu_time(self):
+          usage = resource.getrusage(resource.RUSAGE_SELF)
+          return usage.ru_utime + usage.ru_stime
+
+
+      def bytes_written(self):
+          if self.io is None:
+             return 0
+          for line in self.io.read().splitlines():
+              if line.startswith('wchar:'):
+                 return int(line.split()[1])
+          return 0
+
+
+      def start(self):
+          self.sample_mono = monotonic()
+          self.sample_cpu = self.cpu_time()
+
+
+      def finish(self, interval):
+          now = monotonic()
+          cpu = self.cpu_time()
+          written = self.bytes_written()
+          rss = int(self.statm.read().split()[1]) * PAGE_SIZE_KB
+          overhead = 0.0
+          if now > self.last_mono:
+             overhead = 100.0 * (cpu - self.last_cpu) / (now - self.last_mono)
+          self.writer.writerow([time.time(), now - self.sample_mono, cpu - self.sample_cpu, rss, written - self.last_written, interval, overhead, int(self.agent.task_layout)])
+          self.last_mono = now
+          self.last_cpu = cpu
+          self.last_written = written
+          if self.max_overhead:
+             self.enforce(overhead, max(interval, self.floor))
+
+
+      def enforce(self, overhead, interval):
+          # the first samples (process discovery) and the ones right after
+          # a change are not representative
+          if self.settle > 0:
+             self.settle = self.settle - 1
+             return
+          if self.smoothed is None:
+             self.smoothed = overhead
+          else:
+             self.smoothed = OVERHEAD_SMOOTHING * overhead + (1.0 - OVERHEAD_SMOOTHING) * self.smoothed
+          if self.smoothed <= self.max_overhead:
+             if self.floor > 0.0 and self.smoothed < OVERHEAD_RECOVER * self.max_overhead:
+                self.settle = OVERHEAD_SETTLE_SAMPLES
+                self.smoothed = None
+                self.floor = self.floor / 2.0
+                if self.floor <= self.base:
+                   self.floor = 0.0
+                   print("job_tracker: collector overhead is under budget again, sampling at the requested interval")
+                else:
+                   print("job_tracker: collector overhead is under budget again, sampling every %.3fs at least" % self.floor)
+             return
+          if not self.agent.task_layout and interval >= self.max_interval:
+             return
+          print("job_tracker: collector overhead %.2f%% is over --max_overhead %.2f%%" % (self.smoothed, self.max_overhead))
+          self.settle = OVERHEAD_SETTLE_SAMPLES
+          self.smoothed = None
+          if self.agent.task_layout:
+             self.agent.task_layout = False
+             print("job_tracker: no longer recording the task layout")
+             return
+          if self.floor == 0.0:
+             self.base = interval
+          self.floor = min(interval * 2.0, self.max_interval)
+          print("job_tracker: sampling every %.3fs at least" % self.floor)
+
+
+      def summary(self):
+          elapsed = monotonic() - self.start_mono
+          cpu = self.cpu_time() - self.start_cpu
+          overhead = 0.0
+          if elapsed > 0.0:
+             overhead = 100.0 * cpu / elapsed
+          return "job_tracker: collector used %.3fs CPU in %.3fs (%.3f%%)" % (cpu, elapsed, overhead)
+
+
+      def close(self):
+          self.f.close()
+          self.statm.close()
+          if self.io is not None:
+             self.io.close()
+
+
+def getOverheadMonitor(directory, hostname, args, agent):
+    return OverheadMonitor(os.path.join(directory, hostname + RAW_OVERHEAD_EXT), agent, args.max_overhead, args.max_interval)
+
+
+class JobProcessTree(object):
+
+      # Tracks which processes belong to the job by following ppid links
+      # from the launched executable (roots), from the PBS cgroup, or from
+      # processes matching the exe pattern when neither is available. Only
+      # PIDs not seen before are inspected on each update.
+      def __init__(self, sampler, root_pids=None, exe_pattern=None):
+          self.sampler = sampler
+          self.root_pids = set(root_pids or [])
+          self.exe_pattern = exe_pattern
+          self.tracker_pid = str(os.getpid())
+          self.status = {}
+          self.members = set()
+          self.excluded = set()
+
+
+      def update(self):
+          candidates = self.sampler.listCgroupPids()
+          cgroup_seeds = candidates is not None and not self.root_pids
+          if candidates is None:
+             candidates = self.sampler.listPids()
+          candidate_set = set(candidates)
+          for pid in list(self.status):
+              if pid not in candidate_set:
+                 JobProcessTree.forget(self, pid)
+          pending = []
+          for pid in candidates:
+              if pid not in self.status:
+                 status = self.sampler.getProcessStatus(pid)
+                 if status is None or status[2] != pid:
+                    continue
+                 self.status[pid] = status
+                 pending.append(pid)
+          pending.sort(key=int)
+          progress = True
+          while pending and progress:
+              progress = False
+              unresolved = []
+              pending_set = set(pending)
+              for pid in pending:
+                  parent = self.status[pid][1]
+                  # the tracker is never part of the job, even when it was
+                  # started inside the job's cgroup by one of its processes
+                  if pid == self.tracker_pid:
+                     self.excluded.add(pid)
+                  elif pid in self.root_pids or parent in self.members:
+                     self.members.add(pid)
+                  elif parent in self.excluded:
+                     self.excluded.add(pid)
+                  elif parent in pending_set:
+                     unresolved.append(pid)
+                     continue
+                  elif cgroup_seeds or JobProcessTree.matchesPattern(self, pid):
+                     self.members.add(pid)
+                  progress = True
+              pending = unresolved
+          for pid in self.members:
+              if self.status[pid][0] in LAUNCHER_COMM_LIST:
+                 # launchers fork and exec the job, so pick up the new name
+                 status = self.sampler.getProcessStatus(pid)
+                 if status is not None:
+                    self.status[pid] = status
+
+
+      def forget(self, pid):
+          del self.status[pid]
+          self.members.discard(pid)
+          self.excluded.discard(pid)
+
+
+      def matchesPattern(self, pid):
+          if self.exe_pattern is None:
+             return False
+          ps_str = self.sampler.getProcessArgs(pid)
+          return bool(ps_str) and self.exe_pattern.search(ps_str) is not None and __file__ not in ps_str and re.search('/sh\s',ps_str) is None
+
+
+      def jobPids(self):
+          return sorted([pid for pid in self.members if self.status[pid][0] not in LAUNCHER_COMM_LIST], key=int)
+
+
+class TaskLayout(object):
+
+      # Core placement of the threads of the job's processes. A process's
+      # thread list is only re-read when the process table changed (thread
+      # creation moves the last pid as well) and the stat files of up to
+      # max_open threads stay open and are re-read with pread, those of any
+      # further threads are opened for each sample. sample() returns the running
+      # threads as tid,core pairs and leaves a summary of the sample in
+      # self.summary, written to host.jls when a log file is given, and the
+      # running threads per core in self.running.
+      def __init__(self, cores, filename=None, proc='/proc'):
+          self.cores = cores
+          self.proc = proc
+          self.max_open = taskStatMaxOpen()
+          self.capped = False
+          self.threads = {}
+          self.stat = {}
+          self.last_core = {}
+          self.summary = None
+          self.running = {}
+          self.f = None
+          if filename is not None:
+             self.f = open(filename,'wb',1)
+             self.writer = csv.writer(self.f)
+
+
+      def update_threads(self, pids):
+          threads = {}
+          for pid in pids:
+              try:
+                 threads[pid] = os.listdir(os.path.join(self.proc, pid, 'task'))
+              except OSError:
+                 continue
+          self.threads = threads
+          live = set()
+          for tids in threads.values():
+              live.update(tids)
+          for tid in list(self.stat):
+              if tid not in live:
+                 self.forget(tid)
+
+
+      def forget(self, tid):
+          if tid in self.stat:
+             self.stat.pop(tid).close()
+
+
+      def read_stat(self, pid, tid):
+          # (state, last core) of a thread, None once it is gone
+          try:
+             if tid in self.stat:
+                data = self.stat[tid].read()
+             elif len(self.stat) < self.max_open:
+                self.stat[tid] = ProcFile(os.path.join(self.proc, pid, 'task', tid, 'stat'), 1024)
+                data = self.stat[tid].read()
+             else:
+                if not self.capped:
+                   print("job_tracker: keeping %d task stat files open, those of further job threads are opened per sample" % self.max_open)
+                   self.capped = True
+                f = ProcFile(os.path.join(self.proc, pid, 'task', tid, 'stat'), 1024)
+                try:
+                   data = f.read()
+                finally:
+                   f.close()
+             # comm can hold spaces and parentheses, count fields after it
+             fields = data[data.rfind(')') + 2:].split()
+             return fields[0], int(fields[TASK_STAT_PROCESSOR])
+          except (OSError, IOError, IndexError, ValueError):
+             self.forget(tid)
+             return None
+
+
+      def sample(self, pids, relist, wall_time):
+          if relist or [pid for pid in pids if pid not in self.threads]:
+             self.update_threads(pids)
+          layout = []
+          running = {}
+          current = {}
+          migrations = 0
+          for pid in pids:
+              for tid in self.threads.get(pid, []):
+                  stat = self.read_stat(pid, tid)
+                  if stat is None:
+                     continue
+                  state, core = stat
+                  if tid in self.last_core and self.last_core[tid] != core:
+                     migrations = migrations + 1
+                  current[tid] = core
+                  if state == 'R':
+                     layout.append(tid)
+                     layout.append(core)
+                     running[core] = running.get(core, 0) + 1
+          self.last_core = current
+          self.running = running
+          # time, threads, running threads, busy cores, oversubscribed cores,
+          # idle cores, most running threads on one core, migrations
+          self.summary = [wall_time, len(current), len(layout) // 2, len(running),
+                          len([core for core in running if running[core] > 1]),
+                          max(self.cores - len(running), 0), max(list(running.values()) + [0]), migrations]
+          if self.f is not None:
+             self.writer.writerow(self.summary)
+          return layout
+
+
+      def close(self):
+          for tid in list(self.stat):
+              self.forget(tid)
+          if self.f is not None:
+             self.f.close()
+
+
+def taskStatMaxOpen():
+    soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft == resource.RLIM_INFINITY:
+       return TASK_STAT_MAX_OPEN
+    return min(TASK_STAT_MAX_OPEN, soft // 2)
+
+
+def getTaskLayout(directory, hostname):
+    return TaskLayout(multiprocessing.cpu_count(), os.path.join(directory, hostname + RAW_LAYOUT_SUMMARY_EXT))
 
 
 class CollectAgent(object):
   
-      def __init__(self, exe_pattern, pbsjobid):
+      def __init__(self, exe_pattern, pbsjobid, sampler, rescan_ticks=RESCAN_TICKS, root_pids=None, layout=None, record_layout=True):
           self.exe_pattern = exe_pattern
 #          print self.exe_pattern
           self.pbsjobid = pbsjobid
+          self.sampler = sampler
+          self.rescan_ticks = rescan_ticks
+          self.process_tree = JobProcessTree(sampler, root_pids, exe_pattern)
           self.pids = []
+          self.last_pid = None
+          self.tick = 0
+          self.interval = 0.0
           self.collect = False
+          self.task_layout = True
+          self.layout = layout
+          if layout is None:
+             self.layout = TaskLayout(multiprocessing.cpu_count())
+          self.record_layout = record_layout
+          self.relist = True
+          self.data = None
+
+
+      def sample(self, interval=0.0):
+          self.interval = interval
+          self.relist = self.tick % self.rescan_ticks == 0 or self.sampler.getLastPid() != self.last_pid
+          if self.relist:
+             CollectAgent.discoverProcesses(self)
           self.data = CollectAgent.getData(self)
+          self.collect = len(self.pids) > 0
+          self.tick = self.tick + 1
+          return self.data
+
+
+      def discoverProcesses(self):
+          self.last_pid = self.sampler.getLastPid()
+          self.process_tree.update()
+          for pid in self.pids:
+              if pid not in self.process_tree.members:
+                 self.sampler.releaseProcess(pid)
+          self.pids = self.process_tree.jobPids()
 
 
       def getData(self):
+          wall_time = time.time()
+          mono_time = monotonic()
           job_memory = CollectAgent.getJobMemory(self)
           node_memory = CollectAgent.getNodeMemory(self)
           node_load = CollectAgent.getNodeLoad(self)
           cgroup_memory = CollectAgent.getCgroupMemory(self)
 #          print node_load
-          tasklayout = CollectAgent.getTaskLayout(self)
+          tasklayout = CollectAgent.getTaskLayout(self, wall_time)
 #          print tasklayout
-          return [time.time(), job_memory, int(node_memory), float(node_load), cgroup_memory] + tasklayout
+          return [wall_time, job_memory, int(node_memory), float(node_load), cgroup_memory, mono_time, self.interval] + tasklayout
+
+
+      def setInterval(self, interval):
+          # the row records the interval to the next scheduled sample
+          self.interval = interval
+          self.data[RAW_LAYOUT_START - 1] = interval
+
+
+      def watchValues(self):
+          return [self.data[1], self.data[4], self.data[3]]
 
 
       def getNodeMemory(self):
-          free_cmd = ExecuteCmd("free")
-          for free_str in free_cmd.f:
-              if 'buffers/cache' in free_str:
-                 data = free_str.split(':')
-          return data[-1].split()[0]
+          return self.sampler.getNodeMemory()
 
 
       def getNodeLoad(self):
-          load_cmd = ExecuteCmd("uptime")
-          for uptime_str in load_cmd.f:
-              data = uptime_str.split(',')
-          return data[-3].split(':')[1]
+          return self.sampler.getNodeLoad()
 
 
       def getJobMemory(self):
           total_job_mem = 0
-#          print "(getJobMemory)self.command_args.executable_name=",self.command_args.executable_name,socket.gethostname()
-          ps_cmd = ExecuteCmd("ps -e -o pid,rss,args")
-          for ps_str in ps_cmd.f:
-#              print ps_str
-              if self.exe_pattern.search(ps_str) is not None and __file__ not in ps_str and not CollectAgent.foundMpiCmd(self, ps_str) and re.search('/sh\s',ps_str) is None:
-#              if self.command_args.executable_name in ps_str and __file__ not in ps_str and not CollectAgent.foundMpiCmd(self, ps_str):
-                 data = ps_str.split()
-                 total_job_mem = total_job_mem + int(data[1])
-                 pid = data[0]
-                 if pid not in self.pids:
-                    self.pids.append(pid)
-                 self.collect = True
+          for pid in list(self.pids):
+              rss = self.sampler.getProcessMemory(pid)
+              if rss is None:
+                 CollectAgent.dropProcess(self, pid)
+                 continue
+              total_job_mem = total_job_mem + rss
           return total_job_mem
 
 
+      def dropProcess(self, pid):
+          self.pids.remove(pid)
+          self.process_tree.forget(pid)
+          self.sampler.releaseProcess(pid)
+
+
       def getCgroupMemory(self):
-          cgroup_used_mem_file = "/cgroup/memory/pbspro/"+self.pbsjobid+"/memory.usage_in_bytes"
-          myCommand = "cat %s" % (cgroup_used_mem_file)
-          f = subprocess.Popen(myCommand,shell=True,stdin=subprocess.PIPE,stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
-          for line in f:
-              return int(line.strip())/1024
+          return self.sampler.getCgroupMemory()
 
 
-      def getTaskLayout(self):
-          tasklayout = []
-          for pid in self.pids:
-#              print pid
-              pathname = os.path.join("/proc",pid,"task")
-              for pid_dir in os.listdir(pathname):
-                  pathname2 = os.path.join(pathname,pid_dir)
-                  if os.path.isdir(pathname2):
-                     f = open(os.path.join(pathname2,"stat"))
-                     line = f.read()
-                     data = line.split()
-                     physical_id = int(data[-6])
-                     state = data[2]
-                     if state == "R":
-#                        print physical_id
-                        tasklayout.append(pid_dir)
-                        tasklayout.append(physical_id)
+      def getTaskLayout(self, wall_time):
+          # with --task_layout summary only the summary leaves the node
+          if not self.task_layout:
+             return []
+          tasklayout = self.layout.sample(self.pids, self.relist, wall_time)
+          if not self.record_layout:
+             return []
           return tasklayout
-                  
 
-      def foundMpiCmd(self, ps_str):
-          found = False
-          for mpi_cmd in MPI_CMD_LIST:
-              if mpi_cmd in ps_str:
-                 found = True
-                 break
-          return found
 
 
 class CollectAgent2(object):
   
-      def __init__(self):
+      def __init__(self, sampler):
 #          print self.exe_pattern
+          self.sampler = sampler
           self.pids = []
           self.collect = True
+          self.interval = 0.0
+          self.task_layout = False
+          self.data = None
+
+
+      def sample(self, interval=0.0):
+          self.interval = interval
           self.data = CollectAgent2.getData(self)
+          return self.data
 
 
       def getData(self):
+          wall_time = time.time()
+          mono_time = monotonic()
           node_memory = CollectAgent2.getNodeMemory(self)
           node_load = CollectAgent2.getNodeLoad(self)
-          return [time.time(), int(node_memory), float(node_load)]
+          return [wall_time, int(node_memory), float(node_load), mono_time, self.interval]
+
+
+      def setInterval(self, interval):
+          self.interval = interval
+          self.data[-1] = interval
+
+
+      def watchValues(self):
+          return [self.data[1], self.data[2]]
 
 
       def getNodeMemory(self):
-          free_cmd = ExecuteCmd("free")
-          for free_str in free_cmd.f:
-              if 'buffers/cache' in free_str:
-                 data = free_str.split(':')
-          return data[-1].split()[0]
+          return self.sampler.getNodeMemory()
 
 
       def getNodeLoad(self):
-          load_cmd = ExecuteCmd("uptime")
-          for uptime_str in load_cmd.f:
-              data = uptime_str.split(',')
-          return data[-3].split(':')[1]
+          return self.sampler.getNodeLoad()
 
 
 class CommandArgs(object):
@@ -208,6 +1061,8 @@ class CommandArgs(object):
       def __init__(self):
           parser = argparse.ArgumentParser(description="Job Tracking wrapper")
           self.args = CommandArgs.getArgs(self, parser)
+          if self.args.rescan_ticks < 1:
+             sys.exit("Error: --rescan_ticks must be at least 1")
 #          print self.args
           self.exe_args = " ".join(self.args.exe_args)
           self.exe_args = self.args.exe_args
@@ -239,7 +1094,26 @@ class CommandArgs(object):
 
       def getArgs(self, parser):
           tracker_group = parser.add_argument_group('Job Tracking', 'The following options control how the job_tracker tracks memory usage/load')
-          tracker_group.add_argument('--interval', metavar='float', type=float, default=0.75, nargs=1, help='Sleep interval between data collection.')
+          tracker_group.add_argument('--interval', metavar='float', type=float, default=0.75, help='Sleep interval between data collection.')
+          tracker_group.add_argument('--adaptive', action='store_true', help='Adapt the sampling interval: sample at --min_interval while job memory, cgroup memory or load are changing and back off exponentially to --max_interval while they are flat.')
+          tracker_group.add_argument('--min_interval', metavar='float', type=float, help='Shortest interval used by --adaptive (default --interval).')
+          tracker_group.add_argument('--max_interval', metavar='float', type=float, default=30.0, help='Longest interval used by --adaptive.')
+          tracker_group.add_argument('--sensitivity', metavar='float', type=float, default=0.05, help='Relative change between samples that makes --adaptive return to the shortest interval.')
+          tracker_group.add_argument('--format', choices=['csv', 'binary'], default='csv', help='On-disk format of the raw tracking data: one CSV row per sample, or fixed-width binary records (host.jtr) plus a run-length encoded task layout stream (host.jtl).')
+          tracker_group.add_argument('--jitter', metavar='float', type=float, default=0.0, help='Offset each node\'s sampling phase by up to this fraction of the interval (0-1), so nodes do not all sample at the same instant.')
+          tracker_group.add_argument('--rescan_ticks', metavar='int', type=int, default=RESCAN_TICKS, help='Rescan the process table for new job processes every N samples (it is also rescanned whenever a new process is created).')
+          tracker_group.add_argument('--fanout', metavar='int', type=int, default=8, help='Start the node agents in a tree, every agent starts at most this many others.')
+          tracker_group.add_argument('--launch_window', metavar='int', type=int, default=8, help='Number of agents each agent is allowed to be starting at the same time.')
+          tracker_group.add_argument('--launch_retries', metavar='int', type=int, default=2, help='Retry starting an agent this many times before giving up on the node.')
+          tracker_group.add_argument('--launch_timeout', metavar='float', type=float, default=120.0, help='Seconds to wait for an agent (and the agents it starts) to report back.')
+          tracker_group.add_argument('--launch_transport', choices=['ssh', 'local'], default='ssh', help='How agents are started on other nodes, local runs every agent on this host (for testing).')
+          tracker_group.add_argument('--stream', choices=['tcp', 'unix'], help='Send the samples of every node to an aggregator on the first host, which writes one consolidated file (aggregate.jta) and keeps job totals while the job runs. Nodes that cannot reach it write their own raw file. unix only works when every agent runs on the first host.')
+          tracker_group.add_argument('--reduce', action='store_true', help='With --stream, reduce the job totals up the launch tree: every agent sums its own and its subtree\'s samples per time bucket and sends only that upwards, per-node data stays in the nodes\' raw files. The first host writes the totals to reduced_totals.csv.')
+          tracker_group.add_argument('--reduce_bucket', metavar='float', type=float, help='Width in seconds of the time buckets used by --reduce (default --interval).')
+          tracker_group.add_argument('--stream_batch', metavar='int', type=int, default=10, help='Number of samples a node sends to the aggregator at a time.')
+          tracker_group.add_argument('--task_layout', choices=['full', 'summary'], default='full', help='full records the core of every running job thread in the raw data, summary only keeps the per-sample placement summary (threads per core, oversubscribed and idle cores, migrations) in host.jls, which is written either way.')
+          tracker_group.add_argument('--max_overhead', '--max-overhead', dest='max_overhead', metavar='float', type=float, help='Budget for the CPU the collector may use on a node, in percent of one core. Above it the collector stops recording the task layout and then keeps doubling its interval up to --max_interval, halving it again once the overhead stays under half the budget. The measured overhead of every sample is written to host.ovh either way.')
+          tracker_group.add_argument('--metrics_port', metavar='int', type=int, help='Serve the latest sample of every node agent as OpenMetrics text on http://node:port/metrics (0 picks a free port, the address is written to the launch log).')
           tracker_group.add_argument('exe_args', metavar='command', nargs='*', help='Executable and arguments(if any), must be enclosed in quotes')
           internal_group = parser.add_argument_group('Internal', 'Internal options (Do not use)')
           internal_group.add_argument('--pbsjobid', metavar='internal', nargs=1, help='Internal option.')
@@ -248,13 +1122,50 @@ class CommandArgs(object):
           internal_group.add_argument('--exe_pattern', metavar='internal', nargs=1, help='Internal option.')
           internal_group.add_argument('--collection_time', metavar='float', type=float, nargs=1, help='Internal option.')
           internal_group.add_argument('--cwd', metavar='internal', nargs=1, help='Internal option.')
+          internal_group.add_argument('--launch_tree', metavar='internal', nargs=1, help='Internal option.')
+          internal_group.add_argument('--hostname', metavar='internal', nargs=1, help='Internal option.')
+          internal_group.add_argument('--aggregate', action='store_true', help='Internal option.')
+          internal_group.add_argument('--aggregator', metavar='internal', nargs=1, help='Internal option.')
           general_group = parser.add_argument_group('General options', 'The following options are used in combination with other arguments')
           general_group.add_argument('--rawdata', metavar='dir', nargs=1, help='Specify directory containing raw job tracking data.')
+          general_group.add_argument('--workers', metavar='int', type=int, default=multiprocessing.cpu_count(), help='Number of worker processes used to parse the raw tracking data files (default: number of cpus).')
+          general_group.add_argument('--grid_step', metavar='float', type=float, help='Align all node series on a common time grid with this step in seconds before computing job totals (default: the sample times of the node that started first).')
+          general_group.add_argument('--align', choices=['hold', 'linear'], default='hold', help='How node samples are placed on the time grid: hold the last value, or interpolate linearly between samples.')
           report_group = parser.add_argument_group('Generate text report', 'The following options control how the report is generated')
           report_group.add_argument('--report', action='store_true',help='Generate a text report, make sure you specify the directory containing raw job tracking data. (--rawdata)')
+          report_group.add_argument('--no-cache', dest='no_cache', action='store_true', help='Rebuild the report from all of the raw data instead of resuming from the report cache (report_cache.json) kept in the rawdata directory.')
+          report_group.add_argument('--quick', action='store_true',help='Only report the per-node maxima, read from the summary files written during collection instead of the raw data (job wide totals are skipped).')
+          live_group = parser.add_argument_group('Live job monitor', 'The following options control the dashboard of a running job')
+          live_group.add_argument('--live', action='store_true', help='Show a dashboard of a running job that is refreshed until interrupted, make sure you specify the directory containing raw job tracking data. (--rawdata)')
+          live_group.add_argument('--refresh', metavar='float', type=float, default=1.0, help='Seconds between refreshes of the --live dashboard.')
+          live_group.add_argument('--top', metavar='int', type=int, default=10, help='Number of nodes listed by --live.')
+          live_group.add_argument('--mem_limit', metavar='float', type=float, help='Per-node cgroup memory limit in MB that --live shows the headroom against (default: the limit of the job\'s cgroup on this host).')
+          convert_group = parser.add_argument_group('Convert raw data', 'The following options convert existing raw job tracking data')
+          convert_group.add_argument('--convert_rawdata', action='store_true', help='Convert the CSV raw tracking data in --rawdata to the binary format (add --node_mem_load_only for data collected in that mode).')
+          history_group = parser.add_argument_group('Job history', 'The following options keep summaries of finished jobs in a local SQLite database and query it')
+          history_group.add_argument('--ingest', metavar='rawdata_dir', nargs='+', help='Reduce every finished job directory given to its job wide and per-node peaks, duration and downsampled job totals and store them in the job history (a job ingested again is replaced).')
+          history_group.add_argument('--history', choices=['jobs', 'nodes', 'executables', 'series'], help='Query the job history: one line per job, per node of every job, per executable (highest and mean per-node peaks of its runs), or the downsampled job totals of --jobid as CSV.')
+          history_group.add_argument('--history_db', metavar='file', nargs=1, help='Job history database (default: ~/%s).' % HISTORY_DB_FILE)
+          history_group.add_argument('--executable', metavar='name', nargs=1, help='Only query jobs of this executable. With --ingest, the executable of job directories that do not record one.')
+          history_group.add_argument('--since', metavar='date', nargs=1, help='Only query jobs started after this date (YYYY-MM-DD) or within this age (30d, 12h).')
+          history_group.add_argument('--jobid', metavar='id', nargs=1, help='Only query this job.')
+          history_group.add_argument('--node_type', metavar='type', nargs=1, help='Only query nodes (with --history nodes) or jobs that ran on nodes of this type (haswell, broadwell, fission, bechler).')
+          history_group.add_argument('--sort_by', choices=['start', 'duration', 'job_mem', 'node_mem', 'node_load', 'cgroup_mem'], default='start', help='Column the --history lines are sorted on, highest first.')
+          history_group.add_argument('--limit', metavar='int', type=int, default=50, help='Most lines --history prints (0 prints all).')
+          recommend_group = parser.add_argument_group('Memory request recommendation', 'The following options recommend a memory request from the peaks of past jobs')
+          recommend_group.add_argument('--recommend_mem', metavar='rawdata_dir', nargs='+', help='Recommend a per-node and job wide memory request from the per-node and job total peaks of job and cgroup memory of the job directories given (directories recording another executable than --executable are skipped, --quick only uses the per-node peaks), using --workers processes.')
+          recommend_group.add_argument('--percentile', metavar='float', type=float, default=95.0, help='Percentile of the peaks --recommend_mem covers.')
+          recommend_group.add_argument('--headroom', metavar='float', type=float, default=10.0, help='Percent --recommend_mem adds on top of the percentile.')
           plot_group = parser.add_argument_group('Generate plot data and graphs', 'The following options control how plot data is generated and plotted')
           plot_group.add_argument('--gen_plot_data', metavar="filename", nargs=1, help='Generate plot data files from the raw tracking data, specify a filename for the generated plot data file. (Make sure you specify the location of the raw tracking data (--rawdata).')
-          plot_group.add_argument('--plot_data', metavar='plot_file', nargs='*', help='Plot data files, specify the plot files to be plotted')
+          plot_group.add_argument('--thread_layout', action='store_true', help='With --gen_plot_data also store the core every thread ran on (thread x time) in the node layout file, next to the running threads per core.')
+          plot_group.add_argument('--render_plots', metavar='rawdata_dir', nargs='+', help='Generate the plot data of every job directory given and draw its standard figures (totals, nodes with the highest and lowest peaks, core layout) to files without a display, using --workers processes.')
+          plot_group.add_argument('--plot_dir', metavar='dir', nargs=1, help='Directory --render_plots writes into, one sub-directory per job (default: %s in every job directory).' % PLOT_RENDER_DIR)
+          plot_group.add_argument('--plot_format', choices=['png', 'svg'], default='png', help='File format of the figures drawn by --render_plots.')
+          plot_group.add_argument('--width', metavar='pixels', type=int, default=2000, help='Most points --plot_data draws per line, it picks the finest level of the plot data pyramid that fits.')
+          plot_group.add_argument('--time_window', metavar=('start', 'end'), type=float, nargs=2, help='Only plot this time window (seconds since the start of the job).')
+          plot_group.add_argument('--decimate', choices=['minmax', 'lttb'], default='minmax', help='How --plot_data draws a coarser level: the mean with a band from the minimum to the maximum of every bucket, or the largest-triangle-three-buckets selection of samples.')
+          plot_group.add_argument('--plot_data', metavar='plot_file', nargs='*', help='Plot data files, specify the plot files to be plotted (a %s node layout file is drawn as a heatmap)' % PLOT_LAYOUT_EXT)
           return parser.parse_args() 
 
 
@@ -315,11 +1226,277 @@ class Pbs(object):
           return output
 
 
+class SshTransport(object):
+
+      def command(self, host, agent_cmd):
+          return ['ssh', '-o', 'BatchMode=yes', host, SSH_REMOTE_SETUP + agent_cmd]
+
+
+class LocalTransport(object):
+
+      # Fork-based stand-in for ssh, every "node" is an agent on this host.
+      # The shell execs the agent so a timeout kills the agent itself.
+      def command(self, host, agent_cmd):
+          return ['sh', '-c', 'exec ' + agent_cmd + ' --hostname ' + host]
+
+
+def getTransport(name):
+    if name == 'local':
+       return LocalTransport()
+    return SshTransport()
+
+
+def agentHostname(args):
+    if args.hostname:
+       return args.hostname[0]
+    return socket.gethostname()
+
+
+def agentCommand():
+    # The command line this agent was started with, minus its place in the tree
+    argv = []
+    skip = False
+    for arg in sys.argv:
+        if skip:
+           skip = False
+        elif arg in ['--launch_tree', '--hostname', '--aggregator']:
+           skip = True
+        else:
+           argv.append(pipes.quote(arg))
+    return ' '.join(argv)
+
+
+def launchLogFile(directory, pbsjobid):
+    return os.path.join(directory, 'job_tracker_launch_' + pbsjobid + '.log')
+
+
+class LaunchLog(object):
+
+      # One log for the whole job instead of two files per node, every line
+      # is written with a single O_APPEND write so agents do not interleave
+      def __init__(self, filename, hostname):
+          self.filename = filename
+          self.hostname = hostname
+          self.fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+          self.partial = ''
+
+
+      def write(self, data):
+          lines = (self.partial + data).split('\n')
+          self.partial = lines.pop()
+          for line in lines:
+              self.writeraw(self.hostname + ': ' + line)
+
+
+      def writeraw(self, line):
+          os.write(self.fd, line + '\n')
+
+
+      def flush(self):
+          pass
+
+
+      def redirect(self):
+          sys.stdout.flush()
+          sys.stderr.flush()
+          os.dup2(self.fd, 1)
+          os.dup2(self.fd, 2)
+          sys.stdout = self
+          sys.stderr = self
+
+
+class TreeLauncher(object):
+
+      # Starts agents in a k-ary tree: each agent started here is handed the
+      # rest of its group with --launch_tree and starts those itself. Status
+      # lines travel back up the tree on the agents' stdout.
+      def __init__(self, agent_cmd, args, out):
+          self.agent_cmd = agent_cmd
+          self.transport = getTransport(args.launch_transport)
+          self.fanout = max(args.fanout, 1)
+          self.retries = args.launch_retries
+          self.timeout = args.launch_timeout
+          self.window = threading.BoundedSemaphore(max(args.launch_window, 1))
+          self.out = out
+          self.lock = threading.Lock()
+          self.started = []
+          self.failed = []
+
+
+      def launch(self, hosts):
+          threads = []
+          for group in self.split(hosts):
+              thread = threading.Thread(target=self.launch_group, args=(group,))
+              thread.start()
+              threads.append(thread)
+          for thread in threads:
+              thread.join()
+
+
+      def start(self, hosts, finish):
+          # launch() in the background so the caller can start sampling,
+          # finish() is called once the whole tree has reported
+          def run():
+              self.launch(hosts)
+              finish()
+          thread = threading.Thread(target=run)
+          thread.start()
+          return thread
+
+
+      def split(self, hosts):
+          groups = []
+          for i in range(self.fanout):
+              group = hosts[i*len(hosts)//self.fanout:(i+1)*len(hosts)//self.fanout]
+              if group:
+                 groups.append(group)
+          return groups
+
+
+      def launch_group(self, group):
+          # If the head of a group cannot be started the next host takes
+          # over, unless its agent ran and may still be starting the group
+          while group:
+              result = self.launch_host(group[0], group[1:])
+              if result == 'started':
+                 return
+              if result == 'running':
+                 self.emit('%s %s timeout' % (LAUNCH_STATUS, group[0]))
+                 return
+              self.emit('%s %s failed' % (LAUNCH_STATUS, group[0]))
+              group = group[1:]
+
+
+      def launch_host(self, host, subtree):
+          # Only attempts that failed before the agent reported running are
+          # retried, one that got further may have left the agent starting
+          # its subtree and a second agent would write the same host files
+          cmd = self.agent_cmd
+          if subtree:
+             cmd = cmd + ' --launch_tree ' + ','.join(subtree)
+          for attempt in range(self.retries + 1):
+              if attempt > 0:
+                 time.sleep(2 ** attempt)
+              self.window.acquire()
+              try:
+                 result = self.start_host(host, cmd)
+              finally:
+                 self.window.release()
+              if result is not None:
+                 return result
+          return None
+
+
+      def start_host(self, host, cmd):
+          # 'started' once the agent and its subtree are up, 'running' if the
+          # agent reported in but not that, None if it never reported
+          try:
+             proc = subprocess.Popen(self.transport.command(host, cmd), stdin=open(os.devnull), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+          except OSError as e:
+             self.emit('%s: %s' % (host, e))
+             return None
+          timer = threading.Timer(self.timeout, self.kill, [proc])
+          timer.start()
+          result = None
+          try:
+             for line in iter(proc.stdout.readline, ''):
+                 line = line.rstrip('\n')
+                 fields = line.split()
+                 if fields[:1] == [LAUNCH_STATUS]:
+                    self.emit(line)
+                    # an agent reports running first and itself last, after its whole subtree
+                    if fields[1:3] == [host, 'running']:
+                       result = 'running'
+                    elif fields[1:3] == [host, 'started']:
+                       result = 'started'
+                       break
+                 else:
+                    self.emit(host + ': ' + line)
+          finally:
+             timer.cancel()
+          if result != 'started':
+             proc.wait()
+          return result
+
+
+      def kill(self, proc):
+          try:
+             proc.kill()
+          except OSError:
+             pass
+
+
+      def emit(self, line):
+          fields = line.split()
+          self.lock.acquire()
+          try:
+             if fields[:1] == [LAUNCH_STATUS]:
+                if fields[2] == 'started':
+                   self.started.append(fields[1])
+                elif fields[2] != 'running':
+                   self.failed.append(fields[1])
+             self.out(line)
+          finally:
+             self.lock.release()
+
+
+def writeStdout(line):
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+def launchTree(agent_cmd, hosts, args, directory, pbsjobid):
+    log = LaunchLog(launchLogFile(directory, pbsjobid), socket.gethostname())
+    if args.stream:
+       address = startAggregator(args, directory, os.path.dirname(directory), pbsjobid)
+       if address is not None:
+          args.aggregator = [address]
+          agent_cmd = agent_cmd + ' --aggregator ' + pipes.quote(address)
+    launcher = TreeLauncher(agent_cmd, args, log.writeraw)
+    def finish():
+        print("\n Job tracker started on %d of %d nodes, launch log is %s" % (len(launcher.started), len(hosts), log.filename))
+        if launcher.failed:
+           print(" Could not start job tracker on: %s" % " ".join(launcher.failed))
+    return launcher.start(hosts, finish)
+
+
+def startAgent(args, directory, pbsjobid, hostname):
+    # A launched agent starts its part of the tree, reports back to its
+    # parent and from then on writes to the job's launch log. The subtree is
+    # started in the background, so the agent samples from the start. With
+    # --reduce the agents it starts send their totals to it instead of the
+    # root.
+    writeStdout('%s %s running' % (LAUNCH_STATUS, hostname))
+    reducer = None
+    aggregator = None
+    if args.aggregator:
+       aggregator = args.aggregator[0]
+    if args.reduce and aggregator:
+       listener = None
+       if args.launch_tree:
+          listener, aggregator = listenSocket(args.stream, directory, 'reducer_' + hostname)
+       reducer = Reducer(hostname, reduceBucket(args), parent_address=args.aggregator[0], listener=listener)
+       reducer.start()
+    def finish():
+        writeStdout('%s %s started' % (LAUNCH_STATUS, hostname))
+        LaunchLog(launchLogFile(directory, pbsjobid), hostname).redirect()
+    if args.launch_tree:
+       cmd = agentCommand()
+       if aggregator:
+          cmd = cmd + ' --aggregator ' + pipes.quote(aggregator)
+       launcher = TreeLauncher(cmd, args, writeStdout)
+       launcher.start(args.launch_tree[0].split(','), finish)
+    else:
+       finish()
+    return reducer
+
+
 class DataCollector2(object):
     def __init__(self, command_args):
         print command_args.args.exe_pattern
         self.command_args = command_args
-        self.hostname = socket.gethostname()
+        self.hostname = agentHostname(self.command_args.args)
+        self.reducer = None
         self.pbsjobid = self.command_args.args.pbsjobid[0]
 #        print self.hostname
 #        print self.command_args.args.pbsjobid
@@ -329,7 +1506,6 @@ class DataCollector2(object):
            if not os.path.exists(self.directory):
               os.mkdir(self.directory)
 #           print self.directory
-           self.filename = os.path.join(self.directory,self.hostname + '.csv')
            self.hostlist = self.get_hostlist()
 #           print self.hostlist
            if self.command_args.args.node_mem_load_only:
@@ -339,7 +1515,7 @@ class DataCollector2(object):
         else:
            self.cwd = self.command_args.args.cwd[0]
            self.directory = os.path.join(self.cwd,"job_tracker_"+self.command_args.args.pbsjobid[0])
-           self.filename = os.path.join(self.directory,self.hostname + '.csv')
+           self.reducer = startAgent(self.command_args.args, self.directory, self.pbsjobid, self.hostname)
            if self.command_args.args.node_mem_load_only:
               self.start_collecting2()
            else:
@@ -347,73 +1523,89 @@ class DataCollector2(object):
 
 
     def start_scripts(self):
-        for node in self.hostlist:
-            if self.command_args.args.collection_time:
-               cmd = 'ssh ' + node + ' \''+ 'source /etc/profile.d/modules.sh && module load use.projects utils && ' + __file__ + ' --pbsjobid ' + self.command_args.args.pbsjobid[0] + ' --collection_time ' + str(self.command_args.args.collection_time[0]) + ' --exe_pattern ' + '\"'+self.command_args.args.exe_pattern[0]+'\"' + ' --collect --cwd ' + self.cwd+'\''
-            else:
-               cmd = 'ssh ' + node + ' \''+ 'source /etc/profile.d/modules.sh && module load use.projects utils && ' + __file__ + ' --pbsjobid ' + self.command_args.args.pbsjobid[0] + ' --exe_pattern ' + '\"'+self.command_args.args.exe_pattern[0]+'\"' + ' --collect --cwd ' + self.cwd+'\''
-#            print "(start_scripts) cmd=",cmd
-            f_o = open(os.path.join(self.directory,node+'job_tracker_script_'+self.command_args.args.pbsjobid[0]+'_out'),'w')
-            f_e = open(os.path.join(self.directory,node+'job_tracker_script_'+self.command_args.args.pbsjobid[0]+'_err'),'w')
-            subprocess.Popen(cmd, shell=True, stdout=f_o, stderr=f_e)
-#            subprocess.Popen(cmd, shell=True, stdout=tempfile.TemporaryFile(), stderr=tempfile.TemporaryFile())
-#            subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        cmd = __file__ + ' --pbsjobid ' + self.pbsjobid + collector_options(self.command_args.args) + ' --exe_pattern ' + pipes.quote(self.command_args.args.exe_pattern[0]) + ' --collect --cwd ' + self.cwd
+#        print "(start_scripts) cmd=",cmd
+        launchTree(cmd, self.hostlist, self.command_args.args, self.directory, self.pbsjobid)
 
 
     def start_scripts2(self):
-        for node in self.hostlist:
-            if self.command_args.args.collection_time:
-               cmd = 'ssh ' + node + ' \''+ 'source /etc/profile.d/modules.sh && module load use.projects utils && ' + __file__ + ' --pbsjobid ' + self.command_args.args.pbsjobid[0] + ' --collection_time ' + str(self.command_args.args.collection_time[0]) + ' --node_mem_load_only  --collect --cwd ' + self.cwd+'\''
-            else:
-               cmd = 'ssh ' + node + ' \''+ 'source /etc/profile.d/modules.sh && module load use.projects utils && ' + __file__ + ' --pbsjobid ' + self.command_args.args.pbsjobid[0] + ' --node_mem_load_only --collect --cwd ' + self.cwd+'\''
-#            print "(start_scripts) cmd=",cmd
-            f_o = open(os.path.join(self.directory,node+'job_tracker_script_'+self.command_args.args.pbsjobid[0]+'_out'),'w')
-            f_e = open(os.path.join(self.directory,node+'job_tracker_script_'+self.command_args.args.pbsjobid[0]+'_err'),'w')
-            subprocess.Popen(cmd, shell=True, stdout=f_o, stderr=f_e)
-#            subprocess.Popen(cmd, shell=True, stdout=tempfile.TemporaryFile(), stderr=tempfile.TemporaryFile())
-#            subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        cmd = __file__ + ' --pbsjobid ' + self.pbsjobid + collector_options(self.command_args.args) + ' --node_mem_load_only --collect --cwd ' + self.cwd
+#        print "(start_scripts) cmd=",cmd
+        launchTree(cmd, self.hostlist, self.command_args.args, self.directory, self.pbsjobid)
 
 
     def start_collecting(self):
         collect = True
-        f = open(self.filename,'wb',1)
-        job_writer = csv.writer(f)
+        layout = getTaskLayout(self.directory, self.hostname)
+        job_writer = openRawWriter(self.directory, self.hostname, self.command_args.args, self.reducer, self.pbsjobid, layout)
         cnt = 0
 #        print self.command_args.args.exe_pattern
+        sampler = ProcSampler(self.pbsjobid)
+        collect_agent = CollectAgent(re.compile(self.command_args.args.exe_pattern[0]),self.pbsjobid,sampler,self.command_args.args.rescan_ticks,None,layout,self.command_args.args.task_layout == 'full')
+        adaptive = getAdaptiveInterval(self.command_args.args)
+        scheduler = getSampleScheduler(self.command_args.args, self.hostname, adaptive)
+        overhead = getOverheadMonitor(self.directory, self.hostname, self.command_args.args, collect_agent)
         while(collect):
-           collect_agent = CollectAgent(re.compile(self.command_args.args.exe_pattern[0]),self.pbsjobid)
+           scheduler.wait()
+           overhead.start()
+           collect_agent.sample(scheduler.interval)
            if self.command_args.args.collection_time:
 #              print "collection_time arg set to",self.command_args.args.collection_time[0]
-#              print cnt * self.command_args.args.interval
-              if cnt * self.command_args.args.interval > self.command_args.args.collection_time[0]:
+              if scheduler.elapsed() > self.command_args.args.collection_time[0]:
                  collect = False
            elif (cnt > 10 and not collect_agent.collect):
               collect = False
+           if adaptive is not None:
+              interval = adaptive.update(collect_agent.watchValues())
+           else:
+              interval = self.command_args.args.interval
+           collect_agent.setInterval(max(interval, overhead.floor))
            job_writer.writerow(collect_agent.data)
-           time.sleep(self.command_args.args.interval)
+           overhead.finish(scheduler.interval)
+           scheduler.interval = max(interval, overhead.floor)
+           scheduler.advance()
            cnt = cnt + 1
-        f.close()
+        job_writer.close()
+        collect_agent.layout.close()
+        overhead.close()
+        print scheduler.summary()
+        print overhead.summary()
 
 
     def start_collecting2(self):
         collect = True
-        f = open(self.filename,'wb',1)
-        job_writer = csv.writer(f)
+        job_writer = openRawWriter(self.directory, self.hostname, self.command_args.args, self.reducer, self.pbsjobid)
         cnt = 0
 #        print self.command_args.args.exe_pattern
+        sampler = ProcSampler(self.pbsjobid)
+        collect_agent = CollectAgent2(sampler)
+        adaptive = getAdaptiveInterval(self.command_args.args)
+        scheduler = getSampleScheduler(self.command_args.args, self.hostname, adaptive)
+        overhead = getOverheadMonitor(self.directory, self.hostname, self.command_args.args, collect_agent)
         while(collect):
-           collect_agent = CollectAgent2()
+           scheduler.wait()
+           overhead.start()
+           collect_agent.sample(scheduler.interval)
            if self.command_args.args.collection_time:
 #              print "collection_time arg set to",self.command_args.args.collection_time[0]
-#              print cnt * self.command_args.args.interval
-              if cnt * self.command_args.args.interval > self.command_args.args.collection_time[0]:
+              if scheduler.elapsed() > self.command_args.args.collection_time[0]:
                  collect = False
            elif (cnt > 10 and not collect_agent.collect):
               collect = False
+           if adaptive is not None:
+              interval = adaptive.update(collect_agent.watchValues())
+           else:
+              interval = self.command_args.args.interval
+           collect_agent.setInterval(max(interval, overhead.floor))
            job_writer.writerow(collect_agent.data)
-           time.sleep(self.command_args.args.interval)
+           overhead.finish(scheduler.interval)
+           scheduler.interval = max(interval, overhead.floor)
+           scheduler.advance()
            cnt = cnt + 1
-        f.close()
+        job_writer.close()
+        overhead.close()
+        print scheduler.summary()
+        print overhead.summary()
 
 
 
@@ -451,7 +1643,8 @@ class DataCollector(object):
 
     def __init__(self, command_args):
         self.command_args = command_args
-        self.hostname = socket.gethostname()
+        self.hostname = agentHostname(self.command_args.args)
+        self.reducer = None
         self.cwd = os.getcwd()
         if not self.command_args.args.pbsjobid:
            self.pbs = Pbs()
@@ -475,10 +1668,20 @@ class DataCollector(object):
            self.directory = os.path.join(self.command_args.args.cwd[0],"job_tracker_"+self.command_args.args.pbsjobid[0])
         if not os.path.exists(self.directory):
            os.mkdir(self.directory)
-        self.filename = os.path.join(self.directory,self.hostname + '.csv')
+        if not self.command_args.args.pbsjobid:
+           writeJson(os.path.join(self.directory, JOB_INFO_FILE), {'pbsjobid': self.pbsjobid, 'jobname': self.pbs.jobname, 'executable': self.command_args.executable_name,
+                                                                   'exe_args': self.command_args.args.exe_args[0], 'hosts': self.pbs.hostlist, 'start_time': time.time()})
+        if self.command_args.args.pbsjobid:
+           self.reducer = startAgent(self.command_args.args, self.directory, self.pbsjobid, self.hostname)
         self.start_collecting()
 
 
+    def job_root_pids(self):
+        if getattr(self, 'exe_process', None) is not None:
+           return [str(self.exe_process.pid)]
+        return None
+
+
     def replace_args(self):
         new_args = self.command_args
         new_args.args.exe_args[0] = self.command_args.args.exe_args[0].replace('$PBS_JOBNAME',self.pbs.jobname)
@@ -527,7 +1730,7 @@ class DataCollector(object):
 #        print "(start_executable) self.command_args.args.exe_args=",self.command_args.args.exe_args[0]
         f_o = open(os.path.join(self.directory,'job_tracker_exe_'+self.pbs.jobid+'_out'),'w')
         f_e = open(os.path.join(self.directory,'job_tracker_exe_'+self.pbs.jobid+'_err'),'w')
-        subprocess.Popen(self.command_args.args.exe_args[0], shell=True, stdout=f_o, stderr=f_e)
+        self.exe_process = subprocess.Popen(self.command_args.args.exe_args[0], shell=True, stdout=f_o, stderr=f_e)
         #subprocess.Popen(self.command_args.args.exe_args[0].split(), shell=False, stdout=f_o, stderr=f_e)
 #        subprocess.Popen(self.command_args.args.exe_args, shell=False, stdout=tempfile.TemporaryFile(), stderr=tempfile.TemporaryFile())
 #        subprocess.Popen(self.command_args.args.exe_args, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -543,267 +1746,2151 @@ class DataCollector(object):
         else:
            full_exe_args = self.command_args.exe_args[0].replace(self.command_args.executable_name,which(self.command_args.executable_name))
 #        print "(start_scripts) full_exe_args=",full_exe_args
-        for node in self.pbs.hostlist[1:]:
-            cmd = 'ssh ' + node + ' \''+ 'source /etc/profile.d/modules.sh && module load use.projects utils && ' + __file__ + ' --pbsjobid ' + self.pbs.jobid + ' --cwd ' + self.cwd + ' ' + '\"'+full_exe_args+'\"\''
-#            print "(start_scripts) cmd=",cmd
-            f_o = open(os.path.join(self.directory,node+'job_tracker_script_'+self.pbs.jobid+'_out'),'w')
-            f_e = open(os.path.join(self.directory,node+'job_tracker_script_'+self.pbs.jobid+'_err'),'w')
-            subprocess.Popen(cmd, shell=True, stdout=f_o, stderr=f_e)
-#            subprocess.Popen(cmd, shell=True, stdout=tempfile.TemporaryFile(), stderr=tempfile.TemporaryFile())
-#            subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        cmd = __file__ + ' --pbsjobid ' + self.pbs.jobid + ' --cwd ' + self.cwd + collector_options(self.command_args.args) + ' ' + pipes.quote(full_exe_args)
+#        print "(start_scripts) cmd=",cmd
+        launchTree(cmd, self.pbs.hostlist[1:], self.command_args.args, self.directory, self.pbs.jobid)
 
 
     def start_collecting(self):
         collect = True
-        f = open(self.filename,'wb',1)
-        job_writer = csv.writer(f)
+        layout = getTaskLayout(self.directory, self.hostname)
+        job_writer = openRawWriter(self.directory, self.hostname, self.command_args.args, self.reducer, self.pbsjobid, layout)
 #        number_compute_node_cores = getComputeNodeCores(self.compute_node_type)
         cnt = 0
+        sampler = ProcSampler(self.pbsjobid)
+        collect_agent = CollectAgent(self.command_args.exe_pattern, self.pbsjobid, sampler, self.command_args.args.rescan_ticks, self.job_root_pids(), layout, self.command_args.args.task_layout == 'full')
+        adaptive = getAdaptiveInterval(self.command_args.args)
+        scheduler = getSampleScheduler(self.command_args.args, self.hostname, adaptive)
+        overhead = getOverheadMonitor(self.directory, self.hostname, self.command_args.args, collect_agent)
         while(collect):
-           collect_agent = CollectAgent(self.command_args.exe_pattern, self.pbsjobid)
+           scheduler.wait()
+           overhead.start()
+           if getattr(self, 'exe_process', None) is not None:
+              self.exe_process.poll()
+           collect_agent.sample(scheduler.interval)
            if (cnt > 10 and not collect_agent.collect):
               collect = False
 #           collect = collect_agent.collect
+           if adaptive is not None:
+              interval = adaptive.update(collect_agent.watchValues())
+           else:
+              interval = self.command_args.args.interval
+           collect_agent.setInterval(max(interval, overhead.floor))
            job_writer.writerow(collect_agent.data)
-           time.sleep(self.command_args.args.interval)
+           overhead.finish(scheduler.interval)
+           scheduler.interval = max(interval, overhead.floor)
+           scheduler.advance()
            cnt = cnt + 1
-        f.close()
+        job_writer.close()
+        collect_agent.layout.close()
+        overhead.close()
+        print scheduler.summary()
+        print overhead.summary()
 #        f = open(self.filename,'rb')
 #        job_reader = csv.reader(f)
 #        for row in job_reader:
 #            print row
 
 
+def encode_varint(out, value):
+    while value >= 0x80:
+          out.append((value & 0x7f) | 0x80)
+          value = value >> 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+          byte = data[pos]
+          pos = pos + 1
+          value = value | ((byte & 0x7f) << shift)
+          if byte < 0x80:
+             return value, pos
+          shift = shift + 7
+
+
+def rawRecord(row, node_mem_load_only):
+    if node_mem_load_only:
+       return (row[0], 0, row[1], row[2], 0, row[3], row[4])
+    return tuple(row[:RAW_LAYOUT_START])
+
+
+def writeJson(filename, data):
+    f = open(filename + '.tmp','w')
+    json.dump(data, f)
+    f.close()
+    os.rename(filename + '.tmp', filename)
+
+
+class CsvRawWriter(object):
+
+      def __init__(self, filename, node_mem_load_only=False):
+          self.filename = filename
+          self.f = open(filename,'wb',1)
+          self.writer = csv.writer(self.f)
+          self.summary = RawSummary(filename + RAW_SUMMARY_EXT, node_mem_load_only)
+
+      def writerow(self, row):
+          offset = self.f.tell()
+          self.writer.writerow(row)
+          self.summary.update(row, offset, self.f.tell())
+
+      def close(self):
+          self.f.close()
+          self.summary.write()
+
+
+class BinaryRawWriter(object):
+
+      # Fixed-width records go to host.jtr; the task layout of each sample
+      # goes to host.jtl as (tid delta, core) varints, with runs of
+      # unchanged layouts collapsed into a single repeat count.
+      def __init__(self, filename, node_mem_load_only=False):
+          self.filename = filename
+          self.node_mem_load_only = node_mem_load_only
+          flags = 0
+          if node_mem_load_only:
+             flags = RAW_FLAG_NODE_MEM_LOAD_ONLY
+          self.f = open(filename,'wb')
+          self.f.write(struct.pack(RAW_HEADER_FORMAT, RAW_MAGIC, 1, flags, RAW_RECORD_SIZE))
+          self.layout_f = None
+          if not node_mem_load_only:
+             self.layout_f = open(filename[:-len(RAW_BINARY_EXT)] + RAW_LAYOUT_EXT,'wb')
+             self.layout_f.write(RAW_LAYOUT_MAGIC)
+          self.previous_layout = None
+          self.repeats = 0
+          self.summary = RawSummary(filename + RAW_SUMMARY_EXT, node_mem_load_only)
+
+
+      def writerow(self, row):
+          record = rawRecord(row, self.node_mem_load_only)
+          if not self.node_mem_load_only:
+             self.write_layout(row[RAW_LAYOUT_START:])
+          offset = self.f.tell()
+          self.f.write(struct.pack(RAW_RECORD_FORMAT, *record))
+          self.f.flush()
+          self.summary.update(row, offset, offset + RAW_RECORD_SIZE)
+
+
+      def write_layout(self, layout):
+          pairs = sorted(zip([int(tid) for tid in layout[0::2]], [int(core) for core in layout[1::2]]))
+          if pairs == self.previous_layout:
+             self.repeats = self.repeats + 1
+             if self.repeats == RAW_LAYOUT_MAX_RUN:
+                self.flush_repeats()
+             return
+          self.flush_repeats()
+          out = bytearray()
+          encode_varint(out, len(pairs) << 1)
+          previous_tid = 0
+          for tid, core in pairs:
+              encode_varint(out, tid - previous_tid)
+              encode_varint(out, core)
+              previous_tid = tid
+          self.layout_f.write(bytes(out))
+          self.layout_f.flush()
+          self.previous_layout = pairs
+
+
+      def flush_repeats(self):
+          if self.repeats > 0:
+             out = bytearray()
+             encode_varint(out, (self.repeats << 1) | 1)
+             self.layout_f.write(bytes(out))
+             self.layout_f.flush()
+             self.repeats = 0
+
+
+      def close(self):
+          self.f.close()
+          if self.layout_f is not None:
+             self.flush_repeats()
+             self.layout_f.close()
+          self.summary.write()
+
+
+class RawSummary(object):
+
+      # Streaming per-metric max/min/mean of everything written to a node's
+      # raw file plus a sparse time -> byte offset index, kept next to it in
+      # host.csv.idx or host.jtr.idx so reports do not have to rescan the
+      # raw data for per-node peaks.
+      def __init__(self, filename, node_mem_load_only=False):
+          self.filename = filename
+          if node_mem_load_only:
+             self.columns = [('node_mem', 1), ('node_load', 2)]
+          else:
+             self.columns = [('job_mem', 1), ('node_mem', 2), ('node_load', 3), ('cgroup_mem', 4)]
+          self.metrics = {}
+          for name, col in self.columns:
+              self.metrics[name] = {'max': None, 'max_time': None, 'min': None, 'sum': 0.0}
+          self.count = 0
+          self.first_time = None
+          self.last_time = None
+          self.size = 0
+          self.index = []
+
+
+      def update(self, row, offset, size):
+          time = float(row[0])
+          if self.first_time is None:
+             self.first_time = time
+          if not self.index or time - self.index[-1][0] >= RAW_SUMMARY_INDEX_SECONDS:
+             self.index.append([time, offset])
+          for name, col in self.columns:
+              metric = self.metrics[name]
+              value = row[col]
+              if metric['max'] is None or value > metric['max']:
+                 metric['max'] = value
+                 metric['max_time'] = time
+              if metric['min'] is None or value < metric['min']:
+                 metric['min'] = value
+              metric['sum'] = metric['sum'] + value
+          self.count = self.count + 1
+          self.last_time = time
+          self.size = size
+          if self.count % RAW_SUMMARY_WRITE_SAMPLES == 0:
+             self.write()
+
+
+      def write(self):
+          metrics = {}
+          for name in self.metrics:
+              metric = self.metrics[name]
+              mean = None
+              if self.count > 0:
+                 mean = metric['sum'] / self.count
+              metrics[name] = {'max': metric['max'], 'max_time': metric['max_time'], 'min': metric['min'], 'mean': mean}
+          summary = {'version': 1, 'count': self.count, 'size': self.size, 'first_time': self.first_time, 'last_time': self.last_time, 'metrics': metrics, 'index': self.index}
+          writeJson(self.filename, summary)
+
+
+def listenSocket(stream, directory, name):
+    if stream == 'unix':
+       path = os.path.join(directory, name + '.sock')
+       if os.path.exists(path):
+          os.remove(path)
+       listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+       listener.bind(path)
+       address = 'unix:' + path
+    else:
+       listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+       listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+       listener.bind(('', 0))
+       address = socket.gethostname() + ':' + str(listener.getsockname()[1])
+    listener.listen(128)
+    return listener, address
+
+
+def reduceBucket(args):
+    if args.reduce_bucket:
+       return args.reduce_bucket
+    return args.interval
+
+
+def combinePartials(bucket, partials):
+    # partial: (bucket, node count, sums, maxima, node of each maximum)
+    count = 0
+    sums = [0.0, 0.0, 0.0, 0.0]
+    maxima = [0.0, 0.0, 0.0, 0.0]
+    names = ['', '', '', '']
+    for partial in partials:
+        count = count + partial[1]
+        for i in range(len(sums)):
+            sums[i] = sums[i] + partial[2][i]
+            if not names[i] or partial[3][i] > maxima[i]:
+               maxima[i] = partial[3][i]
+               names[i] = partial[4][i]
+    return (bucket, count, sums, maxima, names)
+
+
+class Reducer(object):
+
+      # One node of the reduction tree. This agent's own samples and the
+      # partial sums sent up by the agents below it are combined per time
+      # bucket and one partial per bucket goes to the parent (or to
+      # publish() at the root). A bucket is sent once every connected
+      # source has reached it, or REDUCE_GRACE buckets after it ended; a
+      # source without a sample in the bucket contributes its last one.
+      # Partials are sent outside the lock add_sample() takes, and the ones
+      # a parent could not be sent are kept and sent again every
+      # REDUCE_RETRY seconds.
+      def __init__(self, hostname, bucket, parent_address=None, publish=None, listener=None):
+          self.hostname = hostname
+          self.bucket = bucket
+          self.parent_address = parent_address
+          self.publish = publish
+          self.parent = None
+          self.unsent = []
+          self.retry_at = 0.0
+          self.failed = False
+          self.listener = listener
+          self.clients = {}
+          self.client_names = {}
+          self.sources = {}
+          self.closed = set()
+          self.next_bucket = None
+          self.lock = threading.Lock()
+          self.closing = False
+          self.thread = None
+
+
+      def start(self):
+          self.thread = threading.Thread(target=self.run)
+          self.thread.daemon = True
+          self.thread.start()
+
+
+      def add_sample(self, record):
+          values = [float(record[1]), float(record[2]), float(record[3]), float(record[4])]
+          self.add_partial(self.hostname, (int(record[0] // self.bucket), 1, values, values, [self.hostname]*4))
+
+
+      def add_partial(self, source, partial):
+          self.lock.acquire()
+          try:
+             partials = self.sources.setdefault(source, [])
+             if partials and partials[-1][0] == partial[0]:
+                partials[-1] = partial
+             else:
+                partials.append(partial)
+          finally:
+             self.lock.release()
+
+
+      def run(self, idle_timeout=None):
+          idle_since = monotonic()
+          while True:
+              socks = list(self.clients)
+              if self.listener is not None:
+                 socks.append(self.listener)
+              if socks:
+                 readable = select.select(socks, [], [], 0.2)[0]
+              else:
+                 time.sleep(0.2)
+                 readable = []
+              for sock in readable:
+                  if sock is self.listener:
+                     try:
+                        conn = self.listener.accept()[0]
+                     except socket.error:
+                        continue
+                     self.clients[conn] = b''
+                     continue
+                  # a source killed mid-job only loses its own connection
+                  try:
+                     data = sock.recv(65536)
+                  except socket.error as e:
+                     print("dropping a connection that failed (%s)" % e)
+                     data = b''
+                  buf = None
+                  if data:
+                     buf = self.read_frames(sock, self.clients[sock] + data)
+                  if buf is None:
+                     self.closed.add(self.client_names.get(sock))
+                     del self.clients[sock]
+                     sock.close()
+                  else:
+                     self.clients[sock] = buf
+              self.step(False)
+              if self.clients:
+                 idle_since = monotonic()
+              if idle_timeout is not None:
+                 if not self.clients and monotonic() - idle_since > idle_timeout:
+                    break
+              elif self.closing and (not self.clients or monotonic() - self.closing_since > STREAM_TIMEOUT):
+                 break
+          self.step(True)
+          if self.listener is not None:
+             self.listener.close()
+          if self.parent is not None:
+             self.parent.close()
+
+
+      def read_frames(self, sock, buf):
+          while len(buf) >= STREAM_HEADER_SIZE:
+              magic, name_len, count = struct.unpack(STREAM_HEADER_FORMAT, buf[:STREAM_HEADER_SIZE])
+              if magic != REDUCE_MAGIC:
+                 print("dropping a connection that sent a bad frame")
+                 return None
+              size = STREAM_HEADER_SIZE + name_len + count * REDUCE_RECORD_SIZE
+              if len(buf) < size:
+                 break
+              source = buf[STREAM_HEADER_SIZE:STREAM_HEADER_SIZE+name_len].decode()
+              self.client_names[sock] = source
+              for i in range(count):
+                  record = struct.unpack_from(REDUCE_RECORD_FORMAT, buf, STREAM_HEADER_SIZE + name_len + i * REDUCE_RECORD_SIZE)
+                  names = [name.rstrip(b'\0').decode() for name in record[10:14]]
+                  self.add_partial(source, (record[0], record[1], list(record[2:6]), list(record[6:10]), names))
+              buf = buf[size:]
+          return buf
+
+
+      def step(self, force):
+          ready = []
+          self.lock.acquire()
+          try:
+             if not self.sources:
+                return
+             newest = {}
+             for source in self.sources:
+                 newest[source] = self.sources[source][-1][0]
+             if self.next_bucket is None:
+                self.next_bucket = min([partials[0][0] for partials in self.sources.values()])
+             while self.next_bucket <= max(newest.values()):
+                 bucket = self.next_bucket
+                 waiting = [source for source in newest if newest[source] < bucket and source not in self.closed]
+                 expired = time.time() > (bucket + 1 + REDUCE_GRACE) * self.bucket
+                 if waiting and not expired and not force:
+                    break
+                 partials = []
+                 for source in self.sources:
+                     held = [partial for partial in self.sources[source] if partial[0] <= bucket]
+                     if held and bucket - held[-1][0] <= REDUCE_GRACE:
+                        partials.append(held[-1])
+                     # keep the partial that is held for the next bucket
+                     self.sources[source] = self.sources[source][max(len(held) - 1, 0):]
+                 if partials:
+                    ready.append(combinePartials(bucket, partials))
+                 self.next_bucket = bucket + 1
+          finally:
+             self.lock.release()
+          self.emit(ready, force)
+
+
+      def emit(self, partials, force=False):
+          if self.publish is not None:
+             for partial in partials:
+                 self.publish(partial, self.bucket)
+             return
+          if self.parent_address is None:
+             return
+          self.unsent.extend(partials)
+          del self.unsent[:-REDUCE_MAX_UNSENT]
+          if not self.unsent or (monotonic() < self.retry_at and not force):
+             return
+          records = []
+          for bucket, count, sums, maxima, names in self.unsent:
+              records.append(struct.pack(REDUCE_RECORD_FORMAT, bucket, count, *(sums + maxima + [name.encode() for name in names])))
+          frame = struct.pack(STREAM_HEADER_FORMAT, REDUCE_MAGIC, len(self.hostname), len(records)) + self.hostname.encode() + b''.join(records)
+          try:
+             if self.parent is None:
+                family, sock_address = streamAddress(self.parent_address)
+                self.parent = socket.socket(family, socket.SOCK_STREAM)
+                self.parent.settimeout(STREAM_TIMEOUT)
+                self.parent.connect(sock_address)
+             self.parent.sendall(frame)
+          except (socket.error, ValueError):
+             # the per-node detail is still in the raw files
+             if not self.failed:
+                print("job_tracker: could not send totals to %s, trying again every %ds" % (self.parent_address, REDUCE_RETRY))
+             self.failed = True
+             self.retry_at = monotonic() + REDUCE_RETRY
+             if self.parent is not None:
+                self.parent.close()
+                self.parent = None
+             return
+          if self.failed:
+             print("job_tracker: sending totals to %s again" % self.parent_address)
+          self.failed = False
+          self.unsent = []
+
+
+      def close(self):
+          self.closed.add(self.hostname)
+          self.closing_since = monotonic()
+          self.closing = True
+          if self.thread is not None:
+             self.thread.join()
+          else:
+             self.step(True)
+             if self.parent is not None:
+                self.parent.close()
+                self.parent = None
+
+
+class ReduceRawWriter(object):
+
+      # --reduce keeps the per-node detail in the node's own raw file and
+      # only hands its samples to the reduction tree
+      def __init__(self, writer, reducer, node_mem_load_only):
+          self.writer = writer
+          self.reducer = reducer
+          self.node_mem_load_only = node_mem_load_only
+
+      def writerow(self, row):
+          self.writer.writerow(row)
+          self.reducer.add_sample(rawRecord(row, self.node_mem_load_only))
+
+      def close(self):
+          self.writer.close()
+          self.reducer.close()
+
+
+class ReducedTotals(object):
+
+      # Publishes what reaches the root of the reduction tree: one row per
+      # bucket in reduced_totals.csv and the peaks in aggregate.jta.totals
+      def __init__(self, directory):
+          self.f = open(os.path.join(directory, RAW_REDUCED_FILE),'wb',1)
+          self.writer = csv.writer(self.f)
+          self.peaks = {}
+          self.totals_file = os.path.join(directory, RAW_AGGREGATE_FILE + RAW_AGGREGATE_TOTALS_EXT)
+          self.written = monotonic()
+          self.last = None
+
+
+      def publish(self, partial, bucket_width):
+          names = ['job_mem','node_mem','node_load','cgroup_mem']
+          bucket, count, sums, maxima, max_nodes = partial
+          time = bucket * bucket_width
+          self.writer.writerow([time, count] + sums)
+          totals = {}
+          node_maxima = {}
+          for i in range(len(names)):
+              totals[names[i]] = sums[i]
+              node_maxima[names[i]] = (maxima[i], max_nodes[i])
+              if names[i] not in self.peaks or sums[i] > self.peaks[names[i]][0]:
+                 self.peaks[names[i]] = (sums[i], time)
+          self.last = {'time': time, 'nodes': count, 'totals': totals, 'peaks': self.peaks, 'node_maxima': node_maxima}
+          if monotonic() - self.written >= 1.0:
+             writeJson(self.totals_file, self.last)
+             self.written = monotonic()
+
+
+      def close(self):
+          self.f.close()
+          if self.last is not None:
+             writeJson(self.totals_file, self.last)
+
+
+def streamAddress(address):
+    if address.startswith('unix:'):
+       return socket.AF_UNIX, address[len('unix:'):]
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host, int(port))
+
+
+class StreamRawWriter(object):
+
+      # Sends the fixed-width records to the job's aggregator in frames of
+      # --stream_batch samples. If the aggregator cannot be reached the
+      # buffered and all later samples go to the node's own raw file.
+      def __init__(self, address, hostname, args, fallback):
+          self.address = address
+          self.hostname = hostname
+          self.node_mem_load_only = args.node_mem_load_only
+          self.batch = max(args.stream_batch, 1)
+          self.fallback = fallback
+          self.writer = None
+          self.rows = []
+          self.sock = None
+          try:
+             family, sock_address = streamAddress(address)
+             self.sock = socket.socket(family, socket.SOCK_STREAM)
+             self.sock.settimeout(STREAM_TIMEOUT)
+             self.sock.connect(sock_address)
+          except (socket.error, ValueError):
+             self.fall_back()
+
+
+      def writerow(self, row):
+          if self.writer is not None:
+             self.writer.writerow(row)
+             return
+          self.rows.append(row)
+          if len(self.rows) >= self.batch:
+             self.send()
+
+
+      def send(self):
+          records = [struct.pack(RAW_RECORD_FORMAT, *rawRecord(row, self.node_mem_load_only)) for row in self.rows]
+          frame = struct.pack(STREAM_HEADER_FORMAT, STREAM_MAGIC, len(self.hostname), len(records)) + self.hostname.encode() + b''.join(records)
+          try:
+             self.sock.sendall(frame)
+             self.rows = []
+          except socket.error:
+             self.fall_back()
+
+
+      def fall_back(self):
+          print("job_tracker: could not send samples to the aggregator at %s, writing them to the raw file instead" % self.address)
+          if self.sock is not None:
+             self.sock.close()
+             self.sock = None
+          self.writer = self.fallback()
+          for row in self.rows:
+              self.writer.writerow(row)
+          self.rows = []
+
+
+      def close(self):
+          if self.writer is None and self.rows:
+             self.send()
+          if self.writer is not None:
+             self.writer.close()
+          if self.sock is not None:
+             self.sock.close()
+
+
+def startAggregator(args, directory, cwd, pbsjobid):
+    # The aggregator outlives this process, it reports its address and
+    # then logs to the job's launch log
+    cmd = [__file__, '--aggregate', '--pbsjobid', pbsjobid, '--cwd', cwd, '--stream', args.stream, '--launch_timeout', str(args.launch_timeout)]
+    if args.reduce:
+       cmd = cmd + ['--reduce', '--reduce_bucket', str(reduceBucket(args))]
+    proc = subprocess.Popen(cmd, stdin=open(os.devnull), stdout=subprocess.PIPE)
+    fields = proc.stdout.readline().split()
+    proc.stdout.close()
+    if fields[:1] != [AGGREGATOR_STATUS]:
+       print("job_tracker: could not start the aggregator, every node writes its own raw file")
+       return None
+    return fields[1]
+
+
+class Aggregator(object):
+
+      # Receives sample frames from the node agents, appends them to one
+      # consolidated file and keeps the job totals of the latest sample of
+      # every node in memory. Frames of --stream_batch samples arrive out of
+      # step, so the totals take the samples in time order, up to the newest
+      # sample every connected node has sent (or STREAM_TIMEOUT seconds
+      # behind the newest one). With --reduce it is the root of the
+      # reduction tree instead. Exits once no agent has been connected for
+      # --launch_timeout seconds.
+      def __init__(self, command_args):
+          args = command_args.args
+          self.pbsjobid = args.pbsjobid[0]
+          self.directory = os.path.join(args.cwd[0],"job_tracker_"+self.pbsjobid)
+          self.idle_timeout = args.launch_timeout
+          self.listener, address = listenSocket(args.stream, self.directory, 'aggregator_' + self.pbsjobid)
+          writeStdout('%s %s' % (AGGREGATOR_STATUS, address))
+          LaunchLog(launchLogFile(self.directory, self.pbsjobid), socket.gethostname() + '(aggregator)').redirect()
+          if args.reduce:
+             totals = ReducedTotals(self.directory)
+             Reducer(socket.gethostname(), reduceBucket(args), publish=totals.publish, listener=self.listener).run(self.idle_timeout)
+             totals.close()
+             print("reduced job totals written to %s" % os.path.join(self.directory, RAW_REDUCED_FILE))
+             return
+          self.filename = os.path.join(self.directory, RAW_AGGREGATE_FILE)
+          self.f = open(self.filename,'wb')
+          self.f.write(struct.pack(RAW_HEADER_FORMAT, RAW_AGGREGATE_MAGIC, 1, 0, RAW_AGGREGATE_SIZE))
+          self.nodes = []
+          self.node_index = {}
+          self.last = {}
+          self.totals = [0, 0, 0.0, 0]
+          self.peaks = [(0, 0.0), (0, 0.0), (0.0, 0.0), (0, 0.0)]
+          self.last_time = None
+          self.pending = []
+          self.received = 0
+          self.newest = {}
+          self.finished = set()
+          self.serve()
+          self.f.close()
+          self.apply_records(True)
+          self.write_totals()
+          print("aggregated %d nodes into %s" % (len(self.nodes), self.filename))
+
+
+      def serve(self):
+          clients = {}
+          hosts = {}
+          idle_since = monotonic()
+          totals_time = monotonic()
+          while True:
+              readable = select.select([self.listener] + list(clients), [], [], 1.0)[0]
+              for sock in readable:
+                  if sock is self.listener:
+                     try:
+                        conn = self.listener.accept()[0]
+                     except socket.error:
+                        continue
+                     clients[conn] = b''
+                     continue
+                  # an agent killed mid-job only loses its own connection
+                  try:
+                     data = sock.recv(65536)
+                  except socket.error as e:
+                     print("dropping a connection that failed (%s)" % e)
+                     data = b''
+                  buf = None
+                  if data:
+                     buf = self.read_frames(clients[sock] + data, sock, hosts)
+                  if buf is None:
+                     if sock in hosts:
+                        self.finished.add(hosts.pop(sock))
+                     del clients[sock]
+                     sock.close()
+                  else:
+                     clients[sock] = buf
+              self.apply_records(False)
+              if clients:
+                 idle_since = monotonic()
+              elif monotonic() - idle_since > self.idle_timeout:
+                 break
+              if monotonic() - totals_time >= 1.0:
+                 self.write_totals()
+                 totals_time = monotonic()
+          self.listener.close()
+
+
+      def read_frames(self, buf, sock, hosts):
+          while len(buf) >= STREAM_HEADER_SIZE:
+              magic, host_len, count = struct.unpack(STREAM_HEADER_FORMAT, buf[:STREAM_HEADER_SIZE])
+              if magic != STREAM_MAGIC:
+                 print("dropping a connection that sent a bad frame")
+                 return None
+              size = STREAM_HEADER_SIZE + host_len + count * RAW_RECORD_SIZE
+              if len(buf) < size:
+                 break
+              host = buf[STREAM_HEADER_SIZE:STREAM_HEADER_SIZE+host_len].decode()
+              hosts[sock] = host
+              self.finished.discard(host)
+              self.add_records(host, buf[STREAM_HEADER_SIZE+host_len:size], count)
+              buf = buf[size:]
+          return buf
+
+
+      def add_records(self, host, data, count):
+          if host not in self.node_index:
+             self.node_index[host] = len(self.nodes)
+             self.nodes.append(host)
+             writeJson(self.filename + RAW_AGGREGATE_NODES_EXT, self.nodes)
+          indx = self.node_index[host]
+          out = []
+          for i in range(count):
+              record = struct.unpack_from(RAW_RECORD_FORMAT, data, i * RAW_RECORD_SIZE)
+              out.append(struct.pack(RAW_AGGREGATE_FORMAT, indx, *record))
+              heapq.heappush(self.pending, (record[0], self.received, host, record))
+              self.received = self.received + 1
+              self.newest[host] = max(self.newest.get(host, record[0]), record[0])
+          self.f.write(b''.join(out))
+          self.f.flush()
+
+
+      def apply_records(self, force):
+          connected = [self.newest[host] for host in self.newest if host not in self.finished]
+          if force or not connected:
+             limit = float('inf')
+          else:
+             limit = max(min(connected), max(self.newest.values()) - STREAM_TIMEOUT)
+          while self.pending and self.pending[0][0] <= limit:
+                sample_time, received, host, record = heapq.heappop(self.pending)
+                self.update_totals(host, record)
+
+
+      def update_totals(self, host, record):
+          values = (record[1], record[2], record[3], record[4])
+          previous = self.last.get(host, (0, 0, 0.0, 0))
+          for i in range(len(values)):
+              self.totals[i] = self.totals[i] + values[i] - previous[i]
+              if self.totals[i] > self.peaks[i][0]:
+                 self.peaks[i] = (self.totals[i], record[0])
+          self.last[host] = values
+          self.last_time = record[0]
+
+
+      def write_totals(self):
+          names = ['job_mem','node_mem','node_load','cgroup_mem']
+          totals = {}
+          peaks = {}
+          for i in range(len(names)):
+              totals[names[i]] = self.totals[i]
+              peaks[names[i]] = self.peaks[i]
+          writeJson(self.filename + RAW_AGGREGATE_TOTALS_EXT, {'time': self.last_time, 'nodes': len(self.nodes), 'totals': totals, 'peaks': peaks})
+
+
+def metricsLabel(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metricsValue(value):
+    if isinstance(value, float):
+       return repr(value)
+    return str(int(value))
+
+
+class MetricsExporter(object):
+
+      # Serves the last sample written by the collector as OpenMetrics text
+      # on /metrics. The text is rendered once per sample and a scrape only
+      # sends it, so scrapes never cause extra /proc reads. Given the node's
+      # task layout, running_threads comes from its per-core counts, which
+      # are there with --task_layout summary as well.
+      def __init__(self, port, pbsjobid, hostname, node_mem_load_only, layout=None):
+          self.labels = 'pbs_jobid="%s",host="%s"' % (metricsLabel(pbsjobid), metricsLabel(hostname))
+          self.node_mem_load_only = node_mem_load_only
+          self.layout = layout
+          self.body = b'# EOF\n'
+          exporter = self
+
+          class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                       self.send_error(404)
+                       return
+                    body = exporter.body
+                    self.send_response(200)
+                    self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+          self.server = MetricsServer(('', port), MetricsHandler)
+          self.address = socket.gethostname() + ':' + str(self.server.server_address[1])
+          self.thread = threading.Thread(target=self.server.serve_forever)
+          self.thread.daemon = True
+          self.thread.start()
+
+
+      def update(self, row):
+          if self.node_mem_load_only:
+             values = [('node_memory_used_bytes', row[1] * 1024), ('node_load1', row[2])]
+             layout = []
+             interval = row[4]
+          else:
+             values = [('job_rss_bytes', row[1] * 1024), ('node_memory_used_bytes', row[2] * 1024), ('node_load1', row[3]), ('cgroup_memory_usage_bytes', row[4] * 1024)]
+             layout = row[RAW_LAYOUT_START:]
+             interval = row[6]
+          values = [('sample_time_seconds', row[0]), ('sample_interval_seconds', interval)] + values
+          lines = []
+          for name, value in values:
+              help, unit = METRICS_HELP[name]
+              lines.append('# TYPE %s%s gauge' % (METRICS_PREFIX, name))
+              if unit:
+                 lines.append('# UNIT %s%s %s' % (METRICS_PREFIX, name, unit))
+              lines.append('# HELP %s%s %s' % (METRICS_PREFIX, name, help))
+              lines.append('%s%s{%s} %s' % (METRICS_PREFIX, name, self.labels, metricsValue(value)))
+          if not self.node_mem_load_only:
+             if self.layout is not None and self.layout.summary is not None and self.layout.summary[0] == row[0]:
+                cores = self.layout.running
+             else:
+                cores = {}
+                for core in layout[1::2]:
+                    cores[int(core)] = cores.get(int(core), 0) + 1
+             help, unit = METRICS_HELP['running_threads']
+             lines.append('# TYPE %srunning_threads gauge' % METRICS_PREFIX)
+             lines.append('# HELP %srunning_threads %s' % (METRICS_PREFIX, help))
+             for core in sorted(cores):
+                 lines.append('%srunning_threads{%s,core="%d"} %d' % (METRICS_PREFIX, self.labels, core, cores[core]))
+          lines.append('# EOF')
+          # a scrape picks up either the old or the new text, never half of it
+          self.body = ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+      def close(self):
+          self.server.shutdown()
+          self.server.server_close()
+
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+      daemon_threads = True
+      allow_reuse_address = True
+
+
+def startMetricsExporter(args, pbsjobid, hostname, layout=None):
+    try:
+       exporter = MetricsExporter(args.metrics_port, pbsjobid, hostname, args.node_mem_load_only, layout)
+    except socket.error as e:
+       print("job_tracker: could not serve metrics on port %d (%s)" % (args.metrics_port, e))
+       return None
+    print("job_tracker: serving metrics on http://%s/metrics" % exporter.address)
+    return exporter
+
+
+class MetricsRawWriter(object):
+
+      # Hands every sample written to the raw data to the metrics endpoint
+      def __init__(self, writer, exporter):
+          self.writer = writer
+          self.exporter = exporter
+
+      def writerow(self, row):
+          self.writer.writerow(row)
+          self.exporter.update(row)
+
+      def close(self):
+          self.writer.close()
+          self.exporter.close()
+
+
+def openFileRawWriter(directory, hostname, args):
+    if args.format == 'binary':
+       return BinaryRawWriter(os.path.join(directory, hostname + RAW_BINARY_EXT), args.node_mem_load_only)
+    return CsvRawWriter(os.path.join(directory, hostname + '.csv'), args.node_mem_load_only)
+
+
+def openRawWriter(directory, hostname, args, reducer=None, pbsjobid=None, layout=None):
+    if args.reduce and args.aggregator:
+       if reducer is None:
+          reducer = Reducer(hostname, reduceBucket(args), parent_address=args.aggregator[0])
+          reducer.start()
+       writer = ReduceRawWriter(openFileRawWriter(directory, hostname, args), reducer, args.node_mem_load_only)
+    elif args.aggregator:
+       writer = StreamRawWriter(args.aggregator[0], hostname, args, lambda: openFileRawWriter(directory, hostname, args))
+    else:
+       writer = openFileRawWriter(directory, hostname, args)
+    if args.metrics_port is not None:
+       exporter = startMetricsExporter(args, pbsjobid, hostname, layout)
+       if exporter is not None:
+          writer = MetricsRawWriter(writer, exporter)
+    return writer
+
+
+def rawDataFiles(dir_path):
+    # One file per node, the binary format wins if a node has both
+    node_files = {}
+    for file in glob.glob(os.path.join(dir_path, '*.csv')) + glob.glob(os.path.join(dir_path, '*' + RAW_BINARY_EXT)):
+        node = os.path.split(file)[1][:-4]
+        if os.path.split(file)[1] == RAW_REDUCED_FILE:
+           continue
+        if node not in node_files or file.endswith(RAW_BINARY_EXT):
+           node_files[node] = file
+    return sorted(node_files.values())
+
+
+def rawNodeFile(dir_path, node):
+    for file in rawDataFiles(dir_path):
+        if os.path.split(file)[1][:-4] == node:
+           return file
+    return None
+
+
+def readRawHeader(f, filename):
+    header = f.read(RAW_HEADER_SIZE)
+    if len(header) < RAW_HEADER_SIZE:
+       sys.exit('Error: truncated raw data file (%s)' % filename)
+    magic, version, flags, record_size = struct.unpack(RAW_HEADER_FORMAT, header)
+    if magic != RAW_MAGIC or record_size != RAW_RECORD_SIZE:
+       sys.exit('Error: %s is not a job tracker binary raw data file' % filename)
+    return flags
+
+
+def readRawLayouts(filename):
+    # The file is decoded RAW_LAYOUT_READ_SIZE bytes at a time. An entry cut
+    # by the end of the buffer is decoded again once the next block is in,
+    # one cut by the end of the file is still being written and is dropped.
+    if not os.path.exists(filename):
+       return
+    f = open(filename,'rb')
+    try:
+       if f.read(len(RAW_LAYOUT_MAGIC)) != RAW_LAYOUT_MAGIC:
+          sys.exit('Error: %s is not a job tracker task layout file' % filename)
+       data = bytearray()
+       pos = 0
+       layout = []
+       while True:
+             try:
+                tag, end = decode_varint(data, pos)
+                if not tag & 1:
+                   entry = []
+                   tid = 0
+                   for pair in range(tag >> 1):
+                       tid_delta, end = decode_varint(data, end)
+                       core, end = decode_varint(data, end)
+                       tid = tid + tid_delta
+                       entry.append(tid)
+                       entry.append(core)
+             except IndexError:
+                block = f.read(RAW_LAYOUT_READ_SIZE)
+                if not block:
+                   break
+                data = data[pos:] + bytearray(block)
+                pos = 0
+                continue
+             pos = end
+             if tag & 1:
+                for repeat in range(tag >> 1):
+                    yield layout
+                continue
+             layout = entry
+             yield layout
+    finally:
+       f.close()
+
+
+def readBinaryRawRows(filename):
+    f = open(filename,'rb')
+    try:
+       flags = readRawHeader(f, filename)
+       node_mem_load_only = flags & RAW_FLAG_NODE_MEM_LOAD_ONLY
+       layouts = readRawLayouts(filename[:-len(RAW_BINARY_EXT)] + RAW_LAYOUT_EXT)
+       while True:
+             data = f.read(RAW_RECORD_SIZE)
+             if len(data) < RAW_RECORD_SIZE:
+                break
+             record = struct.unpack(RAW_RECORD_FORMAT, data)
+             if node_mem_load_only:
+                yield [record[0], record[2], record[3], record[5], record[6]]
+             else:
+                yield list(record) + next(layouts, [])
+    finally:
+       f.close()
+
+
+def readCsvRawRows(filename):
+    f = open(filename,'rb')
+    try:
+       for row in csv.reader(f):
+           yield row
+    finally:
+       f.close()
+
+
+def readRawRows(filename):
+    if filename.endswith(RAW_BINARY_EXT):
+       return readBinaryRawRows(filename)
+    return readCsvRawRows(filename)
+
+
+def rawDataDir(args):
+    if not args.args.rawdata:
+       sys.exit("Error: Need to specify rawdata directory (--rawdata dir)")
+    dir_path = os.path.join(os.getcwd(),args.args.rawdata[0])
+    if not os.path.exists(dir_path):
+       sys.exit('Error: could not find the directory (%s)'% dir_path)
+    return dir_path
+
+
+def readRawSummary(filename):
+    # The sidecar of a node's raw file, None if missing or behind the data
+    try:
+       f = open(filename + RAW_SUMMARY_EXT)
+       try:
+          summary = json.load(f)
+       finally:
+          f.close()
+    except (IOError, ValueError):
+       return None
+    if summary['count'] == 0 or summary['size'] != os.path.getsize(filename):
+       return None
+    return summary
+
+
+def summaryMaxMemLoad(summary, keys):
+    data_dict = {}
+    for key in keys:
+        metric = summary['metrics'][key[4:]]
+        data_dict[key] = (metric['max_time'] - summary['first_time'], metric['max'])
+    return data_dict
+
+
+def summaryReportDict(dir_path, node_mem_load_only):
+    # Per-node peaks from the sidecars, parsing only nodes without a usable one
+    report_dict = {}
+    for file in rawDataFiles(dir_path):
+        node = os.path.split(file)[1][:-4]
+        summary = readRawSummary(file)
+        if summary is None:
+           max_dict = loadRawNode((node, file, node_mem_load_only))[2]
+           if max_dict is not None:
+              report_dict[node] = max_dict
+        else:
+           report_dict[node] = summaryMaxMemLoad(summary, maxMemLoadKeys(node_mem_load_only))
+    aggregate_series = loadAggregateSeries(dir_path)
+    for node in aggregate_series:
+        series = aggregate_series[node]
+        if node in report_dict:
+           series = mergeSeries(loadRawNode((node, rawNodeFile(dir_path, node), node_mem_load_only))[1], series)
+        report_dict[node] = maxMemLoad(series, maxMemLoadKeys(node_mem_load_only))
+    if not report_dict:
+       sys.exit('Error: no raw job tracking data found in (%s)'% dir_path)
+    return report_dict
+
+
+class ConvertRawData(object):
+
+      def __init__(self, args):
+          self.args = args
+          self.dir_path = rawDataDir(args)
+          for file in glob.glob(os.path.join(self.dir_path, '*.csv')):
+              self.convert(file)
+
+
+      def convert(self, file):
+          node_mem_load_only = self.args.args.node_mem_load_only
+          outfile = file[:-4] + RAW_BINARY_EXT
+          writer = BinaryRawWriter(outfile, node_mem_load_only)
+          # Legacy rows did not record an interval, store the gap to the
+          # next row (the one before it for the last row, 0 for a single row)
+          rows = readCsvRawRows(file)
+          row = next(rows, None)
+          interval = 0.0
+          while row is not None:
+              following = next(rows, None)
+              if following is not None:
+                 interval = float(following[0]) - float(row[0])
+              if node_mem_load_only:
+                 if len(row) < 5:
+                    row = row[:3] + [row[0], interval]
+                 writer.writerow([float(row[0]), int(float(row[1])), float(row[2]), float(row[3]), float(row[4])])
+              else:
+                 if rawLayoutStart(row) == LEGACY_RAW_LAYOUT_START:
+                    row = row[:LEGACY_RAW_LAYOUT_START] + [row[0], interval] + row[LEGACY_RAW_LAYOUT_START:]
+                 writer.writerow([float(row[0]), int(float(row[1])), int(float(row[2])), float(row[3]), int(float(row[4])), float(row[5]), float(row[6])] + row[RAW_LAYOUT_START:])
+              row = following
+          writer.close()
+          print("Converted %s to %s" % (file, outfile))
+
+
+def import_numpy():
+    try:
+       import numpy
+    except ImportError:
+       sys.exit("Error: importing numpy, check if numpy is available in this version of python")
+    return numpy
+
+
+def rawRecordDtype(np):
+    return np.dtype([('time','<f8'), ('job_mem','<i8'), ('node_mem','<i8'), ('node_load','<f4'), ('cgroup_mem','<i8'), ('mono_time','<f8'), ('interval','<f4')])
+
+
+def loadRawSeries(filename, node_mem_load_only):
+    # Binary files are memory-mapped, so the columns are views of the file
+    np = import_numpy()
+    dtype = rawRecordDtype(np)
+    if filename.endswith(RAW_BINARY_EXT):
+       f = open(filename,'rb')
+       readRawHeader(f, filename)
+       f.close()
+       count = (os.path.getsize(filename) - RAW_HEADER_SIZE) // RAW_RECORD_SIZE
+       if count <= 0:
+          return np.zeros(0, dtype=dtype)
+       return np.memmap(filename, dtype=dtype, mode='r', offset=RAW_HEADER_SIZE, shape=(count,))
+    return loadCsvRawSeries(filename, node_mem_load_only)
+
+
+def loadCsvRawSeries(filename, node_mem_load_only):
+    f = open(filename,'rb')
+    try:
+       return parseCsvRawLines(f, node_mem_load_only)[0]
+    finally:
+       f.close()
+
+
+def parseCsvRawLines(lines, node_mem_load_only, fixed=None, layouts=None):
+    # fixed is the number of leading columns, taken from the first line
+    # unless the caller already knows it from earlier lines of the file. A
+    # last line without a newline is still being written and is skipped.
+    # The tid,core pairs of every row are added to layouts if given.
+    np = import_numpy()
+    dtype = rawRecordDtype(np)
+    fields = []
+    for line in lines:
+        if not line.endswith(b'\n'):
+           break
+        if fixed is None:
+           row = line.strip().split(',')
+           if node_mem_load_only:
+              fixed = min(len(row), 5)
+           else:
+              fixed = rawLayoutStart(row)
+        row = line.split(',', fixed)[:fixed]
+        if len(row) == fixed and row[-1].strip():
+           fields.extend(row)
+           if layouts is not None:
+              layouts.append(line.strip().split(',')[fixed:])
+    if not fields:
+       return np.zeros(0, dtype=dtype), fixed
+    data = np.array(fields, dtype=np.float64).reshape(-1, fixed)
+    series = np.zeros(len(data), dtype=dtype)
+    series['time'] = data[:,0]
+    series['mono_time'] = data[:,0]
+    if node_mem_load_only:
+       series['node_mem'] = data[:,1]
+       series['node_load'] = data[:,2]
+       if fixed == 5:
+          series['mono_time'] = data[:,3]
+          series['interval'] = data[:,4]
+    else:
+       series['job_mem'] = data[:,1]
+       series['node_mem'] = data[:,2]
+       series['node_load'] = data[:,3]
+       series['cgroup_mem'] = data[:,4]
+       if fixed == RAW_LAYOUT_START:
+          series['mono_time'] = data[:,5]
+          series['interval'] = data[:,6]
+    return series, fixed
+
+
+def maxMemLoad(series, keys):
+    # argmax keeps the first sample that reaches the peak
+    data_dict = {}
+    times = series['time']
+    for key in keys:
+        values = series[key[4:]]
+        indx = int(values.argmax())
+        if key == 'max_node_load':
+           value = float(str(values[indx]))
+        else:
+           value = int(values[indx])
+        data_dict[key] = (float(times[indx] - times[0]), value)
+    return data_dict
+
+
+def maxMemLoadKeys(node_mem_load_only):
+    if node_mem_load_only:
+       return ['max_node_mem','max_node_load']
+    return ['max_job_mem','max_node_mem','max_node_load','max_cgroup_mem']
+
+
+def loadRawNode(node_task):
+    # Runs in an ingestion worker: parse one node's file once and reduce it
+    node, filename, node_mem_load_only = node_task
+    series = loadRawSeries(filename, node_mem_load_only)
+    if len(series) == 0:
+       return (node, series, None)
+    return (node, series, maxMemLoad(series, maxMemLoadKeys(node_mem_load_only)))
+
+
+def loadAggregateSeries(dir_path):
+    # Per-node series out of the consolidated file of a --stream job
+    np = import_numpy()
+    filename = os.path.join(dir_path, RAW_AGGREGATE_FILE)
+    series = {}
+    if not os.path.exists(filename):
+       return series
+    f = open(filename + RAW_AGGREGATE_NODES_EXT)
+    nodes = json.load(f)
+    f.close()
+    dtype = rawRecordDtype(np)
+    aggregate_dtype = np.dtype([('node','<u2')] + [(name, dtype[name]) for name in dtype.names])
+    count = (os.path.getsize(filename) - RAW_HEADER_SIZE) // RAW_AGGREGATE_SIZE
+    if count <= 0:
+       return series
+    records = np.memmap(filename, dtype=aggregate_dtype, mode='r', offset=RAW_HEADER_SIZE, shape=(count,))
+    for indx in np.unique(records['node']):
+        node_records = records[records['node'] == indx]
+        node_series = np.zeros(len(node_records), dtype=dtype)
+        for name in dtype.names:
+            node_series[name] = node_records[name]
+        series[str(nodes[indx])] = node_series
+    return series
+
+
+def mergeSeries(series, other):
+    # A node that lost its aggregator has samples in both places
+    np = import_numpy()
+    merged = np.concatenate((np.asarray(series), np.asarray(other)))
+    return merged[np.argsort(merged['time'], kind='mergesort')]
+
+
+def plotSources(dir_path):
+    # node -> [raw file or None, (consolidated records, the node's rows) or None]
+    np = import_numpy()
+    sources = {}
+    for file in rawDataFiles(dir_path):
+        sources[os.path.split(file)[1][:-4]] = [file, None]
+    filename = os.path.join(dir_path, RAW_AGGREGATE_FILE)
+    if not os.path.exists(filename):
+       return sources
+    f = open(filename + RAW_AGGREGATE_NODES_EXT)
+    nodes = json.load(f)
+    f.close()
+    dtype = rawRecordDtype(np)
+    aggregate_dtype = np.dtype([('node','<u2')] + [(name, dtype[name]) for name in dtype.names])
+    count = (os.path.getsize(filename) - RAW_HEADER_SIZE) // RAW_AGGREGATE_SIZE
+    if count <= 0:
+       return sources
+    records = np.memmap(filename, dtype=aggregate_dtype, mode='r', offset=RAW_HEADER_SIZE, shape=(count,))
+    # a stable sort keeps every node's rows in the order they arrived
+    order = np.argsort(records['node'], kind='mergesort')
+    node_indx = records['node'][order]
+    for indx in np.unique(node_indx):
+        rows = order[np.searchsorted(node_indx, indx, 'left'):np.searchsorted(node_indx, indx, 'right')]
+        sources.setdefault(str(nodes[indx]), [None, None])[1] = (records, rows)
+    return sources
+
+
+def csvRawChunks(filename, node_mem_load_only, layouts):
+    # (series, tid,core lists or None) of PLOT_STREAM_CHUNK lines at a time
+    f = open(filename,'rb')
+    fixed = None
+    try:
+       while True:
+             lines = list(itertools.islice(f, PLOT_STREAM_CHUNK))
+             if not lines:
+                break
+             layout_l = None
+             if layouts:
+                layout_l = []
+             series, fixed = parseCsvRawLines(lines, node_mem_load_only, fixed, layout_l)
+             yield series, layout_l
+    finally:
+       f.close()
+
+
+def binaryRawChunks(filename, node_mem_load_only, layouts):
+    series = loadRawSeries(filename, node_mem_load_only)
+    layout_rows = None
+    if layouts:
+       layout_rows = readRawLayouts(filename[:-len(RAW_BINARY_EXT)] + RAW_LAYOUT_EXT)
+    for first in range(0, len(series), PLOT_STREAM_CHUNK):
+        chunk = series[first:first + PLOT_STREAM_CHUNK]
+        layout_l = None
+        if layouts:
+           layout_l = [next(layout_rows, []) for indx in range(len(chunk))]
+        yield chunk, layout_l
+
+
+def aggregateRawChunks(records, rows):
+    np = import_numpy()
+    dtype = rawRecordDtype(np)
+    for first in range(0, len(rows), PLOT_STREAM_CHUNK):
+        node_records = records[rows[first:first + PLOT_STREAM_CHUNK]]
+        chunk = np.zeros(len(node_records), dtype=dtype)
+        for name in dtype.names:
+            chunk[name] = node_records[name]
+        yield chunk, None
+
+
+def mergeRawChunks(streams):
+    # The chunks of a node that has samples in its own file and in the
+    # consolidated file, in time order like mergeSeries: rows are passed on
+    # once every stream still running has read past them
+    np = import_numpy()
+    pending = [None] * len(streams)
+    running = set(range(len(streams)))
+    while True:
+          for indx in sorted(running):
+              while indx in running and (pending[indx] is None or len(pending[indx][0]) == 0):
+                    try:
+                       chunk, layouts = next(streams[indx])
+                    except StopIteration:
+                       running.discard(indx)
+                       continue
+                    if layouts is None:
+                       layouts = [[]] * len(chunk)
+                    pending[indx] = (chunk, layouts)
+          bound = None
+          if running:
+             bound = min([pending[indx][0]['time'][-1] for indx in running])
+          records = []
+          layouts = []
+          for indx in range(len(streams)):
+              if pending[indx] is None or len(pending[indx][0]) == 0:
+                 continue
+              chunk, chunk_layouts = pending[indx]
+              count = len(chunk)
+              if bound is not None:
+                 count = int(np.searchsorted(chunk['time'], bound, 'right'))
+              records.append(chunk[:count])
+              layouts.extend(chunk_layouts[:count])
+              pending[indx] = (chunk[count:], chunk_layouts[count:])
+          if not records:
+             return
+          merged = np.concatenate(records)
+          order = np.argsort(merged['time'], kind='mergesort')
+          yield merged[order], [layouts[indx] for indx in order]
+
+
+def chainGrid(series, primary):
+    # The default time grid: the sample times of the primary node and,
+    # after its last sample, those of the node sampling next, and so on
+    # until every node has stopped. series maps node -> sample times.
+    np = import_numpy()
+    times = series[primary]
+    parts = []
+    while True:
+          parts.append(times)
+          end = times[-1]
+          following = None
+          for node in sorted(series):
+              indx = int(np.searchsorted(series[node], end, 'right'))
+              if indx < len(series[node]) and (following is None or series[node][indx] < times[0]):
+                 following = node
+                 times = series[node][indx:]
+          if following is None:
+             return np.concatenate(parts)
+
+
 class RawData(object):
 
       def __init__(self, args):
           self.cwd = os.getcwd()
-          if args.args.rawdata:
-             self.dir_path = os.path.join(self.cwd,args.args.rawdata[0])
-          else:
-             sys.exit("Error: Need to specify rawdata directory (--rawdata dir)")
+          self.dir_path = rawDataDir(args)
 #          print self.dir_path
-          self.primary_file = self.find_primary_file()
+          self.node_mem_load_only = args.args.node_mem_load_only
+          self.grid_step = args.args.grid_step
+          self.align = args.args.align
+          self.workers = args.args.workers
+          self.node_files = {}
+          for file in rawDataFiles(self.dir_path):
+              self.node_files[os.path.split(file)[1][:-4]] = file
+          self.series = self.load_series()
+          self.primary_node = self.find_primary_node()
+          self.primary_file = self.node_files.get(self.primary_node, os.path.join(self.dir_path, RAW_AGGREGATE_FILE))
 #          print "(RawData,__init__) self.primary_file=",self.primary_file
-          self.rawdata_dict = self.rawDataDict()
-          if args.args.node_mem_load_only:
-             self.rawdata_dict = self.addPadding2()
-             self.max_mem_load_dict = self.get_max_mem_load_dict2()
+          self.grid = self.build_grid()
+          self.length = len(self.grid)
+          self.alignment = {}
+
+
+      def load_series(self):
+          tasks = [(node, self.node_files[node], self.node_mem_load_only) for node in sorted(self.node_files)]
+          # binary files are only memory-mapped, there is nothing to hand off
+          results = [loadRawNode(task) for task in tasks if task[1].endswith(RAW_BINARY_EXT)]
+          parse_tasks = [task for task in tasks if not task[1].endswith(RAW_BINARY_EXT)]
+          workers = min(self.workers, len(parse_tasks))
+          if workers > 1:
+             pool = multiprocessing.Pool(workers)
+             results.extend(pool.map(loadRawNode, parse_tasks, 1))
+             pool.close()
+             pool.join()
           else:
-             self.rawdata_dict = self.addPadding()
-             self.max_mem_load_dict = self.get_max_mem_load_dict()
-#          sys.exit(0)
-#          print self.rawdata_dict
-
-
-      def rawDataDict(self):
-          rawdata_dict = {}
-          for file in glob.glob(self.dir_path + '/*.csv'):
-              f = open(file,'rb')
-              reader = csv.reader(f)
-              node = os.path.split(file)[1][:-4]
-              rawdata_dict[node] = []
-              for row in reader:
-                  rawdata_dict[node].append(row)
-          return rawdata_dict
-
-
-      def addPadding(self):
-          rawdata_dict = {}
-          for file in self.rawdata_dict:
-              pad_num = self.find_pad_num(file)
-              self.rawdata_dict[file] = [['0.0','0','0','0.0','0']]*pad_num + self.rawdata_dict[file]
-#debug              if pad_num > 0:
-#                 print pad_num
-#                 print self.rawdata_dict[file][0:5]
-          maxlen = 0
-          for file in self.rawdata_dict:
-#              print file, len(self.rawdata_dict[file])
-              if len(self.rawdata_dict[file]) > maxlen:
-                 maxlen = len(self.rawdata_dict[file])
-#          print maxlen
-          for file in self.rawdata_dict:
-#              print file, len(self.rawdata_dict[file])
-              self.rawdata_dict[file] = self.rawdata_dict[file] + [['0.0','0','0','0.0','0']]*(maxlen-len(self.rawdata_dict[file]))
-          return self.rawdata_dict
-
-
-      def addPadding2(self):
-          rawdata_dict = {}
-          for file in self.rawdata_dict:
-              pad_num = self.find_pad_num(file)
-              self.rawdata_dict[file] = [['0.0','0','0.0']]*pad_num + self.rawdata_dict[file]
-#debug              if pad_num > 0:
-#                 print pad_num
-#                 print self.rawdata_dict[file][0:5]
-          maxlen = 0
-          for file in self.rawdata_dict:
-#              print file, len(self.rawdata_dict[file])
-              if len(self.rawdata_dict[file]) > maxlen:
-                 maxlen = len(self.rawdata_dict[file])
-#          print maxlen
-          for file in self.rawdata_dict:
-#              print file, len(self.rawdata_dict[file])
-              self.rawdata_dict[file] = self.rawdata_dict[file] + [['0.0','0','0.0']]*(maxlen-len(self.rawdata_dict[file]))
-          return self.rawdata_dict
-
-
-      def find_pad_num(self, file):
-          cnt = 0
-#          print self.rawdata_dict[os.path.split(self.primary_file)[1][:-4]]
-          for row in self.rawdata_dict[os.path.split(self.primary_file)[1][:-4]]:
-#              print row[0],self.rawdata_dict[file][0][0]
-              if float(row[0]) >= float(self.rawdata_dict[file][0][0]):
-#                 print cnt
-                 return cnt
-              cnt = cnt + 1
-          sys.exit("Error: Cound not find padding number")
-                  
-
-
-      def find_primary_file(self):
-          primary_file = ""
-          if os.path.exists(self.dir_path):
-             cnt = 0
-             for file in glob.glob(self.dir_path + '/*.csv'):
-                 current_min_time = self.find_min_time(file)
-                 if cnt == 0:
-                    primary_file = file
-                    min_time = current_min_time
-#                 print current_min_time, min_time
-                 if current_min_time < min_time:
-                    min_time = current_min_time
-                    primary_file = file
-                 cnt = cnt + 1
+             results.extend([loadRawNode(task) for task in parse_tasks])
+          series = {}
+          self.max_mem_load_dict = {}
+          for node, node_series, max_dict in results:
+              if max_dict is None:
+                 del self.node_files[node]
+                 continue
+              series[node] = node_series
+              self.max_mem_load_dict[node] = max_dict
+          aggregate_series = loadAggregateSeries(self.dir_path)
+          for node in aggregate_series:
+              if node in series:
+                 series[node] = mergeSeries(series[node], aggregate_series[node])
+              else:
+                 series[node] = aggregate_series[node]
+              self.max_mem_load_dict[node] = maxMemLoad(series[node], maxMemLoadKeys(self.node_mem_load_only))
+          if not series:
+             sys.exit('Error: no raw job tracking data found in (%s)'% self.dir_path)
+          return series
+
+
+      def build_grid(self):
+          # Without --grid_step the grid follows the sample times of the
+          # primary node, and of the nodes still sampling after it stopped
+          np = import_numpy()
+          if not self.grid_step:
+             return chainGrid(dict([(node, self.series[node]['time']) for node in self.series]), self.primary_node)
+          if self.grid_step < 0:
+             sys.exit("Error: --grid_step must be positive")
+          start = self.series[self.primary_node]['time'][0]
+          end = max([self.series[node]['time'][-1] for node in self.series])
+          return start + np.arange(0.0, end - start + self.grid_step, self.grid_step)
+
+
+      def last_sample_gap(self, node):
+          # How long the last sample stays valid, the interval it recorded
+          # to the next scheduled sample. It is 0 for data that did not
+          # record one, so fall back to the typical spacing
+          np = import_numpy()
+          series = self.series[node]
+          if series['interval'][-1] > 0:
+             return float(series['interval'][-1])
+          if len(series) > 1:
+             return float(np.median(np.diff(series['time'])))
+          return 0.0
+
+
+      def node_alignment(self, node):
+          np = import_numpy()
+          if node not in self.alignment:
+             times = self.series[node]['time']
+             valid = (self.grid >= times[0]) & (self.grid <= times[-1] + self.last_sample_gap(node))
+             indx = np.maximum(np.searchsorted(times, self.grid, 'right') - 1, 0)
+             self.alignment[node] = (indx, valid)
+          return self.alignment[node]
+
+
+      def column(self, node, name):
+          # node column on the common time grid, 0 outside the node's samples
+          np = import_numpy()
+          values = self.series[node][name]
+          indx, valid = self.node_alignment(node)
+          if self.align == 'linear':
+             aligned = np.interp(self.grid, self.series[node]['time'], values)
           else:
-             sys.exit('Error: could not find the directory (%s)'% self.dir_path)
-          return primary_file
-          
+             aligned = values[indx]
+          return np.where(valid, aligned, 0)
+
+
+      def times(self):
+          return self.grid
+
+
+      def total(self, name):
+          # sum of one column over the nodes on the grid, a node at a time
+          # so memory stays at one grid long array
+          np = import_numpy()
+          total = np.zeros(self.length, dtype=np.float64)
+          for node in sorted(self.series):
+              total += self.column(node, name)
+          return total
+
+
+      def find_primary_node(self):
+          primary_node = None
+          for node in sorted(self.series):
+              if primary_node is None or self.series[node]['time'][0] < self.series[primary_node]['time'][0]:
+                 primary_node = node
+          return primary_node
+
+
+      def find_min_time(self, node):
+          return float(self.series[node]['time'][0])
+
+
+def readCsvRawChunk(chunk_task):
+    # Runs in an ingestion worker: parse the complete lines appended to a
+    # CSV raw file since offset
+    filename, offset, fixed, node_mem_load_only = chunk_task
+    lines = []
+    f = open(filename,'rb')
+    try:
+       f.seek(offset)
+       for line in f:
+           if not line.endswith(b'\n'):
+              break
+           lines.append(line)
+           offset = offset + len(line)
+    finally:
+       f.close()
+    series, fixed = parseCsvRawLines(lines, node_mem_load_only, fixed)
+    return (filename, series, offset, fixed)
+
+
+class ReportCache(object):
+
+      # Resumable version of the reduction behind --report. What a run has
+      # reduced is kept in report_cache.json in the rawdata directory: the
+      # offset reached in every raw file, the per-node maxima, the peaks of
+      # the job totals up to the last time every node has a sample for and
+      # the samples still needed to align the grid points after it. A rerun
+      # only parses what was appended since and gives the same report as
+      # RawData/JobTotals. complete is False when the data can only be
+      # reduced in one go, the caller then falls back to RawData.
+      def __init__(self, args, names):
+          self.dir_path = rawDataDir(args)
+          self.node_mem_load_only = args.args.node_mem_load_only
+          self.grid_step = args.args.grid_step
+          self.align = args.args.align
+          self.workers = args.args.workers
+          self.names = names
+          self.keys = maxMemLoadKeys(self.node_mem_load_only)
+          self.filename = os.path.join(self.dir_path, REPORT_CACHE_FILE)
+          self.options = {'node_mem_load_only': self.node_mem_load_only, 'grid_step': self.grid_step, 'align': self.align}
+          self.supported = True
+          self.complete = False
+          if self.grid_step is not None and self.grid_step < 0:
+             sys.exit("Error: --grid_step must be positive")
+          state = self.load_state()
+          if state is None or not self.update(state):
+             if not self.supported or not self.update(self.empty_state()):
+                return
+          self.complete = True
+          try:
+             writeJson(self.filename, self.state)
+          except (IOError, OSError):
+             pass
 
-      def find_min_time(self, file):
-          data_dict = {}
+
+      def empty_state(self):
+          return {'version': REPORT_CACHE_VERSION, 'options': self.options, 'sources': {}, 'nodes': {}, 'primary': None, 'final': None, 'grid_done': 0, 'peaks': {}}
+
+
+      def load_state(self):
           try:
-             f = open(file,'r')
-             job_reader = csv.reader(f)
-             first_row = next(job_reader)
-             time = first_row[0]
-          except IOError:
-             sys.exit('Error: could not open file (%s)'% file)
-          return time
-
-
-      def get_max_mem_load_dict(self):
-          report_dict = {}
-          if os.path.exists(self.dir_path):
-#             for file in os.listdir(self.dir_path):
-#                 if re.search('csv$',file) is not None:
-             for file in glob.glob(self.dir_path + '/*.csv'):
-#                 print file
-                 node = os.path.split(file)[1][:-4]
-#                 print node
-#                 report_dict[node] = {}
-                 report_dict[node] = self.max_mem_load(file)
-#                 print report_dict
+             f = open(self.filename)
+             try:
+                state = json.load(f)
+             finally:
+                f.close()
+          except (IOError, ValueError):
+             return None
+          if state.get('version') != REPORT_CACHE_VERSION or state.get('options') != self.options:
+             return None
+          return state
+
+
+      def read_sources(self, state):
+          # {node: [(source, new samples)]}, None if a cached file was
+          # replaced or truncated
+          np = import_numpy()
+          dtype = rawRecordDtype(np)
+          filenames = rawDataFiles(self.dir_path)
+          aggregate = os.path.join(self.dir_path, RAW_AGGREGATE_FILE)
+          if os.path.exists(aggregate):
+             filenames.append(aggregate)
+          for filename in state['sources']:
+              if filename not in filenames:
+                 return None
+          new = {}
+          csv_tasks = []
+          for filename in filenames:
+              stat = os.stat(filename)
+              source = state['sources'].get(filename)
+              if source is None:
+                 source = {'offset': 0, 'inode': stat.st_ino, 'fixed': None}
+                 state['sources'][filename] = source
+              elif source['inode'] != stat.st_ino or stat.st_size < source['offset']:
+                 return None
+              if filename.endswith('.csv'):
+                 csv_tasks.append((filename, source['offset'], source['fixed'], self.node_mem_load_only))
+                 continue
+              if source['offset'] == 0 and filename != aggregate:
+                 f = open(filename,'rb')
+                 readRawHeader(f, filename)
+                 f.close()
+              record_size = RAW_RECORD_SIZE
+              if filename == aggregate:
+                 record_size = RAW_AGGREGATE_SIZE
+              start = max(source['offset'], RAW_HEADER_SIZE)
+              count = (stat.st_size - start) // record_size
+              if count <= 0:
+                 continue
+              f = open(filename,'rb')
+              try:
+                 f.seek(start)
+                 data = f.read(count * record_size)
+              finally:
+                 f.close()
+              source['offset'] = start + count * record_size
+              if filename != aggregate:
+                 new.setdefault(os.path.split(filename)[1][:-4], []).append((filename, np.frombuffer(data, dtype=dtype)))
+                 continue
+              f = open(filename + RAW_AGGREGATE_NODES_EXT)
+              nodes = json.load(f)
+              f.close()
+              aggregate_dtype = np.dtype([('node','<u2')] + [(name, dtype[name]) for name in dtype.names])
+              records = np.frombuffer(data, dtype=aggregate_dtype)
+              for indx in np.unique(records['node']):
+                  node_records = records[records['node'] == indx]
+                  node_series = np.zeros(len(node_records), dtype=dtype)
+                  for name in dtype.names:
+                      node_series[name] = node_records[name]
+                  new.setdefault(str(nodes[indx]), []).append((filename, node_series))
+          workers = min(self.workers, len(csv_tasks))
+          if workers > 1:
+             pool = multiprocessing.Pool(workers)
+             results = pool.map(readCsvRawChunk, csv_tasks, 1)
+             pool.close()
+             pool.join()
+          else:
+             results = [readCsvRawChunk(task) for task in csv_tasks]
+          for filename, series, offset, fixed in results:
+              state['sources'][filename]['offset'] = offset
+              state['sources'][filename]['fixed'] = fixed
+              if len(series):
+                 new.setdefault(os.path.split(filename)[1][:-4], []).append((filename, series))
+          return new
+
+
+      def update(self, state):
+          np = import_numpy()
+          dtype = rawRecordDtype(np)
+          self.state = state
+          new = self.read_sources(state)
+          if new is None:
+             return False
+          final = state['final']
+          for node in new:
+              info = state['nodes'].get(node)
+              if len(new[node]) > 1 or (info is not None and info['source'] != new[node][0][0]):
+                 # a node that lost its aggregator has to be merged in one go
+                 self.supported = False
+                 return False
+              if info is None and final is not None and new[node][0][1]['time'][0] <= final:
+                 return False
+          carry = {}
+          for node in state['nodes']:
+              info = state['nodes'][node]
+              carry[node] = np.array([tuple(sample) for sample in info['carry']], dtype=dtype)
+          for node in new:
+              source, series = new[node][0]
+              if node not in state['nodes']:
+                 state['nodes'][node] = {'source': source, 't0': float(series['time'][0]), 'count': 0, 'maxima': {}}
+                 carry[node] = np.zeros(0, dtype=dtype)
+              info = state['nodes'][node]
+              for key in self.keys:
+                  # strictly greater keeps the first sample reaching the peak
+                  values = series[key[4:]]
+                  indx = int(values.argmax())
+                  if key not in info['maxima'] or values[indx].item() > info['maxima'][key][0]:
+                     info['maxima'][key] = [values[indx].item(), float(series['time'][indx])]
+              info['count'] = info['count'] + len(series)
+              carry[node] = np.concatenate((carry[node], series))
+          if not state['nodes']:
+             sys.exit('Error: no raw job tracking data found in (%s)'% self.dir_path)
+          nodes = sorted(state['nodes'])
+          primary = None
+          for node in nodes:
+              if primary is None or state['nodes'][node]['t0'] < state['nodes'][primary]['t0']:
+                 primary = node
+          if state['primary'] is not None and primary != state['primary']:
+             return False
+          state['primary'] = primary
+          gaps = {}
+          for node in nodes:
+              if carry[node]['interval'][-1] > 0:
+                 gaps[node] = float(carry[node]['interval'][-1])
+              elif state['nodes'][node]['count'] > 1:
+                 # the typical spacing of data without intervals needs every sample
+                 self.supported = False
+                 return False
+              else:
+                 gaps[node] = 0.0
+          start = state['nodes'][primary]['t0']
+          if not self.grid_step:
+             # the grid points up to final are all the primary's samples
+             grid = chainGrid(dict([(node, carry[node]['time']) for node in nodes]), primary)
+             if final is not None:
+                grid = grid[grid > final]
           else:
-             sys.exit('Error: could not find the directory (%s)'% self.dir_path)
-#          print report_dict
-          return report_dict
-
-
-      def get_max_mem_load_dict2(self):
-          report_dict = {}
-          if os.path.exists(self.dir_path):
-#             for file in os.listdir(self.dir_path):
-#                 if re.search('csv$',file) is not None:
-             for file in glob.glob(self.dir_path + '/*.csv'):
-#                 print file
-                 node = os.path.split(file)[1][:-4]
-#                 print node
-#                 report_dict[node] = {}
-                 report_dict[node] = self.max_mem_load2(file)
-#                 print report_dict
+             end = max([float(carry[node]['time'][-1]) for node in nodes])
+             length = int(math.ceil((end - start + self.grid_step) / self.grid_step))
+             grid = start + np.arange(state['grid_done'], max(length, state['grid_done']), dtype=np.float64) * self.grid_step
+          # grid points up to the last time every node has reached are final
+          final = min([float(carry[node]['time'][-1]) for node in nodes])
+          done = int((grid <= final).sum())
+          self.peaks = {}
+          for name in self.names:
+              totals = np.zeros(len(grid), dtype=np.float64)
+              for node in nodes:
+                  totals += self.column(carry[node], state['nodes'][node]['t0'], gaps[node], grid, name)
+              peak = state['peaks'].get(name)
+              if done > 0:
+                 indx = int(totals[:done].argmax())
+                 if peak is None or totals[indx] > peak[0]:
+                    peak = [float(totals[indx]), float(grid[indx] - start)]
+                 state['peaks'][name] = peak
+              if len(grid) > done:
+                 indx = done + int(totals[done:].argmax())
+                 if peak is None or totals[indx] > peak[0]:
+                    peak = [float(totals[indx]), float(grid[indx] - start)]
+              self.peaks[name] = tuple(peak)
+          state['final'] = final
+          state['grid_done'] = state['grid_done'] + done
+          for node in nodes:
+              # the last sample at or before final still covers the open grid points
+              indx = max(int(np.searchsorted(carry[node]['time'], final, 'right')) - 1, 0)
+              state['nodes'][node]['carry'] = carry[node][indx:].tolist()
+          self.primary_file = state['nodes'][primary]['source']
+          self.max_mem_load_dict = self.node_maxima(state)
+          return True
+
+
+      def column(self, series, t0, gap, grid, name):
+          # RawData.column on the samples that are left of a node
+          np = import_numpy()
+          times = series['time']
+          valid = (grid >= t0) & (grid <= times[-1] + gap)
+          if self.align == 'linear':
+             aligned = np.interp(grid, times, series[name])
           else:
-             sys.exit('Error: could not find the directory (%s)'% self.dir_path)
-#          print report_dict
-          return report_dict
+             aligned = series[name][np.maximum(np.searchsorted(times, grid, 'right') - 1, 0)]
+          return np.where(valid, aligned, 0)
+
+
+      def node_maxima(self, state):
+          # same insertion order as RawData: binary files, CSV files, aggregate
+          np = import_numpy()
+          aggregate = os.path.join(self.dir_path, RAW_AGGREGATE_FILE)
+          order = sorted([node for node in state['nodes'] if state['nodes'][node]['source'].endswith(RAW_BINARY_EXT)])
+          order = order + sorted([node for node in state['nodes'] if state['nodes'][node]['source'].endswith('.csv')])
+          aggregate_nodes = {}
+          for node in state['nodes']:
+              if state['nodes'][node]['source'] == aggregate:
+                 aggregate_nodes[str(node)] = True
+          max_mem_load_dict = {}
+          for node in order + list(aggregate_nodes):
+              info = state['nodes'][node]
+              data_dict = {}
+              for key in self.keys:
+                  value, max_time = info['maxima'][key]
+                  if key == 'max_node_load':
+                     value = float(str(np.float32(value)))
+                  else:
+                     value = int(value)
+                  data_dict[key] = (float(max_time - info['t0']), value)
+              max_mem_load_dict[str(node)] = data_dict
+          return max_mem_load_dict
 
 
-      def max_mem_load(self, file):
-          data_dict = {}
-          try:
-             f = open(file,'rb')
-             job_reader = csv.reader(f)
-             first_row = next(job_reader)
-             time_delta = first_row[0]
-             data_dict['max_job_mem'] =    (0.0, first_row[1])
-             data_dict['max_node_mem'] =   (0.0, first_row[2])
-             data_dict['max_node_load'] =  (0.0, first_row[3])
-             data_dict['max_cgroup_mem'] = (0.0, first_row[4])
-             for row in job_reader:
-                 if int(row[1]) > int(data_dict['max_job_mem'][1]):
-                    data_dict['max_job_mem'] = (float(row[0])-float(time_delta),int(row[1]))
-#                    print data_dict['max_job_mem']
-                 if int(row[2]) > int(data_dict['max_node_mem'][1]):
-                    data_dict['max_node_mem'] = (float(row[0])-float(time_delta),int(row[2]))
-#                    print data_dict['max_node_mem']
-                 if float(row[3]) > float(data_dict['max_node_load'][1]):
-                    data_dict['max_node_load'] = (float(row[0])-float(time_delta),float(row[3]))
-#                    print data_dict['max_node_load']
-                 if int(row[4]) > int(data_dict['max_cgroup_mem'][1]):
-#                    print int(row[4])
-                    data_dict['max_cgroup_mem'] = (float(row[0])-float(time_delta),int(row[4]))
-#                    print data_dict['max_cgroup_mem']
-          except IOError:
-             sys.exit('Error: could not open file (%s)'% file)
-#          print data_dict
-          return data_dict
-
-
-      def max_mem_load2(self, file):
-          data_dict = {}
-          try:
-             f = open(file,'rb')
-             job_reader = csv.reader(f)
-             first_row = next(job_reader)
-             time_delta = first_row[0]
-             data_dict['max_node_mem'] =  (0.0, first_row[1])
-             data_dict['max_node_load'] = (0.0, first_row[2])
-             for row in job_reader:
-                 if int(row[1]) > int(data_dict['max_node_mem'][1]):
-                    data_dict['max_node_mem'] = (float(row[0])-float(time_delta),int(row[1]))
-#                    print data_dict['max_node_mem']
-                 if float(row[2]) > float(data_dict['max_node_load'][1]):
-                    data_dict['max_node_load'] = (float(row[0])-float(time_delta),float(row[2]))
-#                    print data_dict['max_node_load']
-          except IOError:
-             sys.exit('Error: could not open file (%s)'% file)
-#          print data_dict
-          return data_dict
+      def peak(self, name):
+          return self.peaks[name]
+
+
+class JobTotals(object):
+
+      def __init__(self, rawdata, names):
+          times = rawdata.times()
+          self.times = times - times[0]
+          self.totals = {}
+          for name in names:
+              self.totals[name] = rawdata.total(name)
+
+
+      def peak(self, name):
+          # argmax returns the first time step holding the peak
+          indx = int(self.totals[name].argmax())
+          return (float(self.totals[name][indx]), float(self.times[indx]))
+
+
+class PlotSpool(object):
+
+      # Records appended chunk by chunk to an unlinked scratch file and read
+      # back memory-mapped, so a series is never held in memory whole
+      def __init__(self, directory, dtype):
+          np = import_numpy()
+          self.dtype = np.dtype(dtype)
+          self.f = tempfile.TemporaryFile(dir=directory)
+          self.count = 0
+
 
+      def append(self, records):
+          np = import_numpy()
+          if len(records) == 0:
+             return
+          np.asarray(records, dtype=self.dtype).tofile(self.f)
+          self.count = self.count + len(records)
+
+
+      def array(self):
+          # a plain view of the mapping, slicing a memmap costs more than the data
+          np = import_numpy()
+          self.f.flush()
+          if self.count == 0:
+             return np.zeros(0, dtype=self.dtype)
+          return np.asarray(np.memmap(self.f, dtype=self.dtype, mode='r', shape=(self.count,)))
+
+
+      def close(self):
+          self.f.close()
+
+
+class PlotSeriesWriter(object):
+
+      # One plot data file written a chunk at a time, its pyramid is built
+      # from the spooled copy once the series is complete
+      def __init__(self, outfile):
+          self.outfile = outfile
+          self.f = open(outfile,'wb')
+          self.spool = PlotSpool(os.path.dirname(os.path.abspath(outfile)), [('time','<f8'), ('value','<f8')])
+
+
+      def write(self, times, values):
+          np = import_numpy()
+          if len(times) == 0:
+             return
+          records = np.zeros(len(times), dtype=self.spool.dtype)
+          records['time'] = times
+          records['value'] = values
+          np.savetxt(self.f, np.column_stack((records['time'], records['value'])), fmt='%.6f', delimiter=',')
+          self.spool.append(records)
+
+
+      def close(self):
+          self.f.close()
+          series = self.spool.array()
+          writePlotPyramid(self.outfile[:-4] + PLOT_PYRAMID_EXT, series['time'], series['value'])
+          self.spool.close()
+
+
+class PlotNodeWriter(object):
+
+      # One column of one node, times relative to the node's first sample
+      layouts = False
+
+      def __init__(self, outfile, column, in_MB):
+          self.series = PlotSeriesWriter(outfile)
+          self.column = column
+          self.in_MB = in_MB
+
+
+      def write(self, stream, chunk, layouts):
+          values = chunk[self.column]
+          if self.in_MB:
+             values = to_MB(values)
+          self.series.write(chunk['time'] - stream.first, values)
+
+
+      def close(self):
+          self.series.close()
+
+
+class PlotLayoutWriter(object):
+
+      # The running threads per core (time x core) of a node and, with
+      # --thread_layout, the core every thread ran on (thread x time, -1
+      # when it was not running). The tid,core pairs are spooled while the
+      # node is read and laid out in the arrays once it is complete.
+      layouts = True
+
+      def __init__(self, outfile, cores, thread_layout):
+          self.outfile = outfile
+          self.scratch = os.path.dirname(os.path.abspath(outfile))
+          self.cores = cores
+          self.thread_layout = thread_layout
+          self.times = PlotSpool(self.scratch, '<f8')
+          self.pairs = PlotSpool(self.scratch, [('sample','<i8'), ('thread','<i8'), ('core','<i8')])
+          self.tids = {}
+          self.samples = 0
+          self.max_core = -1
+
+
+      def write(self, stream, chunk, layouts):
+          np = import_numpy()
+          sample_indx = []
+          thread_indx = []
+          cores = []
+          for indx, layout_l in enumerate(layouts):
+              sample_indx.extend([self.samples + indx] * (len(layout_l) // 2))
+              cores.extend([int(core) for core in layout_l[1::2]])
+              if self.thread_layout:
+                 for task_pid in layout_l[0::2]:
+                     thread_indx.append(self.tids.setdefault(int(task_pid), len(self.tids)))
+          pairs = np.zeros(len(cores), dtype=self.pairs.dtype)
+          pairs['sample'] = sample_indx
+          pairs['core'] = cores
+          if self.thread_layout:
+             pairs['thread'] = thread_indx
+          self.pairs.append(pairs)
+          if cores:
+             self.max_core = max(self.max_core, max(cores))
+          self.times.append(chunk['time'] - stream.first)
+          self.samples = self.samples + len(chunk)
+
+
+      def close(self):
+          np = import_numpy()
+          if self.samples > 0:
+             pairs = self.pairs.array()
+             number_cores = max(self.cores, self.max_core + 1)
+             occupancy = scratchArray(self.scratch, np.uint16, (self.samples, number_cores))
+             for first in range(0, len(pairs), PLOT_STREAM_CHUNK):
+                 chunk = pairs[first:first + PLOT_STREAM_CHUNK]
+                 lo = int(chunk['sample'][0])
+                 hi = int(chunk['sample'][-1]) + 1
+                 counts = np.bincount((chunk['sample'] - lo) * number_cores + chunk['core'], minlength=(hi - lo) * number_cores)
+                 occupancy[lo:hi] += counts.reshape(hi - lo, number_cores).astype(np.uint16)
+             layout = {'time': self.times.array(), 'occupancy': occupancy}
+             if self.thread_layout:
+                tid = np.zeros(len(self.tids), dtype=np.int64)
+                for task_pid in self.tids:
+                    tid[self.tids[task_pid]] = task_pid
+                core = scratchArray(self.scratch, np.int16, (len(self.tids), self.samples))
+                core.fill(-1)
+                for first in range(0, len(pairs), PLOT_STREAM_CHUNK):
+                    chunk = pairs[first:first + PLOT_STREAM_CHUNK]
+                    core[chunk['thread'], chunk['sample']] = chunk['core']
+                layout['tid'] = tid
+                layout['core'] = core
+             np.savez_compressed(self.outfile, **layout)
+          self.times.close()
+          self.pairs.close()
+
+
+class PlotNodeStream(object):
+
+      # A node's samples read a chunk at a time. Every chunk goes to the
+      # node's plot writers as it is read, buffer keeps it for the job
+      # totals from the last sample at or before the grid time reached so
+      # far; buffer_start is the index of its first sample in the node.
+      def __init__(self, node, chunks, keys, writers):
+          np = import_numpy()
+          self.node = node
+          self.chunks = chunks
+          self.keys = keys
+          self.writers = writers
+          self.buffer = np.zeros(0, dtype=rawRecordDtype(np))
+          self.buffer_start = 0
+          self.eof = False
+          self.first = None
+          self.last = None
+          self.gap = 0.0
+          self.count = 0
+          self.peaks = {}
+          self.maxima = {}
+          while self.first is None and not self.eof:
+                self.fill()
+
+
+      def fill(self):
+          np = import_numpy()
+          try:
+             chunk, layouts = next(self.chunks)
+          except StopIteration:
+             self.eof = True
+             return
+          if len(chunk) == 0:
+             return
+          if self.first is None:
+             self.first = float(chunk['time'][0])
+          self.update_maxima(chunk)
+          for writer in self.writers:
+              writer.write(self, chunk, layouts)
+          # how long the last sample stays valid, like RawData.last_sample_gap
+          # but with the last spacing for data that did not record an interval
+          if chunk['interval'][-1] > 0:
+             self.gap = float(chunk['interval'][-1])
+          elif len(chunk) > 1:
+             self.gap = float(chunk['time'][-1] - chunk['time'][-2])
+          elif self.last is not None:
+             self.gap = float(chunk['time'][-1]) - self.last
+          self.last = float(chunk['time'][-1])
+          self.count = self.count + len(chunk)
+          self.buffer = np.concatenate((self.buffer, chunk))
+
+
+      def update_maxima(self, chunk):
+          # first sample reaching the peak, as maxMemLoad
+          for key in self.keys:
+              values = chunk[key[4:]]
+              indx = int(values.argmax())
+              if key in self.peaks and not values[indx] > self.peaks[key]:
+                 continue
+              self.peaks[key] = values[indx]
+              if key == 'max_node_load':
+                 value = float(str(values[indx]))
+              else:
+                 value = int(values[indx])
+              self.maxima[key] = (float(chunk['time'][indx]) - self.first, value)
+
+
+      def cover(self, time):
+          while not self.eof and self.last <= time:
+                self.fill()
+
+
+      def trim(self, time):
+          np = import_numpy()
+          indx = int(np.searchsorted(self.buffer['time'], time, 'right')) - 1
+          if indx > 0:
+             self.buffer = self.buffer[indx:]
+             self.buffer_start = self.buffer_start + indx
+
+
+      def drain(self):
+          while not self.eof:
+                self.fill()
+                self.trim(self.last)
+
+
+      def aligned(self, grid, names, align):
+          # node columns on a stretch of the grid the buffer covers, 0
+          # outside the node's samples
+          np = import_numpy()
+          times = self.buffer['time']
+          valid = grid >= self.first
+          if self.eof:
+             valid = valid & (grid <= self.last + self.gap)
+          indx = np.maximum(np.searchsorted(times, grid, 'right') - 1, 0)
+          columns = {}
+          for name in names:
+              if align == 'linear':
+                 columns[name] = np.where(valid, np.interp(grid, times, self.buffer[name]), 0)
+              else:
+                 columns[name] = np.where(valid, self.buffer[name][indx], 0)
+          return columns
 
 
 class GenPlotData(object):
 
+      # Plot data in one streaming pass: every node's raw data is read a
+      # chunk at a time and each chunk feeds the job totals and the plot
+      # files wanted of that node at once. The nodes with the highest and
+      # lowest peaks are taken from the summaries written next to the raw
+      # files; without them the pass works them out and only those nodes
+      # are read a second time.
       def __init__(self, args):
           self.args = args
-          self.rawdata = RawData(self.args)
-          self.primary_file = self.rawdata.find_primary_file()
-          self.rawdata_dict = self.rawdata.get_max_mem_load_dict()
-          self.max_node_files = self.get_max_files()
-#          print self.max_node_files
-          self.number_compute_cores = getNumberComputeCores(getComputeNodeType(os.path.split(self.max_node_files[0][0])[1][:-4]))
-#          print self.number_compute_cores
-#          print self.max_node_files
-          self.create_node_plot_files()
-#          self.create_node_plot_layout_files()
-          self.create_node_plot_layout_files2()
-#          self.create_total_plot_files(1)
-#          self.create_total_plot_files(2)
-#          self.create_total_plot_files(3)
-          self.create_total_plot_files2()
-
-
-      def get_max_files(self):
+          self.dir_path = rawDataDir(args)
+          self.node_mem_load_only = self.args.args.node_mem_load_only
+          self.grid_step = self.args.args.grid_step
+          self.align = self.args.args.align
+          self.prefix = self.args.args.gen_plot_data[0]
+          if self.grid_step and self.grid_step < 0:
+             sys.exit("Error: --grid_step must be positive")
+          self.sources = plotSources(self.dir_path)
+          self.rawdata_dict = self.summary_maxima()
+          writers = {}
+          if self.rawdata_dict is not None:
+             writers = self.node_writers()
+          streams = self.open_streams(writers)
+          self.create_total_plot_files2(streams)
+          for stream in streams:
+              stream.drain()
+          if self.rawdata_dict is None:
+             self.rawdata_dict = {}
+             for stream in streams:
+                 self.rawdata_dict[stream.node] = stream.maxima
+             writers = self.node_writers()
+             for stream in self.open_streams(writers, sorted(writers)):
+                 stream.drain()
+          for node in writers:
+              for writer in writers[node]:
+                  writer.close()
+
+
+      def summary_maxima(self):
+          maxima = {}
+          for node in self.sources:
+              filename, aggregate = self.sources[node]
+              summary = None
+              if aggregate is None:
+                 summary = readRawSummary(filename)
+              if summary is None:
+                 return None
+              maxima[node] = summaryMaxMemLoad(summary, maxMemLoadKeys(self.node_mem_load_only))
+          return maxima
+
+
+      def node_writers(self):
+          self.max_nodes = self.get_max_nodes()
+#          print self.max_nodes
+          self.number_compute_cores = getNumberComputeCores(getComputeNodeType(self.max_nodes[0][0]))
+          writers = {}
+          columns = [('_job_mem.csv', 'job_mem', True), ('_node_mem.csv', 'node_mem', True), ('_node_load.csv', 'node_load', False), ('_cgroup_mem.csv', 'cgroup_mem', True)]
+          for node_t, (file_ext, column, in_MB) in zip(self.max_nodes, columns):
+              writers.setdefault(node_t[0], []).append(PlotNodeWriter(self.prefix + '_'+node_t[0]+'_max' + file_ext, column, in_MB))
+              writers.setdefault(node_t[1], []).append(PlotNodeWriter(self.prefix + '_'+node_t[1]+'_min' + file_ext, column, in_MB))
+          # the task layout is only kept in a node's own raw file
+          node_max = self.max_nodes[2][0]
+          if self.sources[node_max][0] is not None:
+             writers[node_max].append(PlotLayoutWriter(self.prefix + '_'+node_max+'_max' + PLOT_LAYOUT_EXT, self.number_compute_cores, self.args.args.thread_layout))
+          return writers
+
+
+      def node_chunks(self, node, layouts):
+          filename, aggregate = self.sources[node]
+          chunks = []
+          if filename is not None and filename.endswith(RAW_BINARY_EXT):
+             chunks.append(binaryRawChunks(filename, self.node_mem_load_only, layouts))
+          elif filename is not None:
+             chunks.append(csvRawChunks(filename, self.node_mem_load_only, layouts))
+          if aggregate is not None:
+             chunks.append(aggregateRawChunks(aggregate[0], aggregate[1]))
+          if len(chunks) == 1:
+             return chunks[0]
+          return mergeRawChunks(chunks)
+
+
+      def open_streams(self, writers, nodes=None):
+          if nodes is None:
+             nodes = sorted(self.sources)
+          streams = []
+          for node in nodes:
+              node_writers = writers.get(node, [])
+              layouts = len([writer for writer in node_writers if writer.layouts]) > 0
+              stream = PlotNodeStream(node, self.node_chunks(node, layouts), maxMemLoadKeys(self.node_mem_load_only), node_writers)
+              if stream.first is not None:
+                 streams.append(stream)
+          if not streams:
+             sys.exit('Error: no raw job tracking data found in (%s)'% self.dir_path)
+          return streams
+
+
+      def get_max_nodes(self):
           cnt = 0
           for node in self.rawdata_dict:
               if cnt == 0:
@@ -815,293 +3902,233 @@ class GenPlotData(object):
                  min_max_node_load = self.rawdata_dict[node]['max_node_load'][1]
                  max_cgroup_mem = self.rawdata_dict[node]['max_cgroup_mem'][1]
                  min_max_cgroup_mem = self.rawdata_dict[node]['max_cgroup_mem'][1]
-                 max_job_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 min_max_job_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 max_node_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 min_max_node_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 max_node_load_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 min_max_node_load_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 max_cgroup_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
-                 min_max_cgroup_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 max_job_mem_node = node
+                 min_max_job_mem_node = node
+                 max_node_mem_node = node
+                 min_max_node_mem_node = node
+                 max_node_load_node = node
+                 min_max_node_load_node = node
+                 max_cgroup_mem_node = node
+                 min_max_cgroup_mem_node = node
               if self.rawdata_dict[node]['max_job_mem'][1] > max_job_mem:
                  max_job_mem = self.rawdata_dict[node]['max_job_mem'][1]
-                 max_job_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 max_job_mem_node = node
               if self.rawdata_dict[node]['max_job_mem'][1] < min_max_job_mem:
                  min_max_job_mem = self.rawdata_dict[node]['max_job_mem'][1]
-                 min_max_job_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 min_max_job_mem_node = node
               if self.rawdata_dict[node]['max_node_mem'][1] > max_node_mem:
                  max_node_mem = self.rawdata_dict[node]['max_node_mem'][1]
-                 max_node_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 max_node_mem_node = node
               if self.rawdata_dict[node]['max_node_mem'][1] < min_max_node_mem:
                  min_max_node_mem = self.rawdata_dict[node]['max_node_mem'][1]
-                 min_max_node_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 min_max_node_mem_node = node
               if self.rawdata_dict[node]['max_cgroup_mem'][1] > max_cgroup_mem:
                  max_cgroup_mem = self.rawdata_dict[node]['max_cgroup_mem'][1]
-                 max_cgroup_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 max_cgroup_mem_node = node
               if self.rawdata_dict[node]['max_cgroup_mem'][1] < min_max_cgroup_mem:
                  min_max_cgroup_mem = self.rawdata_dict[node]['max_cgroup_mem'][1]
-                 min_max_cgroup_mem_file = os.path.join(self.rawdata.dir_path,node+'.csv')
+                 min_max_cgroup_mem_node = node
               cnt = cnt + 1
-          return ((max_job_mem_file,min_max_job_mem_file),(max_node_mem_file,min_max_node_mem_file),(max_node_load_file,min_max_node_load_file),(max_cgroup_mem_file,min_max_cgroup_mem_file)) 
-
-
-      def create_node_plot_files(self):
-#          print self.max_node_files
-          cnt = 1
-          for file_t in self.max_node_files:
-#              print file_t, cnt
-              self.create_node_plot_data(file_t, cnt)
-              cnt = cnt + 1
-
-
-      def create_node_plot_layout_files(self):
-          self.create_node_plot_layout_data(self.max_node_files[2])
-
-
-      def create_node_plot_layout_files2(self):
-          self.create_node_plot_layout_data2(self.max_node_files[2])
-
-
-      def create_node_plot_layout_data(self, file_t):
-#          print file_t
-          writer_l = []
-          f_i = open(file_t[0],'rb')
-          node_max = os.path.split(file_t[0])[1][:-4]
-          reader = csv.reader(f_i)
-          for physical_id in range(0, self.number_compute_cores):
-              file_ext = "_node_layout_" + str(physical_id) + ".csv"
-              outfile = self.args.args.gen_plot_data[0] + '_'+node_max+'_max' + file_ext
-              f_o = open(outfile,'wb')
-              writer_l.append(csv.writer(f_o))
-          first_row = next(reader)
-          layout_list = self.get_layout_list(first_row)
-#          print layout_list
-          cnt = 0
-          for physical_id in layout_list:
-              writer_l[cnt].writerow([0.0,physical_id])
-              cnt = cnt + 1
-          time_delta = first_row[0]
-          for row in reader:
-              layout_list = self.get_layout_list(row)
-#              print layout_list
-              cnt = 0
-              for physical_id in layout_list:
-                  writer_l[cnt].writerow([float(row[0])-float(time_delta),physical_id])
-                  cnt = cnt + 1
-
-
-      def create_node_plot_layout_data2(self, file_t):
-#          print file_t
-          writer_d = {}
-          f_i = open(file_t[0],'rb')
-          node_max = os.path.split(file_t[0])[1][:-4]
-          reader = csv.reader(f_i)
-          first_row = next(reader)
-          time_delta = first_row[0]
-          layout_t_l = self.get_layout_t(first_row)
-          for (task_pid,phys_id) in layout_t_l:
-              file_ext = "_node_layout_" + str(task_pid) + ".csv"
-              outfile = self.args.args.gen_plot_data[0] + '_'+node_max+'_max' + file_ext
-              f_o = open(outfile,'wb')
-              writer_d[task_pid] = csv.writer(f_o)
-              writer_d[task_pid].writerow([0.0, phys_id])
-          for row in reader:
-              layout_t_l = self.get_layout_t(row)
-              for (task_pid,phys_id) in layout_t_l:
-                  if task_pid not in writer_d:
-                     file_ext = "_node_layout_" + str(task_pid) + ".csv"
-                     outfile = self.args.args.gen_plot_data[0] + '_'+node_max+'_max' + file_ext
-                     f_o = open(outfile,'wb')
-                     writer_d[task_pid] = csv.writer(f_o)
-                     writer_d[task_pid].writerow([0.0,phys_id])
-                  else:
-                     writer_d[task_pid].writerow([float(row[0])-float(time_delta),phys_id])
-
-
-      def get_layout_list(self, csv_l):
-          layout_l = csv_l[4:]
-#          print layout_l 
-          layout_l2 = []
-          physical_id_l = []
-          for physical_id in layout_l[1::2]:
-#              print physical_id
-              physical_id_l.append(int(physical_id))
-#          print physical_id_l
-          for physical_id_loc in range(0, self.number_compute_cores):
-              if physical_id_loc in physical_id_l:
-                 layout_l2.append(physical_id_loc)
-              else:
-                 layout_l2.append(0)
-          return layout_l2
-
-
-      def get_layout_t(self, csv_l):
-          layout_l = csv_l[5:]
-          layout_t_l = []
-          for task_pid in layout_l[0::2]:
-              layout_t_l.append((task_pid, layout_l[layout_l.index(task_pid)+1]))
-
-          return layout_t_l    
-
-
-      def create_node_plot_data(self, file_t, type):
-          data = []
-          f_i = open(file_t[0],'rb')
-          if type == 1:
-             file_ext = '_job_mem.csv'
-          elif type == 2:
-             file_ext = '_node_mem.csv'
-          elif type == 3:
-             file_ext = '_node_load.csv'
-          else:
-             file_ext = '_cgroup_mem.csv'
-          node_max = os.path.split(file_t[0])[1][:-4]
-          outfile = self.args.args.gen_plot_data[0] + '_'+node_max+'_max' + file_ext
-          f_o = open(outfile,'wb')
-          reader = csv.reader(f_i)
-          writer = csv.writer(f_o)
-          first_row = next(reader)
-          time_delta = first_row[0]
-          if type == 1 or type == 2 or type == 4:
-             writer.writerow([0.0, to_MB(first_row[type])])
-          else:
-             writer.writerow([0.0, first_row[type]])
-          for row in reader:
-              if type == 1 or type == 2 or type == 4:
-                 writer.writerow([float(row[0])-float(time_delta),to_MB(row[type])])
-              else:
-                 writer.writerow([float(row[0])-float(time_delta),row[type]])
-          f_i.close()
-          f_o.close()
-          node_min = os.path.split(file_t[1])[1][:-4]
-          outfile2 = self.args.args.gen_plot_data[0] + '_'+node_min+'_min' + file_ext
-          f_i2 = open(file_t[1],'rb')
-          f_o2 = open(outfile2,'wb')
-          reader2 = csv.reader(f_i2)
-          writer2 = csv.writer(f_o2)
-          first_row2 = next(reader2)
-          time_delta2 = first_row2[0]
-          if type == 1 or type == 2 or type == 4:
-             writer2.writerow([0.0, to_MB(first_row2[type])])
-          else:
-             writer2.writerow([0.0, first_row2[type]])
-          for row2 in reader2:
-              if type == 1 or type == 2 or type == 4:
-                 writer2.writerow([float(row2[0])-float(time_delta2),to_MB(row2[type])])
-              else:
-                 writer2.writerow([float(row2[0])-float(time_delta2),row2[type]])
-          f_i2.close()
-          f_o2.close()
-
-
-      def create_total_plot_files(self, type):
-          x = []
-          y = []
-          previous_y_dict = {}
-          if type == 1:
-             file_ext = '_job_mem.csv'
-          elif type == 2:
-             file_ext = '_node_mem.csv'
-          else:
-             file_ext = '_node_load.csv'
-          if os.path.exists(self.rawdata.dir_path):
-             f_p = open(self.primary_file,'rb')
-             primary_reader = csv.reader(f_p)
-             first_row = next(primary_reader)
-             time_delta = first_row[0]
-             start_time = float(time_delta)
-             x.append(0.0)
-             if type == 1 or type == 2:
-                y.append(int(first_row[type]))
-             else: 
-                y.append(float(first_row[type]))
-             indx = 0
-             for primary_row in primary_reader:
-                 for file in glob.glob(self.rawdata.dir_path + '/*.csv'):
-                     got_value = False
-                     if not file == self.primary_file:
-                        f = open(file,'rb')
-                        reader = csv.reader(f)
-                        for row in reader:
-                            if float(row[0]) > start_time and float(row[0]) <= float(primary_row[0]):
-                               previous_y_dict[file] = row[type]
-                               got_value = True
-#                               print file, start_time,row[0],primary_row[0],y[indx],row[type]
-                               if type == 1 or type == 2:
-                                  y[indx] = y[indx] + int(row[type])
-                               else:
-                                  y[indx] = y[indx] + float(row[type])
-                               break
-                        if not got_value and file in previous_y_dict:
-                           if type == 1 or type == 2:
-                              y[indx] = y[indx] + int(previous_y_dict[file])
-                           else:
-                              y[indx] = y[indx] + float(previous_y_dict[file])
-                 indx = indx + 1
-                 if type == 1 or type == 2:
-                    y.append(int(primary_row[type]))
-                 else:
-                    y.append(float(primary_row[type]))
-                 x.append(float(primary_row[0])-float(time_delta))
-                 start_time = float(primary_row[0])
-          else:
-             sys.exit('Error: could not find the directory (%s)'% self.dir_path)
-          outfile = self.args.args.gen_plot_data[0] + '_total' + file_ext
-          f_o = open(outfile,'wb')
-          writer = csv.writer(f_o)
-#          print len(x),len(y)
-          for time in x:
-              if type == 1 or type == 2:
-                 writer.writerow([time, to_MB(y[x.index(time)])])
-              else:
-                 writer.writerow([time, y[x.index(time)]])
-              
-
-      def create_total_plot_files2(self):
-          total_l = []
-          zip_lists = []
-          primary_node = os.path.split(self.rawdata.primary_file)[1][:-4]
-          time_delta = self.rawdata.rawdata_dict[primary_node][0][0]
-          for node in self.rawdata.rawdata_dict:
-              zip_lists.append(self.rawdata.rawdata_dict[node])
-          for zip_t in zip(*zip_lists):
-#              print zip_t
-              total_job_mem = 0
-              total_node_mem = 0
-              total_node_load = 0
-              for row_l in zip_t:
-                  total_job_mem = total_job_mem + int(row_l[1])
-                  total_node_mem = total_node_mem + int(row_l[2])
-                  total_node_load = total_node_load + float(row_l[3])
-              total_l.append((total_job_mem,total_node_mem,total_node_load))
-          outfile1 = self.args.args.gen_plot_data[0] + '_total_job_mem.csv'
-          outfile2 = self.args.args.gen_plot_data[0] + '_total_node_mem.csv'
-          outfile3 = self.args.args.gen_plot_data[0] + '_total_node_load.csv'
-          f_o1 = open(outfile1,'wb')
-          f_o2 = open(outfile2,'wb')
-          f_o3 = open(outfile3,'wb')
-          writer1 = csv.writer(f_o1)
-          writer2 = csv.writer(f_o2)
-          writer3 = csv.writer(f_o3)
-          cnt = 0
-          for primary_row in self.rawdata.rawdata_dict[primary_node]:
-              time = float(primary_row[0]) - float(time_delta)
-              if time > 0.0 or cnt == 0:
-                 writer1.writerow([time, to_MB(total_l[cnt][0])])
-                 writer2.writerow([time, to_MB(total_l[cnt][1])])
-                 writer3.writerow([time, total_l[cnt][2]])
-              cnt = cnt + 1
-
+          return ((max_job_mem_node,min_max_job_mem_node),(max_node_mem_node,min_max_node_mem_node),(max_node_load_node,min_max_node_load_node),(max_cgroup_mem_node,min_max_cgroup_mem_node))
+
+
+      def next_source(self, streams, end):
+          # the stream sampling next after end and the index of that
+          # sample, as chainGrid
+          np = import_numpy()
+          source = None
+          source_index = None
+          for stream in streams:
+              stream.cover(end)
+              times = stream.buffer['time']
+              indx = int(np.searchsorted(times, end, 'right'))
+              if indx < len(times) and (source is None or times[indx] < next_time):
+                 source = stream
+                 source_index = stream.buffer_start + indx
+                 next_time = times[indx]
+          return source, source_index
+
+
+      def create_total_plot_files2(self, streams):
+          # The totals on the grid of RawData, a stretch of the grid at a
+          # time: the samples of the primary node and of the nodes sampling
+          # after it stopped (source), or every --grid_step seconds
+          np = import_numpy()
+          names = ['job_mem','node_mem','node_load','cgroup_mem']
+          writers = {}
+          for name in names:
+              writers[name] = PlotSeriesWriter(self.prefix + '_total_' + name + '.csv')
+          source = min(streams, key=lambda stream: (stream.first, stream.node))
+          source_index = 0
+          start = source.first
+          position = 0
+          while True:
+                if self.grid_step:
+                   grid = start + np.arange(position, position + PLOT_STREAM_CHUNK) * self.grid_step
+                else:
+                   while not source.eof and source.buffer_start + len(source.buffer) <= source_index:
+                         source.fill()
+                   grid = source.buffer['time'][source_index - source.buffer_start:]
+                   if len(grid) == 0:
+                      source, source_index = self.next_source(streams, source.last)
+                      if source is None:
+                         break
+                      continue
+                   source_index = source_index + len(grid)
+                if len(grid) == 0:
+                   break
+                for stream in streams:
+                    stream.cover(grid[-1])
+                if self.grid_step and len([stream for stream in streams if not stream.eof]) == 0:
+                   # the grid ends with the last sample of the job
+                   end = max([stream.last for stream in streams])
+                   grid = grid[:max(len(np.arange(0.0, end - start + self.grid_step, self.grid_step)) - position, 0)]
+                   if len(grid) == 0:
+                      break
+                totals = {}
+                for name in names:
+                    totals[name] = np.zeros(len(grid), dtype=np.float64)
+                for stream in streams:
+                    columns = stream.aligned(grid, names, self.align)
+                    for name in names:
+                        totals[name] += columns[name]
+                times = grid - start
+                keep = times > 0.0
+                if position == 0:
+                   keep[0] = True
+                writers['job_mem'].write(times[keep], to_MB(totals['job_mem'][keep]))
+                writers['node_mem'].write(times[keep], to_MB(totals['node_mem'][keep]))
+                writers['node_load'].write(times[keep], totals['node_load'][keep])
+                writers['cgroup_mem'].write(times[keep], to_MB(totals['cgroup_mem'][keep]))
+                for stream in streams:
+                    stream.trim(grid[-1])
+                position = position + len(grid)
+          for name in names:
+              writers[name].close()
+
+
+
+def overheadSummary(filename):
+    # time, sample wall time, sample CPU time, RSS, bytes written, interval,
+    # overhead (%), task layout recorded
+    summary = {'samples': 0, 'wall': 0.0, 'cpu': 0.0, 'rss': 0, 'written': 0, 'first': None, 'last': None, 'interval': 0.0, 'layout': True}
+    for row in readCsvRawRows(filename):
+        if len(row) < 8:
+           continue
+        summary['samples'] = summary['samples'] + 1
+        summary['wall'] = summary['wall'] + float(row[1])
+        summary['cpu'] = summary['cpu'] + float(row[2])
+        summary['rss'] = max(summary['rss'], int(row[3]))
+        summary['written'] = summary['written'] + int(row[4])
+        if summary['first'] is None:
+           summary['first'] = float(row[0])
+        summary['last'] = float(row[0])
+        summary['interval'] = float(row[5])
+        summary['layout'] = row[7] == '1'
+    return summary
+
+
+def printOverheadReport(dir_path):
+    files = sorted(glob.glob(os.path.join(dir_path, '*' + RAW_OVERHEAD_EXT)))
+    if not files:
+       return
+    print ("\n\nCollector overhead (CPU % of the sampled period)\n")
+    print ("{0:^15}{1:^10}{2:^18}{3:^12}{4:^10}{5:^14}{6:^14}{7:^14}{8:^13}").format("Node","Samples","Time/sample(ms)","CPU(s)","CPU(%)","Max RSS(MB)","Written(MB)","Interval(s)","Task layout")
+    print ("{0:^15}{1:^10}{2:^18}{3:^12}{4:^10}{5:^14}{6:^14}{7:^14}{8:^13}").format("="*14,"="*9,"="*17,"="*11,"="*9,"="*13,"="*13,"="*13,"="*12)
+    for file in files:
+        node = os.path.split(file)[1][:-len(RAW_OVERHEAD_EXT)]
+        summary = overheadSummary(file)
+        if summary['samples'] == 0:
+           continue
+        period = summary['last'] - summary['first'] + summary['interval']
+        overhead = 0.0
+        if period > 0.0:
+           overhead = 100.0 * summary['cpu'] / period
+        layout = 'recorded'
+        if not summary['layout']:
+           layout = 'dropped'
+        print ("{0:<15}{1:>9} {2:>17.3f} {3:>11.3f} {4:>9.3f} {5:>13.2f} {6:>13.3f} {7:>13.3f} {8:>12}").format(node,
+                                                                                                      summary['samples'],
+                                                                                                      1000.0 * summary['wall'] / summary['samples'],
+                                                                                                      summary['cpu'],
+                                                                                                      overhead,
+                                                                                                      to_MB(summary['rss']),
+                                                                                                      summary['written'] / (1024.0 * 1024.0),
+                                                                                                      summary['interval'],
+                                                                                                      layout)
+
+
+def layoutSummary(filename):
+    summary = {'samples': 0, 'threads': 0, 'running': 0, 'max_per_core': 0, 'oversubscribed_samples': 0, 'oversubscribed': 0, 'idle': 0, 'migrations': 0}
+    for row in readCsvRawRows(filename):
+        if len(row) < 8:
+           continue
+        summary['samples'] = summary['samples'] + 1
+        summary['threads'] = summary['threads'] + int(row[1])
+        summary['running'] = summary['running'] + int(row[2])
+        if int(row[4]) > 0:
+           summary['oversubscribed_samples'] = summary['oversubscribed_samples'] + 1
+        summary['oversubscribed'] = summary['oversubscribed'] + int(row[4])
+        summary['idle'] = summary['idle'] + int(row[5])
+        summary['max_per_core'] = max(summary['max_per_core'], int(row[6]))
+        summary['migrations'] = summary['migrations'] + int(row[7])
+    return summary
+
+
+def printLayoutReport(dir_path):
+    files = sorted(glob.glob(os.path.join(dir_path, '*' + RAW_LAYOUT_SUMMARY_EXT)))
+    if not files:
+       return
+    print ("\n\nTask placement (job threads on the node's cores, per sample)\n")
+    print ("{0:^15}{1:^10}{2:^10}{3:^10}{4:^16}{5:^18}{6:^12}{7:^13}{8:^15}").format("Node","Samples","Threads","Running","Max per core","Oversubscribed(%)","Idle cores","Migrations","Per sample")
+    print ("{0:^15}{1:^10}{2:^10}{3:^10}{4:^16}{5:^18}{6:^12}{7:^13}{8:^15}").format("="*14,"="*9,"="*9,"="*9,"="*15,"="*17,"="*11,"="*12,"="*14)
+    notes = []
+    for file in files:
+        node = os.path.split(file)[1][:-len(RAW_LAYOUT_SUMMARY_EXT)]
+        summary = layoutSummary(file)
+        samples = summary['samples']
+        if samples == 0:
+           continue
+        oversubscribed = 100.0 * summary['oversubscribed_samples'] / samples
+        migrations = float(summary['migrations']) / samples
+        print ("{0:<15}{1:>9} {2:>9.1f} {3:>9.1f} {4:>15} {5:>17.1f} {6:>11.1f} {7:>12} {8:>14.2f}").format(node,
+                                                                                                   samples,
+                                                                                                   float(summary['threads']) / samples,
+                                                                                                   float(summary['running']) / samples,
+                                                                                                   summary['max_per_core'],
+                                                                                                   oversubscribed,
+                                                                                                   float(summary['idle']) / samples,
+                                                                                                   summary['migrations'],
+                                                                                                   migrations)
+        if oversubscribed > LAYOUT_OVERSUBSCRIBED_PERCENT:
+           notes.append("%s: running threads shared a core in %.1f%% of the samples (up to %d on one core)" % (node, oversubscribed, summary['max_per_core']))
+        if summary['threads'] > 0 and migrations * samples / summary['threads'] > LAYOUT_MIGRATIONS_PER_THREAD:
+           notes.append("%s: threads moved between cores %.2f times per sample, they do not look pinned" % (node, migrations))
+    if notes:
+       print ("")
+       for note in notes:
+           print (note)
 
 
 class Report(object):
 
       def __init__(self, args):
           self.args = args
-          self.rawdata = RawData(self.args)
+          if args.args.quick:
+             self.report_dict = summaryReportDict(rawDataDir(args), False)
+             Report.print_node_report(self)
+             return
+          self.cache = None
+          if not args.args.no_cache:
+             self.cache = ReportCache(self.args, ['job_mem','node_mem','node_load','cgroup_mem'])
+          if self.cache is not None and self.cache.complete:
+             self.rawdata = self.cache
+          else:
+             self.cache = None
+             self.rawdata = RawData(self.args)
 #          print self.rawdata.rawdata_dict
-          self.report_dict = self.rawdata.get_max_mem_load_dict()
-          self.primary_file = self.rawdata.find_primary_file()
+          self.report_dict = self.rawdata.max_mem_load_dict
+          self.primary_file = self.rawdata.primary_file
 #          print "self.primary_file=",self.primary_file
 #          self.max_total_job_mem = Report.find_max_total_job_mem(self)
 ##          self.max_total_job_mem = Report.find_max_total_type(self,1)
@@ -1122,8 +4149,7 @@ class Report(object):
 
       def find_max_total_type(self,type): 
           if os.path.exists(self.rawdata.dir_path):
-             f_p = open(self.primary_file,'rb')
-             primary_reader = csv.reader(f_p)
+             primary_reader = readRawRows(self.primary_file)
              first_row = next(primary_reader)
              time_delta = first_row[0]
              total_t = (first_row[type],0.0)
@@ -1134,10 +4160,9 @@ class Report(object):
                     current_total = int(primary_row[type])
                  else:
                     current_total = float(primary_row[type])
-                 for file in glob.glob(self.rawdata.dir_path + '/*.csv'):
+                 for file in rawDataFiles(self.rawdata.dir_path):
                      if not file == self.primary_file:
-                        f = open(file,'rb')
-                        reader = csv.reader(f)
+                        reader = readRawRows(file)
                         for row in reader:
                             if float(row[0]) > start_time and float(row[0]) <= float(primary_row[0]):
                                if type == 1 or type == 2:
@@ -1158,56 +4183,12 @@ class Report(object):
 
 
       def find_max_total_type2(self,type):
-          total_l = []
-          zip_lists = []
-          primary_node = os.path.split(self.rawdata.primary_file)[1][:-4]
-          time_delta = self.rawdata.rawdata_dict[primary_node][0][0]
-          for node in self.rawdata.rawdata_dict:
-              zip_lists.append(self.rawdata.rawdata_dict[node])
-          for zip_t in zip(*zip_lists):
-#              print zip_t
-              total_job_mem = 0
-              total_node_mem = 0
-              total_node_load = 0
-              total_cgroup_mem = 0
-              for row_l in zip_t:
-                  total_job_mem = total_job_mem + int(row_l[1])
-                  total_node_mem = total_node_mem + int(row_l[2])
-                  total_node_load = total_node_load + float(row_l[3])
-                  total_cgroup_mem = total_cgroup_mem + float(row_l[4])
-              total_l.append((total_job_mem,total_node_mem,total_node_load,total_cgroup_mem))
-          max_total_job_mem = 0
-          max_total_node_mem = 0
-          max_total_node_load = 0.0
-          max_total_cgroup_mem = 0
-          max_total_job_mem_time = 0.0
-          max_total_node_mem_time = 0.0
-          max_total_node_load_time = 0.0
-          max_total_cgroup_mem_time = 0.0
-          for total_t in total_l:
-#              print total_t
-              if total_t[0] > max_total_job_mem:
-                  max_total_job_mem = total_t[0]
-                  if float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0]) > max_total_job_mem_time:
-                     max_total_job_mem_time = float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0])
-                  max_total_job_mem_t = (total_t[0],max_total_job_mem_time-float(time_delta))
-              if total_t[1] > max_total_node_mem:
-                  max_total_node_mem = total_t[1]
-                  if float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0]) > max_total_node_mem_time:
-                     max_total_node_mem_time = float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0])
-                  max_total_node_mem_t = (total_t[1],max_total_node_mem_time-float(time_delta))
-              if total_t[2] > max_total_node_load:
-                 max_total_node_load = total_t[2]
-                 if float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0]) > max_total_node_load_time:
-                    max_total_node_load_time = float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0])
-                 max_total_node_load_t = (total_t[2],max_total_node_load_time-float(time_delta))
-              if total_t[3] > max_total_cgroup_mem:
-                 max_total_cgroup_mem = total_t[3]
-                 if float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0]) > max_total_cgroup_mem_time:
-                    max_total_cgroup_mem_time = float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0])
-                 max_total_cgroup_mem_t = (total_t[3],max_total_cgroup_mem_time-float(time_delta))
-#          print (max_total_job_mem_t,max_total_node_mem_t,max_total_node_load_t)
-          return (max_total_job_mem_t,max_total_node_mem_t,max_total_node_load_t,max_total_cgroup_mem_t) 
+          names = ['job_mem','node_mem','node_load','cgroup_mem']
+          if self.cache is not None:
+             return tuple([self.cache.peak(name) for name in names])
+          self.job_totals = JobTotals(self.rawdata, names)
+#          print self.job_totals.totals
+          return tuple([self.job_totals.peak(name) for name in names])
 
 
       def print_report(self):
@@ -1216,6 +4197,10 @@ class Report(object):
           print ("Maximum Total aggregate Node Memory is %6.2fMB at %6.2fs\n" % (to_MB(self.max_total_node_mem[0]),self.max_total_node_mem[1]))
           print ("Maximum Total aggregate job Load is %6.2f at %6.2fs\n" % (self.max_total_load[0],self.max_total_load[1]))
           print ("Maximum Total aggregate job cgroup Memory is %6.2fMB at %6.2fs\n\n" % (to_MB(self.max_total_cgroup_mem[0]),self.max_total_cgroup_mem[1]))
+          Report.print_node_report(self)
+
+
+      def print_node_report(self):
           print ("\n\n{0:^15}{1:^30}{2:^29}{3:^23}{4:^34}").format("Node","Max job memory(MB)(Time(s))","Max Node Memory(MB)(Time(s))","Max Node Load(Time(s))","Max job cgroup memory(MB)(Time(s)")
           print ("{0:^15}{1:^30}{2:^29}{3:^23}{4:^34}").format("="*14,"="*29,"="*28,"="*22,"="*33)
           for key in self.report_dict:
@@ -1228,6 +4213,8 @@ class Report(object):
                                                                                                          self.report_dict[key]['max_node_load'][0],
                                                                                                          to_MB(self.report_dict[key]['max_cgroup_mem'][1]),
                                                                                                          self.report_dict[key]['max_cgroup_mem'][0])
+          printLayoutReport(rawDataDir(self.args))
+          printOverheadReport(rawDataDir(self.args))
               
 
 
@@ -1235,10 +4222,21 @@ class Report2(object):
 
       def __init__(self, args):
           self.args = args
-          self.rawdata = RawData(self.args)
+          if args.args.quick:
+             self.report_dict = summaryReportDict(rawDataDir(args), True)
+             Report2.print_node_report(self)
+             return
+          self.cache = None
+          if not args.args.no_cache:
+             self.cache = ReportCache(self.args, ['node_mem','node_load'])
+          if self.cache is not None and self.cache.complete:
+             self.rawdata = self.cache
+          else:
+             self.cache = None
+             self.rawdata = RawData(self.args)
 #          print self.rawdata.rawdata_dict
-          self.report_dict = self.rawdata.get_max_mem_load_dict2()
-          self.primary_file = self.rawdata.find_primary_file()
+          self.report_dict = self.rawdata.max_mem_load_dict
+          self.primary_file = self.rawdata.primary_file
 #          print "self.primary_file=",self.primary_file
 #          self.max_total_job_mem = Report.find_max_total_job_mem(self)
 ##          self.max_total_job_mem = Report.find_max_total_type(self,1)
@@ -1256,37 +4254,21 @@ class Report2(object):
 
 
       def find_max_total_type2(self,type):
-          total_l = []
-          zip_lists = []
-          primary_node = os.path.split(self.rawdata.primary_file)[1][:-4]
-          time_delta = self.rawdata.rawdata_dict[primary_node][0][0]
-          for node in self.rawdata.rawdata_dict:
-              zip_lists.append(self.rawdata.rawdata_dict[node])
-          for zip_t in zip(*zip_lists):
-#              print zip_t
-              total_node_mem = 0
-              total_node_load = 0
-              for row_l in zip_t:
-                  total_node_mem = total_node_mem + int(row_l[1])
-                  total_node_load = total_node_load + float(row_l[2])
-              total_l.append((total_node_mem,total_node_load))
-          max_total_node_mem = 0
-          max_total_node_load = 0.0
-          for total_t in total_l:
-#              print total_t
-              if total_t[0] > max_total_node_mem:
-                  max_total_node_mem = total_t[0]
-                  max_total_node_mem_t = (total_t[0],float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0])-float(time_delta))
-              if total_t[1] > max_total_node_load:
-                 max_total_node_load = total_t[1]
-                 max_total_node_load_t = (total_t[1],float(self.rawdata.rawdata_dict[primary_node][total_l.index(total_t)][0])-float(time_delta))
-#          print (max_total_job_mem_t,max_total_node_mem_t,max_total_node_load_t)
-          return (max_total_node_mem_t,max_total_node_load_t) 
+          names = ['node_mem','node_load']
+          if self.cache is not None:
+             return tuple([self.cache.peak(name) for name in names])
+          self.job_totals = JobTotals(self.rawdata, names)
+#          print self.job_totals.totals
+          return tuple([self.job_totals.peak(name) for name in names])
 
 
       def print_report(self):
           print ("\n\nMaximum Total aggregate Node Memory is %6.2fMB at %6.2fs\n" % (to_MB(self.max_total_node_mem[0]),self.max_total_node_mem[1]))
           print ("Maximum Total aggregate job Load is %6.2f at %6.2fs\n\n" % (self.max_total_load[0],self.max_total_load[1]))
+          Report2.print_node_report(self)
+
+
+      def print_node_report(self):
           print ("\n\n{0:^15}{1:^29}{2:^23}").format("Node","Max Node Memory(MB)(Time(s))","Max Node Load(Time(s))")
           print ("{0:^15}{1:^29}{2:^23}").format("="*14,"="*28,"="*22)
           for key in self.report_dict:
@@ -1295,10 +4277,635 @@ class Report2(object):
                                                                                          self.report_dict[key]['max_node_mem'][0],
                                                                                          float(self.report_dict[key]['max_node_load'][1]),
                                                                                          self.report_dict[key]['max_node_load'][0])
+          printOverheadReport(rawDataDir(self.args))
+
+
+class LiveTail(object):
+
+      # Follows one raw data file (or the aggregate file) from the offset it
+      # got to on the previous refresh, so every refresh only reads what was
+      # appended since. Returns (node, time, job_mem, node_mem, load, cgroup_mem).
+      def __init__(self, filename, node, node_mem_load_only):
+          self.filename = filename
+          self.node = node
+          self.node_mem_load_only = node_mem_load_only
+          self.aggregate = filename.endswith(RAW_AGGREGATE_FILE)
+          self.binary = self.aggregate or filename.endswith(RAW_BINARY_EXT)
+          self.nodes = []
+          self.reset()
+
+
+      def reset(self):
+          self.offset = 0
+          self.pending = b''
+          if self.binary:
+             self.record_size = RAW_RECORD_SIZE
+             if self.aggregate:
+                self.record_size = RAW_AGGREGATE_SIZE
+
+
+      def read(self):
+          try:
+             size = os.path.getsize(self.filename)
+          except OSError:
+             return []
+          if size < self.offset:
+             self.reset()
+          if size == self.offset:
+             return []
+          f = open(self.filename,'rb')
+          try:
+             f.seek(self.offset)
+             data = f.read(size - self.offset)
+          finally:
+             f.close()
+          if self.offset == 0 and self.binary:
+             if len(data) < RAW_HEADER_SIZE:
+                return []
+             flags = struct.unpack(RAW_HEADER_FORMAT, data[:RAW_HEADER_SIZE])[2]
+             if not self.aggregate:
+                self.node_mem_load_only = flags & RAW_FLAG_NODE_MEM_LOAD_ONLY
+             self.offset = RAW_HEADER_SIZE
+             data = data[RAW_HEADER_SIZE:]
+          self.offset = self.offset + len(data)
+          if self.binary:
+             return self.parse_records(self.pending + data)
+          return self.parse_lines(self.pending + data)
+
+
+      def parse_lines(self, data):
+          samples = []
+          lines = data.split(b'\n')
+          self.pending = lines.pop()
+          for line in lines:
+              row = line.decode().strip().split(',')
+              try:
+                 if self.node_mem_load_only:
+                    samples.append((self.node, float(row[0]), 0.0, float(row[1]), float(row[2]), 0.0))
+                 else:
+                    samples.append((self.node, float(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])))
+              except (IndexError, ValueError):
+                 continue
+          return samples
+
+
+      def parse_records(self, data):
+          samples = []
+          count = len(data) // self.record_size
+          self.pending = data[count * self.record_size:]
+          for i in range(count):
+              if self.aggregate:
+                 record = struct.unpack_from(RAW_AGGREGATE_FORMAT, data, i * self.record_size)
+                 node = self.aggregate_node(record[0])
+                 record = record[1:]
+              else:
+                 record = struct.unpack_from(RAW_RECORD_FORMAT, data, i * self.record_size)
+                 node = self.node
+              samples.append((node, float(record[0]), float(record[1]), float(record[2]), float(record[3]), float(record[4])))
+          return samples
+
+
+      def aggregate_node(self, indx):
+          # The node list only grows, re-read it when a new node shows up
+          if indx >= len(self.nodes):
+             try:
+                f = open(self.filename + RAW_AGGREGATE_NODES_EXT)
+                try:
+                   self.nodes = json.load(f)
+                finally:
+                   f.close()
+             except (IOError, ValueError):
+                pass
+          if indx < len(self.nodes):
+             return str(self.nodes[indx])
+          return 'node%d' % indx
+
+
+def liveMemLimit(args, dir_path):
+    # Per-node cgroup memory limit (KB) that headroom is measured against,
+    # by default the limit of the job's cgroup on this host
+    if args.args.mem_limit:
+       return args.args.mem_limit * 1024.0
+    pbsjobid = os.path.basename(os.path.normpath(dir_path))
+    if not pbsjobid.startswith('job_tracker_'):
+       return None
+    for cgroup_root in CGROUP_MEMORY_ROOTS:
+        try:
+           f = open(os.path.join(cgroup_root, pbsjobid[len('job_tracker_'):], 'memory.limit_in_bytes'))
+           try:
+              limit = int(f.read().strip())
+           finally:
+              f.close()
+        except (IOError, ValueError):
+           continue
+        # an unlimited cgroup reports a value close to 2**63
+        if limit < 2**60:
+           return limit / 1024.0
+    return None
+
+
+class LiveMonitor(object):
+
+      # Redraws a job wide dashboard every --refresh seconds while the job
+      # runs. Only the latest sample of every node is kept, so the cost of a
+      # refresh depends on the new samples and the number of nodes, not on
+      # how long the job has been running.
+      def __init__(self, args):
+          self.dir_path = rawDataDir(args)
+          self.node_mem_load_only = args.args.node_mem_load_only
+          self.top = args.args.top
+          self.mem_limit = liveMemLimit(args, self.dir_path)
+          self.tails = {}
+          self.latest = {}
+          self.totals = [0.0, 0.0, 0.0, 0.0]
+          self.peaks = [0.0, 0.0, 0.0, 0.0]
+          self.tty = sys.stdout.isatty()
+          try:
+             while True:
+                   start = monotonic()
+                   self.refresh()
+                   self.draw()
+                   time.sleep(max(args.args.refresh - (monotonic() - start), 0.0))
+          except KeyboardInterrupt:
+             print("")
+
+
+      def refresh(self):
+          filenames = rawDataFiles(self.dir_path) + [os.path.join(self.dir_path, RAW_AGGREGATE_FILE)]
+          for filename in filenames:
+              if filename not in self.tails and os.path.exists(filename):
+                 self.tails[filename] = LiveTail(filename, os.path.split(filename)[1][:-4], self.node_mem_load_only)
+          samples = []
+          for filename in self.tails:
+              samples.extend(self.tails[filename].read())
+          # replay the new samples in time order so the running totals (and
+          # their peaks) hold the last value of every node, as the aggregator does
+          samples.sort(key=lambda sample: sample[1])
+          for sample in samples:
+              previous = self.latest.get(sample[0])
+              # a node that lost its aggregator shows up in two files
+              if previous is not None and sample[1] < previous[1]:
+                 continue
+              for i in range(len(self.totals)):
+                  self.totals[i] = self.totals[i] + sample[i+2]
+                  if previous is not None:
+                     self.totals[i] = self.totals[i] - previous[i+2]
+                  self.peaks[i] = max(self.peaks[i], self.totals[i])
+              self.latest[sample[0]] = sample
+
+
+      def headroom(self, cgroup_mem):
+          if self.mem_limit is None:
+             return '-'
+          return '%.2f' % to_MB(self.mem_limit - cgroup_mem)
+
+
+      def draw(self):
+          lines = []
+          lines.append('job_tracker live  %s  %s' % (self.dir_path, time.strftime('%Y-%m-%d %H:%M:%S')))
+          if not self.latest:
+             lines.append('')
+             lines.append('waiting for raw job tracking data...')
+          else:
+             newest = max([sample[1] for sample in self.latest.values()])
+             stale = len([sample for sample in self.latest.values() if newest - sample[1] > LIVE_STALE_SECONDS])
+             lines.append('%d nodes, %d without a sample in the last %ds' % (len(self.latest), stale, LIVE_STALE_SECONDS))
+             lines.append('')
+             if not self.node_mem_load_only:
+                lines.append('Total job memory     %12.2fMB   peak %12.2fMB' % (to_MB(self.totals[0]), to_MB(self.peaks[0])))
+             lines.append('Total node memory    %12.2fMB   peak %12.2fMB' % (to_MB(self.totals[1]), to_MB(self.peaks[1])))
+             if not self.node_mem_load_only:
+                line = 'Total cgroup memory  %12.2fMB   peak %12.2fMB' % (to_MB(self.totals[3]), to_MB(self.peaks[3]))
+                if self.mem_limit is not None:
+                   line = line + '   headroom %.2fMB' % to_MB(self.mem_limit * len(self.latest) - self.totals[3])
+                lines.append(line)
+             lines.append('Total load           %12.2f     peak %12.2f' % (self.totals[2], self.peaks[2]))
+             lines.append('')
+             if self.node_mem_load_only:
+                nodes = sorted(self.latest.values(), key=lambda sample: sample[3], reverse=True)[:self.top]
+                lines.append('Top %d nodes by node memory' % len(nodes))
+                lines.append('{0:<15}{1:>18}{2:>12}{3:>10}'.format('Node','Node mem(MB)','Load','Age(s)'))
+                for sample in nodes:
+                    lines.append('{0:<15}{1:>18.2f}{2:>12.2f}{3:>10.1f}'.format(sample[0], to_MB(sample[3]), sample[4], newest - sample[1]))
+             else:
+                nodes = sorted(self.latest.values(), key=lambda sample: sample[2], reverse=True)[:self.top]
+                lines.append('Top %d nodes by job memory' % len(nodes))
+                lines.append('{0:<15}{1:>16}{2:>16}{3:>18}{4:>16}{5:>10}{6:>10}'.format('Node','Job mem(MB)','Node mem(MB)','Cgroup mem(MB)','Headroom(MB)','Load','Age(s)'))
+                for sample in nodes:
+                    lines.append('{0:<15}{1:>16.2f}{2:>16.2f}{3:>18.2f}{4:>16}{5:>10.2f}{6:>10.1f}'.format(sample[0], to_MB(sample[2]), to_MB(sample[3]), to_MB(sample[5]), self.headroom(sample[5]), sample[4], newest - sample[1]))
+          if self.tty:
+             # home the cursor and clear the screen before every frame
+             sys.stdout.write('\033[H\033[2J')
+          else:
+             lines.append('')
+          sys.stdout.write('\n'.join(lines) + '\n')
+          sys.stdout.flush()
+
+
+def jobInfo(dir_path):
+    # What the first host recorded about the job, empty for directories
+    # collected without it
+    try:
+       f = open(os.path.join(dir_path, JOB_INFO_FILE))
+       try:
+          return json.load(f)
+       finally:
+          f.close()
+    except (IOError, ValueError):
+       return {}
+
+
+def import_sqlite3():
+    try:
+       import sqlite3
+    except ImportError:
+       sys.exit("Error: importing sqlite3, check if sqlite3 is available in this version of python")
+    return sqlite3
+
+
+def openJobHistory(args):
+    sqlite3 = import_sqlite3()
+    filename = os.path.join(args.home or os.getcwd(), HISTORY_DB_FILE)
+    if args.args.history_db:
+       filename = args.args.history_db[0]
+    try:
+       db = sqlite3.connect(filename)
+       version = db.execute('PRAGMA user_version').fetchone()[0]
+       if version == 0:
+          for statement in HISTORY_SCHEMA:
+              db.execute(statement)
+          db.execute('PRAGMA user_version = %d' % HISTORY_SCHEMA_VERSION)
+          db.commit()
+          version = HISTORY_SCHEMA_VERSION
+    except sqlite3.DatabaseError as error:
+       sys.exit("Error: could not open the job history (%s): %s" % (filename, error))
+    if version != HISTORY_SCHEMA_VERSION:
+       sys.exit("Error: the job history (%s) was written by another version of job_tracker" % filename)
+    return db
+
+
+def historySince(value):
+    # a date (YYYY-MM-DD) or an age such as 30d or 12h
+    match = re.match('^([0-9.]+)([dh])$', value)
+    if match is not None:
+       return time.time() - float(match.group(1)) * {'d': 86400.0, 'h': 3600.0}[match.group(2)]
+    try:
+       return time.mktime(time.strptime(value, '%Y-%m-%d'))
+    except ValueError:
+       sys.exit("Error: --since takes a date (YYYY-MM-DD) or an age (30d, 12h), not %s" % value)
+
+
+def historyDate(seconds):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(seconds))
+
+
+def historyMB(kb):
+    if kb is None:
+       return '-'
+    return '%.2f' % to_MB(kb)
+
+
+class IngestHistory(object):
+
+      # Reduce every job directory given to --ingest to one row for the job
+      # and one per node in the job history, with the job totals kept at
+      # about HISTORY_SERIES_POINTS points. Ingesting a job again replaces
+      # what was stored for it.
+      def __init__(self, args):
+          self.args = args
+          db = openJobHistory(self.args)
+          count = 0
+          for rawdata in self.args.args.ingest:
+              try:
+                 jobid = self.ingest(db, rawdata)
+              except SystemExit as error:
+                 print("job_tracker: skipping %s (%s)" % (rawdata, error))
+                 continue
+              db.commit()
+              print("Ingested job %s from %s" % (jobid, rawdata))
+              count = count + 1
+          db.close()
+          if not count:
+             sys.exit("Error: no jobs ingested")
+
+
+      def ingest(self, db, rawdata):
+          np = import_numpy()
+          sqlite3 = import_sqlite3()
+          job_args = copy.copy(self.args)
+          job_args.args = copy.copy(self.args.args)
+          job_args.args.rawdata = [rawdata]
+          dir_path = rawDataDir(job_args)
+          info = jobInfo(dir_path)
+          jobid = info.get('pbsjobid')
+          if not jobid:
+             jobid = os.path.basename(os.path.normpath(dir_path))
+             if jobid.startswith('job_tracker_'):
+                jobid = jobid[len('job_tracker_'):]
+          executable = info.get('executable')
+          if executable is None and self.args.args.executable:
+             executable = self.args.args.executable[0]
+          rawdata = RawData(job_args)
+          names = [key[4:] for key in maxMemLoadKeys(self.args.args.node_mem_load_only)]
+          totals = JobTotals(rawdata, names)
+          start = float(rawdata.times()[0])
+          end = max([float(rawdata.series[node]['time'][-1]) for node in rawdata.series])
+          node_types = sorted(set([getComputeNodeType(node) for node in rawdata.series]))
+          job_row = [jobid, info.get('jobname'), executable, ','.join(node_types), dir_path, start, end, end - start, len(rawdata.series)]
+          for name in HISTORY_COLUMNS:
+              if name in totals.totals:
+                 job_row.extend(self.total_peak(rawdata, totals, name))
+              else:
+                 job_row.extend([None, None])
+          # the highest and mean per-node peak, so summaries of many jobs only read the jobs table
+          for name in HISTORY_COLUMNS:
+              if 'max_' + name in maxMemLoadKeys(self.args.args.node_mem_load_only):
+                 peaks = np.array([rawdata.max_mem_load_dict[node]['max_' + name][1] for node in rawdata.series], dtype=np.float64)
+                 job_row.extend([float(peaks.max()), float(peaks.mean())])
+              else:
+                 job_row.extend([None, None])
+          job_row.append(time.time())
+          node_rows = []
+          for node in sorted(rawdata.series):
+              times = rawdata.series[node]['time']
+              row = [jobid, node, getComputeNodeType(node), float(times[0]), float(times[-1])]
+              for name in HISTORY_COLUMNS:
+                  # the maxima are (time, value), the job history keeps value, time
+                  row.extend(reversed(rawdata.max_mem_load_dict[node].get('max_' + name, (None, None))))
+              node_rows.append(row)
+          # the largest total of every bucket, so the peaks survive
+          size = max((len(totals.times) + HISTORY_SERIES_POINTS - 1) // HISTORY_SERIES_POINTS, 1)
+          starts = np.arange(0, len(totals.times), size)
+          series_row = [jobid, sqlite3.Binary(np.asarray(totals.times[starts], dtype=np.float64).tostring())]
+          for name in HISTORY_COLUMNS:
+              if name in totals.totals:
+                 series_row.append(sqlite3.Binary(np.maximum.reduceat(totals.totals[name], starts).astype(np.float64).tostring()))
+              else:
+                 series_row.append(None)
+          db.execute('DELETE FROM nodes WHERE jobid = ?', (jobid,))
+          db.execute('INSERT OR REPLACE INTO jobs VALUES (%s)' % ','.join(['?'] * len(job_row)), job_row)
+          db.executemany('INSERT INTO nodes VALUES (%s)' % ','.join(['?'] * len(node_rows[0])), node_rows)
+          db.execute('INSERT OR REPLACE INTO series VALUES (%s)' % ','.join(['?'] * len(series_row)), series_row)
+          return jobid
+
+
+      def total_peak(self, rawdata, totals, name):
+          # A job total is never below what one of its nodes used at the
+          # same time. A grid that steps over a node's peak (--grid_step,
+          # --align linear) falls back to that node's peak and its time.
+          value, when = totals.peak(name)
+          for node in sorted(rawdata.series):
+              node_time, node_value = rawdata.max_mem_load_dict[node]['max_' + name]
+              if node_value > value:
+                 value = float(node_value)
+                 when = float(rawdata.series[node]['time'][0] - rawdata.times()[0]) + node_time
+          return [value, when]
+
+
+class QueryHistory(object):
+
+      def __init__(self, args):
+          self.args = args
+          db = openJobHistory(self.args)
+          getattr(self, 'print_' + self.args.args.history)(db)
+          db.close()
+
+
+      def filters(self, node_table):
+          # --node_type matches the nodes themselves when listing nodes, and
+          # otherwise the jobs that ran on at least one node of the type
+          where = []
+          params = []
+          if self.args.args.executable:
+             where.append('jobs.executable = ?')
+             params.append(self.args.args.executable[0])
+          if self.args.args.since:
+             where.append('jobs.start_time >= ?')
+             params.append(historySince(self.args.args.since[0]))
+          if self.args.args.jobid:
+             where.append('jobs.jobid = ?')
+             params.append(self.args.args.jobid[0])
+          if self.args.args.node_type:
+             if node_table:
+                where.append('nodes.node_type = ?')
+             else:
+                where.append('EXISTS (SELECT 1 FROM nodes WHERE nodes.jobid = jobs.jobid AND nodes.node_type = ?)')
+             params.append(self.args.args.node_type[0])
+          if not where:
+             return '', params
+          return ' WHERE ' + ' AND '.join(where), params
+
+
+      def limit(self):
+          if self.args.args.limit > 0:
+             return ' LIMIT %d' % self.args.args.limit
+          return ''
+
+
+      def print_jobs(self, db):
+          where, params = self.filters(False)
+          order = {'start': 'start_time', 'duration': 'duration'}.get(self.args.args.sort_by, self.args.args.sort_by)
+          rows = db.execute('SELECT jobid, executable, start_time, duration, nodes, job_mem, node_mem, node_load, cgroup_mem FROM jobs' + where +
+                            ' ORDER BY jobs.%s DESC' % order + self.limit(), params).fetchall()
+          print ("{0:<20}{1:<16}{2:<18}{3:>12}{4:>7}{5:>16}{6:>16}{7:>12}{8:>16}").format("Job","Executable","Start","Duration(s)","Nodes","Job mem(MB)","Node mem(MB)","Load","cgroup mem(MB)")
+          for row in rows:
+              print ("{0:<20}{1:<16}{2:<18}{3:>12.1f}{4:>7}{5:>16}{6:>16}{7:>12.2f}{8:>16}").format(row[0], row[1] or '-', historyDate(row[2]), row[3], row[4],
+                                                                                              historyMB(row[5]), historyMB(row[6]), row[7], historyMB(row[8]))
+
+
+      def print_nodes(self, db):
+          where, params = self.filters(True)
+          order = {'start': 'nodes.start_time', 'duration': 'jobs.duration'}.get(self.args.args.sort_by, 'nodes.' + self.args.args.sort_by)
+          rows = db.execute('SELECT nodes.jobid, jobs.executable, nodes.node, nodes.node_type, nodes.start_time, nodes.job_mem, nodes.node_mem, nodes.node_load, nodes.cgroup_mem'
+                            ' FROM nodes JOIN jobs ON jobs.jobid = nodes.jobid' + where + ' ORDER BY %s DESC' % order + self.limit(), params).fetchall()
+          print ("{0:<20}{1:<16}{2:<15}{3:<11}{4:<18}{5:>16}{6:>16}{7:>12}{8:>16}").format("Job","Executable","Node","Node type","Start","Job mem(MB)","Node mem(MB)","Load","cgroup mem(MB)")
+          for row in rows:
+              print ("{0:<20}{1:<16}{2:<15}{3:<11}{4:<18}{5:>16}{6:>16}{7:>12.2f}{8:>16}").format(row[0], row[1] or '-', row[2], row[3], historyDate(row[4]),
+                                                                                              historyMB(row[5]), historyMB(row[6]), row[7], historyMB(row[8]))
+
+
+      def print_executables(self, db):
+          # the highest and mean per-node peaks of every executable's runs
+          where, params = self.filters(False)
+          order = {'start': 'MAX(start_time)', 'duration': 'MAX(duration)'}.get(self.args.args.sort_by, 'MAX(nodes_%s_max)' % self.args.args.sort_by)
+          rows = db.execute('SELECT executable, COUNT(*), MAX(start_time), MAX(nodes_job_mem_max), SUM(nodes_job_mem_mean * nodes) / SUM(nodes), MAX(nodes_cgroup_mem_max), SUM(nodes_cgroup_mem_mean * nodes) / SUM(nodes), MAX(nodes_node_load_max)'
+                            ' FROM jobs' + where + ' GROUP BY executable ORDER BY %s DESC' % order + self.limit(), params).fetchall()
+          print ("{0:<16}{1:>6}{2:>18}{3:>18}{4:>18}{5:>18}{6:>18}{7:>10}").format("Executable","Runs","Last run","Max job mem(MB)","Mean job mem(MB)","Max cgroup(MB)","Mean cgroup(MB)","Max load")
+          for row in rows:
+              print ("{0:<16}{1:>6}{2:>18}{3:>18}{4:>18}{5:>18}{6:>18}{7:>10.2f}").format(row[0] or '-', row[1], historyDate(row[2]), historyMB(row[3]), historyMB(row[4]),
+                                                                                   historyMB(row[5]), historyMB(row[6]), row[7])
+
+
+      def print_series(self, db):
+          # the downsampled job totals as CSV, time in seconds since the job started
+          np = import_numpy()
+          if not self.args.args.jobid:
+             sys.exit("Error: --history series needs the job (--jobid id)")
+          row = db.execute('SELECT * FROM series WHERE jobid = ?', (self.args.args.jobid[0],)).fetchone()
+          if row is None:
+             sys.exit("Error: job %s is not in the job history" % self.args.args.jobid[0])
+          columns = [np.frombuffer(row[1], dtype=np.float64)]
+          for indx, name in enumerate(HISTORY_COLUMNS):
+              if row[indx + 2] is None:
+                 continue
+              values = np.frombuffer(row[indx + 2], dtype=np.float64)
+              if name != 'node_load':
+                 values = to_MB(values)
+              columns.append(values)
+          print(','.join(['time'] + [name for indx, name in enumerate(HISTORY_COLUMNS) if row[indx + 2] is not None]))
+          for values in zip(*columns):
+              print(','.join(['%.6f' % value for value in values]))
+
+
+def normalQuantile(p):
+    # Acklam's rational approximation of the inverse of the standard normal
+    # distribution function, refined with one step of Halley's method
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549671010336193e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+    if p < 0.02425 or p > 0.97575:
+       q = math.sqrt(-2 * math.log(min(p, 1 - p)))
+       x = (((((c[0]*q + c[1])*q + c[2])*q + c[3])*q + c[4])*q + c[5]) / ((((d[0]*q + d[1])*q + d[2])*q + d[3])*q + 1)
+       if p > 0.5:
+          x = -x
+    else:
+       q = p - 0.5
+       r = q * q
+       x = (((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5])*q / (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1)
+    u = (0.5 * math.erfc(-x / math.sqrt(2)) - p) * math.sqrt(2 * math.pi) * math.exp(x * x / 2)
+    return x - u / (1 + x * u / 2)
+
+
+def jobMemPeaks(job_args):
+    # Runs in a recommendation worker: the per-node peaks of job and cgroup
+    # memory of one job directory and, unless --quick, the peaks of its job
+    # totals. Returns (directory, reason it was skipped or None, peaks).
+    try:
+       dir_path = rawDataDir(job_args)
+       executable = jobInfo(dir_path).get('executable')
+       if job_args.args.executable and executable is not None and executable != job_args.args.executable[0]:
+          return (dir_path, 'job of %s' % executable, None)
+       names = ['job_mem', 'cgroup_mem']
+       totals = None
+       if job_args.args.quick:
+          report_dict = summaryReportDict(dir_path, False)
+       else:
+          cache = None
+          if not job_args.args.no_cache:
+             cache = ReportCache(job_args, ['job_mem','node_mem','node_load','cgroup_mem'])
+          if cache is not None and cache.complete:
+             report_dict = cache.max_mem_load_dict
+             totals = [cache.peak(name)[0] for name in names]
+          else:
+             rawdata = RawData(job_args)
+             report_dict = rawdata.max_mem_load_dict
+             job_totals = JobTotals(rawdata, names)
+             totals = [job_totals.peak(name)[0] for name in names]
+       nodes = [[report_dict[node]['max_' + name][1] for node in report_dict] for name in names]
+       if totals is not None:
+          # a job total is never below what one of its nodes used, as
+          # IngestHistory.total_peak
+          totals = [max(total, max(peaks)) for total, peaks in zip(totals, nodes)]
+       return (dir_path, None, (nodes, totals))
+    except SystemExit as error:
+       return (job_args.args.rawdata[0], str(error), None)
+
+
+class RecommendMem(object):
+
+      # Per-node (and job wide) memory request for the jobs given to
+      # --recommend_mem: the --percentile of the per-node peaks of job
+      # (RSS) and cgroup memory, observed and of a log-normal fitted to
+      # them, whichever is larger, plus --headroom percent
+      def __init__(self, args):
+          self.args = args
+          if not 0 < self.args.args.percentile < 100:
+             sys.exit("Error: --percentile must be between 0 and 100")
+          np = import_numpy()
+          tasks = []
+          for rawdata in self.args.args.recommend_mem:
+              job_args = copy.copy(self.args)
+              job_args.args = copy.copy(self.args.args)
+              job_args.args.rawdata = [rawdata]
+              tasks.append(job_args)
+          workers = min(self.args.args.workers, len(tasks))
+          if workers > 1:
+             # every job is reduced in a single worker
+             for job_args in tasks:
+                 job_args.args.workers = 1
+             pool = multiprocessing.Pool(workers)
+             results = pool.map(jobMemPeaks, tasks, 1)
+             pool.close()
+             pool.join()
+          else:
+             results = [jobMemPeaks(job_args) for job_args in tasks]
+          node_peaks = [[], []]
+          total_peaks = [[], []]
+          for dir_path, skipped, peaks in results:
+              if skipped is not None:
+                 print("job_tracker: skipping %s (%s)" % (dir_path, skipped))
+                 continue
+              for indx in range(2):
+                  node_peaks[indx].extend(peaks[0][indx])
+                  if peaks[1] is not None:
+                     total_peaks[indx].append(peaks[1][indx])
+          jobs = len([result for result in results if result[1] is None])
+          if not jobs:
+             sys.exit("Error: no job tracking data to base a memory request on")
+          self.node_peaks = [np.array(peaks, dtype=np.float64) for peaks in node_peaks]
+          self.total_peaks = [np.array(peaks, dtype=np.float64) for peaks in total_peaks]
+          self.print_recommendation(jobs)
+
+
+      def fit(self, peaks):
+          # (samples, mean, max, observed percentile, log-normal percentile),
+          # zero peaks (no cgroup) are left out, None without any other
+          np = import_numpy()
+          peaks = peaks[peaks > 0]
+          if len(peaks) == 0:
+             return None
+          logs = np.log(peaks)
+          fitted = float(np.exp(logs.mean() + normalQuantile(self.args.args.percentile / 100.0) * logs.std()))
+          return (len(peaks), float(peaks.mean()), float(peaks.max()), float(np.percentile(peaks, self.args.args.percentile)), fitted)
+
+
+      def request(self, fits):
+          fits = [fit for fit in fits if fit is not None]
+          if not fits:
+             return None
+          return int(math.ceil(to_MB(max([max(fit[3], fit[4]) for fit in fits])) * (1 + self.args.args.headroom / 100.0)))
+
+
+      def print_recommendation(self, jobs):
+          executable = 'the jobs'
+          if self.args.args.executable:
+             executable = self.args.args.executable[0]
+          print ("\nMemory request for %s from %d jobs (%d nodes), percentile %g plus %g%% headroom\n" % (executable, jobs, len(self.node_peaks[0]), self.args.args.percentile, self.args.args.headroom))
+          print ("{0:<28}{1:>9}{2:>14}{3:>14}{4:>18}{5:>18}").format("Peak", "Samples", "Mean(MB)", "Max(MB)", "Observed(MB)", "Log-normal(MB)")
+          print ("{0:<28}{1:>9}{2:>14}{3:>14}{4:>18}{5:>18}").format("="*27, "="*8, "="*13, "="*13, "="*17, "="*17)
+          rows = [("Per-node job memory", self.node_peaks[0]), ("Per-node cgroup memory", self.node_peaks[1]),
+                  ("Job total memory", self.total_peaks[0]), ("Job total cgroup memory", self.total_peaks[1])]
+          fits = []
+          for name, peaks in rows:
+              fit = self.fit(peaks)
+              fits.append(fit)
+              if fit is None:
+                 print ("{0:<28}{1:>9}{2:>14}{3:>14}{4:>18}{5:>18}").format(name, 0, "-", "-", "-", "-")
+              else:
+                 print ("{0:<28}{1:>9}{2:>14.2f}{3:>14.2f}{4:>18.2f}{5:>18.2f}").format(name, fit[0], to_MB(fit[1]), to_MB(fit[2]), to_MB(fit[3]), to_MB(fit[4]))
+          node_request = self.request(fits[:2])
+          if node_request is not None:
+             print ("\nRecommended per-node memory request: mem=%dmb" % node_request)
+          total_request = self.request(fits[2:])
+          if total_request is not None:
+             total_request = max(total_request, node_request)
+             print ("Recommended job memory request: mem=%dmb" % total_request)
+          print("")
 
 
 class PlotData(object):
-    
+
       def __init__(self, args):
           self.args = args
           self.plotdata()
@@ -1309,32 +4916,168 @@ class PlotData(object):
               import matplotlib.pyplot as plt
           except ImportError:
               sys.exit("Error: importing matplotlib, check if matplotlib is available in this version of python")
-          for file in self.args.args.plot_data:  
-              x = []
-              y = []
-              f = open(file,'rb')  
-              reader = csv.reader(f)
-              for row in reader:
-                  x.append(row[0])
-                  y.append(row[1])
-              plt.plot(x,y)
-          if re.search('total_node_mem',self.args.args.plot_data[0]) is not None:
-             plt.ylabel("Total Memory Usage (MB)")
-          elif re.search('node_mem',self.args.args.plot_data[0]) is not None:
-             plt.ylabel("Node Memory Usage (MB)")
-          elif re.search('total_job_mem',self.args.args.plot_data[0]) is not None:
-             plt.ylabel("Total Job Memory Usage (MB)")
-          elif re.search('_mem',self.args.args.plot_data[0]) is not None:
-             plt.ylabel("Memory Usage (MB)")
-          elif re.search('total_node_load',self.args.args.plot_data[0]) is not None:
-             plt.ylabel("Total Load")
-          elif re.search('node_layout',self.args.args.plot_data[0]) is not None:
-             plt.ylabel("Physical core ID's")
-          else:
-             plt.ylabel("Node Load")
-          plt.xlabel("Real Time (sec)")
+          plotFigure(plt, self.args.args.plot_data, self.args.args.time_window, self.args.args.width, self.args.args.decimate)
           plt.show()
-          
+
+
+class RenderPlots(object):
+
+      # Plot data and the standard figures of every job directory given to
+      # --render_plots, drawn to files by a pool of workers that are the
+      # only processes importing matplotlib
+      def __init__(self, args):
+          self.args = args
+          tasks = []
+          for rawdata in self.args.args.render_plots:
+              try:
+                 tasks.extend(self.job_figures(rawdata))
+              except SystemExit as error:
+                 print("job_tracker: skipping %s (%s)" % (rawdata, error))
+          if not tasks:
+             sys.exit("Error: no figures to render")
+          pool = multiprocessing.Pool(max(min(self.args.args.workers, len(tasks)), 1))
+          for outfile, error in pool.imap_unordered(renderFigure, tasks):
+              if error is not None:
+                 pool.terminate()
+                 sys.exit(error)
+              print("Rendered %s" % outfile)
+          pool.close()
+          pool.join()
+
+
+      def job_figures(self, rawdata):
+          job_args = copy.copy(self.args)
+          job_args.args = copy.copy(self.args.args)
+          job_args.args.rawdata = [rawdata]
+          plot_dir = os.path.join(rawDataDir(job_args), PLOT_RENDER_DIR)
+          if self.args.args.plot_dir:
+             plot_dir = os.path.join(self.args.args.plot_dir[0], os.path.basename(os.path.normpath(rawdata)))
+          if not os.path.isdir(plot_dir):
+             os.makedirs(plot_dir)
+          prefix = os.path.join(plot_dir, 'job')
+          job_args.args.gen_plot_data = [prefix]
+          GenPlotData(job_args)
+          figures = [('total_job_mem', [prefix + '_total_job_mem.csv']),
+                     ('total_node_mem', [prefix + '_total_node_mem.csv']),
+                     ('total_node_load', [prefix + '_total_node_load.csv']),
+                     ('total_cgroup_mem', [prefix + '_total_cgroup_mem.csv'])]
+          # the nodes with the highest and lowest peak of every column
+          for column in ['job_mem', 'node_mem', 'node_load', 'cgroup_mem']:
+              figures.append(('nodes_' + column, sorted(glob.glob(prefix + '_*_max_' + column + '.csv')) + sorted(glob.glob(prefix + '_*_min_' + column + '.csv'))))
+          figures.append(('node_layout', glob.glob(prefix + '_*_max' + PLOT_LAYOUT_EXT)))
+          title = os.path.basename(os.path.normpath(rawdata))
+          tasks = []
+          for name, files in figures:
+              files = [file for file in files if os.path.exists(file)]
+              if files:
+                 tasks.append((files, os.path.join(plot_dir, name + '.' + self.args.args.plot_format), title, self.args.args.time_window, self.args.args.width, self.args.args.decimate))
+          return tasks
+
+
+def renderFigure(task):
+    # a worker that exits never answers the pool, errors go back with the result
+    files, outfile, title, time_window, width, decimate = task
+    try:
+       import matplotlib
+       matplotlib.use('Agg')
+       import matplotlib.pyplot as plt
+    except ImportError:
+       return outfile, "Error: importing matplotlib, check if matplotlib is available in this version of python"
+    plotFigure(plt, files, time_window, width, decimate)
+    plt.gcf().suptitle(title)
+    plt.savefig(outfile)
+    plt.close('all')
+    return outfile, None
+
+
+def plotFigure(plt, files, time_window, width, decimate):
+    if files[0].endswith(PLOT_LAYOUT_EXT):
+       plotLayout(plt, files[0])
+       return
+    for file in files:
+        plotFile(plt, file, time_window, width, decimate)
+    if len(files) > 1:
+       plt.legend(loc='best', fontsize='small')
+    if time_window:
+       plt.xlim(time_window)
+    if re.search('total_node_mem',files[0]) is not None:
+       plt.ylabel("Total Memory Usage (MB)")
+    elif re.search('node_mem',files[0]) is not None:
+       plt.ylabel("Node Memory Usage (MB)")
+    elif re.search('total_job_mem',files[0]) is not None:
+       plt.ylabel("Total Job Memory Usage (MB)")
+    elif re.search('total_cgroup_mem',files[0]) is not None:
+       plt.ylabel("Total cgroup Memory Usage (MB)")
+    elif re.search('_mem',files[0]) is not None:
+       plt.ylabel("Memory Usage (MB)")
+    elif re.search('total_node_load',files[0]) is not None:
+       plt.ylabel("Total Load")
+    elif re.search('node_layout',files[0]) is not None:
+       plt.ylabel("Physical core ID's")
+    else:
+       plt.ylabel("Node Load")
+    plt.xlabel("Real Time (sec)")
+
+
+def plotFile(plt, file, time_window, width, decimate):
+    # Draw the finest pyramid level that has no more points than width in
+    # the time window, files without one are drawn whole
+    np = import_numpy()
+    label = os.path.basename(file)[:-4]
+    start, end = -np.inf, np.inf
+    if time_window:
+       start, end = time_window
+    if not os.path.exists(file[:-4] + PLOT_PYRAMID_EXT):
+       data = np.loadtxt(file, delimiter=',', ndmin=2)
+       keep = (data[:,0] >= start) & (data[:,0] <= end)
+       plt.plot(data[keep,0], data[keep,1], label=label)
+       return
+    pyramid = np.load(file[:-4] + PLOT_PYRAMID_EXT)
+    level = plotPyramidLevel(pyramid, start, end, width)
+    if level == 0:
+       times = pyramid['time']
+       lo, hi = np.searchsorted(times, start, 'left'), np.searchsorted(times, end, 'right')
+       plt.plot(times[lo:hi], pyramid['value'][lo:hi], label=label)
+    elif decimate == 'lttb' and 'lttb_time%d' % level in pyramid.files:
+       times = pyramid['lttb_time%d' % level]
+       lo, hi = np.searchsorted(times, start, 'left'), np.searchsorted(times, end, 'right')
+       plt.plot(times[lo:hi], pyramid['lttb_value%d' % level][lo:hi], label=label)
+    else:
+       # the mean of every bucket inside the band of its minimum and maximum
+       lo = np.searchsorted(pyramid['end%d' % level], start, 'left')
+       hi = np.searchsorted(pyramid['start%d' % level], end, 'right')
+       times = pyramid['start%d' % level][lo:hi]
+       line = plt.plot(times, pyramid['mean%d' % level][lo:hi], drawstyle='steps-post', label=label)[0]
+       plt.fill_between(times, pyramid['min%d' % level][lo:hi], pyramid['max%d' % level][lo:hi], step='post', color=line.get_color(), alpha=0.3, linewidth=0)
+
+
+def plotLayout(plt, file):
+    np = import_numpy()
+    layout = np.load(file)
+    times = layout['time']
+    occupancy = layout['occupancy']
+    threads = 'core' in layout.files
+    if threads:
+       fig, axes = plt.subplots(2, 1, sharex=True)
+    else:
+       fig, axis = plt.subplots()
+       axes = [axis]
+    # every sample covers the time up to the next one
+    end = times[-1] + 1.0
+    if len(times) > 1:
+       end = times[-1] + times[-1] - times[-2]
+    image = axes[0].imshow(occupancy.T, aspect='auto', origin='lower', interpolation='nearest', cmap='viridis',
+                           extent=(times[0], end, -0.5, occupancy.shape[1] - 0.5))
+    fig.colorbar(image, ax=axes[0]).set_label("Running threads")
+    axes[0].set_ylabel("Physical core ID's")
+    if threads:
+       core = np.ma.masked_less(layout['core'], 0)
+       image = axes[1].imshow(core, aspect='auto', origin='lower', interpolation='nearest', cmap='tab20',
+                              extent=(times[0], end, -0.5, core.shape[0] - 0.5))
+       fig.colorbar(image, ax=axes[1]).set_label("Physical core ID")
+       axes[1].set_ylabel("Threads")
+    axes[-1].set_xlabel("Real Time (sec)")
+
 
 def which(program):
     def is_exe(fpath):
@@ -1359,7 +5102,96 @@ def to_GB(kb):
 
 
 def to_MB(kb):
-    return float(kb)/(1024.0)
+    return kb/(1024.0)
+
+
+def scratchArray(directory, dtype, shape):
+    # zero filled array backed by an unlinked file in directory
+    np = import_numpy()
+    if 0 in shape:
+       return np.zeros(shape, dtype=dtype)
+    return np.memmap(tempfile.TemporaryFile(dir=directory), dtype=dtype, mode='w+', shape=shape)
+
+
+def lttb(times, values, threshold):
+    # Largest-triangle-three-buckets: keeps the first and last sample and
+    # from every bucket in between the sample spanning the largest triangle
+    # with the one kept before it and the mean of the next bucket
+    np = import_numpy()
+    n = len(times)
+    if threshold >= n or threshold < 3:
+       return times, values
+    edges = (np.arange(threshold - 1) * (float(n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    keep = np.zeros(threshold, dtype=np.int64)
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        first, last = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+           next_t, next_v = times[last:edges[i + 2]].mean(), values[last:edges[i + 2]].mean()
+        else:
+           next_t, next_v = times[n - 1], values[n - 1]
+        area = np.abs((times[a] - next_t) * (values[first:last] - values[a]) - (times[a] - times[first:last]) * (next_v - values[a]))
+        a = first + int(area.argmax())
+        keep[i + 1] = a
+    return times[keep], values[keep]
+
+
+def writePlotPyramid(outfile, times, values):
+    # Level 0 is the data itself, every other level has the start and end
+    # time, min, max and mean of its buckets and, up to PLOT_LTTB_MAX_POINTS
+    # buckets, an LTTB selection with one sample per bucket. The levels are
+    # built a stretch at a time in scratch files next to outfile, so a
+    # memory-mapped series is never read in whole.
+    np = import_numpy()
+    scratch = os.path.dirname(os.path.abspath(outfile))
+    pyramid = {'time': times, 'value': values}
+    sizes = [1]
+    buckets = len(times)
+    while buckets > PLOT_PYRAMID_MIN_BUCKETS:
+          size = sizes[-1] * PLOT_PYRAMID_FACTOR
+          level = len(sizes)
+          buckets = (len(times) + size - 1) // size
+          stats = {}
+          for name in ['start', 'end', 'min', 'max', 'mean']:
+              stats[name] = scratchArray(scratch, np.float64, (buckets,))
+          step = size * max(PLOT_STREAM_CHUNK // size, 1)
+          for first in range(0, len(times), step):
+              chunk_times = np.asarray(times[first:first + step], dtype=np.float64)
+              chunk_values = np.asarray(values[first:first + step], dtype=np.float64)
+              starts = np.arange(0, len(chunk_times), size)
+              ends = np.minimum(starts + size, len(chunk_times))
+              out = slice(first // size, first // size + len(starts))
+              stats['start'][out] = chunk_times[starts]
+              stats['end'][out] = chunk_times[ends - 1]
+              stats['min'][out] = np.minimum.reduceat(chunk_values, starts)
+              stats['max'][out] = np.maximum.reduceat(chunk_values, starts)
+              stats['mean'][out] = np.add.reduceat(chunk_values, starts) / (ends - starts)
+          for name in stats:
+              pyramid['%s%d' % (name, level)] = stats[name]
+          if buckets <= PLOT_LTTB_MAX_POINTS:
+             pyramid['lttb_time%d' % level], pyramid['lttb_value%d' % level] = lttb(times, values, buckets)
+          sizes.append(size)
+    pyramid['sizes'] = np.array(sizes, dtype=np.int64)
+    f = open(outfile, 'wb')
+    np.savez(f, **pyramid)
+    f.close()
+
+
+def plotPyramidLevel(pyramid, start, end, width):
+    # counted on the bucket times so the data itself is only read to draw it
+    np = import_numpy()
+    sizes = pyramid['sizes']
+    if len(sizes) == 1:
+       return 0
+    counts = [np.searchsorted(pyramid['start%d' % level], end, 'right') - np.searchsorted(pyramid['end%d' % level], start, 'left') for level in range(1, len(sizes))]
+    if counts[0] * sizes[1] <= width:
+       return 0
+    for level in range(1, len(sizes)):
+        if counts[level - 1] <= width:
+           return level
+    return len(sizes) - 1
 
 def main():
 
@@ -1375,6 +5207,20 @@ def main():
           report = Report2(command_args)
        else:
           report = Report(command_args)
+    elif command_args.args.live:
+       LiveMonitor(command_args)
+    elif command_args.args.convert_rawdata:
+       ConvertRawData(command_args)
+    elif command_args.args.aggregate:
+       Aggregator(command_args)
+    elif command_args.args.recommend_mem:
+       RecommendMem(command_args)
+    elif command_args.args.ingest:
+       IngestHistory(command_args)
+    elif command_args.args.history:
+       QueryHistory(command_args)
+    elif command_args.args.render_plots:
+       RenderPlots(command_args)
     elif command_args.args.gen_plot_data:
        report = GenPlotData(command_args)
     elif command_args.args.plot_data:
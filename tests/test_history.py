@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import sys
+import time
+import StringIO
+
+import numpy
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+
+class JobHistoryTest(TempDirTestCase):
+
+      def setUp(self):
+          TempDirTestCase.setUp(self)
+          self.db = os.path.join(self.tmp, 'history.db')
+
+
+      def ingest(self, *argv):
+          saved = sys.stdout
+          sys.stdout = StringIO.StringIO()
+          try:
+             job_tracker.IngestHistory(commandArgs('--history_db', self.db, '--workers', '1', '--ingest', *argv))
+          finally:
+             sys.stdout = saved
+
+
+      def query(self, *argv):
+          saved = sys.stdout
+          sys.stdout = StringIO.StringIO()
+          try:
+             job_tracker.QueryHistory(commandArgs('--history_db', self.db, '--history', *argv))
+             return sys.stdout.getvalue().splitlines()
+          finally:
+             sys.stdout = saved
+
+
+      def assertTotalsCoverNodes(self, jobid):
+          db = sqlite3.connect(self.db)
+          for name in ['job_mem', 'node_mem', 'cgroup_mem']:
+              total = db.execute('SELECT %s FROM jobs WHERE jobid = ?' % name, (jobid,)).fetchone()[0]
+              node = db.execute('SELECT MAX(%s) FROM nodes WHERE jobid = ?' % name, (jobid,)).fetchone()[0]
+              self.assertGreaterEqual(total, node)
+          db.close()
+
+
+      def test_ingest_job_and_nodes(self):
+          dir_path = self.uneven_job()
+          job_tracker.writeJson(os.path.join(dir_path, job_tracker.JOB_INFO_FILE), {'pbsjobid': '1001.pbs', 'jobname': 'run', 'executable': 'mcnp6'})
+          self.ingest(dir_path)
+          db = sqlite3.connect(self.db)
+          job = db.execute('SELECT executable, nodes, start_time, duration, job_mem, nodes_job_mem_max FROM jobs WHERE jobid = ?', ('1001.pbs',)).fetchone()
+          self.assertEqual(job[:3], ('mcnp6', 3, T0))
+          self.assertAlmostEqual(job[3], 3199.1, places=3)
+          self.assertGreaterEqual(job[4], 900000)
+          self.assertEqual(job[5], 900000)
+          self.assertEqual(db.execute('SELECT COUNT(*) FROM nodes').fetchone()[0], 3)
+          times, job_mem = db.execute('SELECT time, job_mem FROM series').fetchone()
+          job_mem = numpy.frombuffer(job_mem, dtype=numpy.float64)
+          self.assertLessEqual(len(job_mem), job_tracker.HISTORY_SERIES_POINTS)
+          self.assertEqual(len(numpy.frombuffer(times, dtype=numpy.float64)), len(job_mem))
+          self.assertEqual(job_mem.max(), job[4])
+          db.close()
+          self.assertTotalsCoverNodes('1001.pbs')
+
+
+      def test_ingest_again_replaces_job(self):
+          dir_path = self.uneven_job()
+          self.ingest(dir_path, '--executable', 'vasp')
+          self.ingest(dir_path, '--executable', 'vasp')
+          db = sqlite3.connect(self.db)
+          self.assertEqual(db.execute('SELECT jobid, executable FROM jobs').fetchall(), [('1001', 'vasp')])
+          self.assertEqual(db.execute('SELECT COUNT(*) FROM nodes').fetchone()[0], 3)
+          db.close()
+
+
+      def test_total_peak_not_below_node_peak_on_coarse_grid(self):
+          # a one sample spike on n1 falls between the points of a 7s grid
+          dir_path = self.job_dir()
+          writeCsvNode(dir_path, 'n0', [T0 + sample for sample in range(100)], 1000)
+          job_mem = [1000] * 100
+          job_mem[50] = 500000
+          writeCsvNode(dir_path, 'n1', [T0 + sample + 0.5 for sample in range(100)], job_mem)
+          self.ingest(dir_path, '--grid_step', '7')
+          self.assertTotalsCoverNodes('1001')
+          db = sqlite3.connect(self.db)
+          self.assertAlmostEqual(db.execute('SELECT job_mem_time FROM jobs').fetchone()[0], 50.5)
+          db.close()
+
+
+      def test_queries(self):
+          for jobid, executable in [('1', 'mcnp6'), ('2', 'vasp'), ('3', 'mcnp6')]:
+              dir_path = self.job_dir('job_tracker_' + jobid)
+              writeCsvNode(dir_path, 'r1i0n0', [T0 + sample for sample in range(50)], 1024 * int(jobid))
+              job_tracker.writeJson(os.path.join(dir_path, job_tracker.JOB_INFO_FILE), {'pbsjobid': jobid, 'executable': executable})
+              self.ingest(dir_path)
+          lines = self.query('jobs', '--executable', 'mcnp6', '--sort_by', 'job_mem')
+          self.assertEqual([line.split()[0] for line in lines[1:]], ['3', '1'])
+          lines = self.query('executables')
+          self.assertEqual(sorted([(line.split()[0], line.split()[1]) for line in lines[1:]]), [('mcnp6', '2'), ('vasp', '1')])
+          lines = self.query('nodes', '--jobid', '2')
+          self.assertEqual(len(lines), 2)
+          self.assertEqual(lines[1].split()[6], '2.00')
+          self.assertEqual(len(self.query('jobs', '--since', '2000-01-01')), 4)
+          self.assertEqual(len(self.query('jobs', '--since', '1d')), 1)
+          self.assertEqual(self.query('series', '--jobid', '1')[0], 'time,job_mem,node_mem,node_load,cgroup_mem')
+
+
+      def test_since(self):
+          self.assertAlmostEqual(job_tracker.historySince('2d'), time.time() - 2 * 86400, places=0)
+          self.assertEqual(job_tracker.historySince('2020-03-01'), time.mktime((2020, 3, 1, 0, 0, 0, 0, 0, -1)))
+          self.assertRaises(SystemExit, job_tracker.historySince, 'last week')
@@ -0,0 +1,122 @@
+import glob
+import os
+import sys
+import time
+
+from util import commandArgs, job_tracker, ROOT, TempDirTestCase
+
+FAKE_AGENT = '''import os
+import sys
+import time
+args = sys.argv[1:]
+host = args[args.index('--hostname') + 1]
+mode, count_dir = args[0], args[1]
+f = open(os.path.join(count_dir, host), 'a')
+f.write('x')
+f.close()
+attempts = os.path.getsize(os.path.join(count_dir, host))
+if (mode == 'dead' and host == 'h1') or (mode == 'flaky' and attempts == 1):
+   sys.exit(1)
+sys.stdout.write('JT_STATUS %s running\\n' % host)
+sys.stdout.flush()
+if mode == 'hang':
+   time.sleep(60)
+sys.stdout.write('JT_STATUS %s started\\n' % host)
+'''
+
+
+class TreeLauncherTest(TempDirTestCase):
+
+      def launcher(self, agent_cmd, *argv):
+          self.lines = []
+          args = commandArgs('--launch_transport', 'local', *argv).args
+          return job_tracker.TreeLauncher(agent_cmd, args, self.lines.append)
+
+
+      def fake(self, mode):
+          script = os.path.join(self.tmp, 'fake_agent.py')
+          f = open(script, 'w')
+          f.write(FAKE_AGENT)
+          f.close()
+          self.counts = os.path.join(self.tmp, 'counts')
+          if not os.path.isdir(self.counts):
+             os.mkdir(self.counts)
+          return '%s %s %s %s' % (sys.executable, script, mode, self.counts)
+
+
+      def attempts(self, host):
+          filename = os.path.join(self.counts, host)
+          if not os.path.exists(filename):
+             return 0
+          return os.path.getsize(filename)
+
+
+      def test_agents_over_local_transport(self):
+          directory = self.job_dir('job_tracker_77')
+          hosts = ['h%d' % indx for indx in range(1, 8)]
+          cmd = '%s %s --pbsjobid 77 --exe_pattern no_such_executable_zz --collect --cwd %s --collection_time 1 --interval 0.2 --launch_transport local --fanout 2' % (sys.executable, os.path.join(ROOT, 'job_tracker.py'), self.tmp)
+          launcher = self.launcher(cmd, '--fanout', '2', '--launch_timeout', '60')
+          launcher.launch(hosts)
+          self.assertEqual(sorted(launcher.started), hosts)
+          self.assertEqual(launcher.failed, [])
+          # every agent reports running before its subtree and started after it
+          for host in hosts:
+              running = self.lines.index('JT_STATUS %s running' % host)
+              self.assertTrue(running < self.lines.index('JT_STATUS %s started' % host))
+          deadline = time.time() + 20
+          while time.time() < deadline and len(glob.glob(os.path.join(directory, 'h*.csv'))) < len(hosts):
+                time.sleep(0.2)
+          self.assertEqual(sorted([os.path.basename(file)[:-4] for file in glob.glob(os.path.join(directory, 'h*.csv'))]), hosts)
+          time.sleep(2)
+
+
+      def test_retry_before_agent_reports(self):
+          launcher = self.launcher(self.fake('flaky'), '--fanout', '1', '--launch_retries', '1')
+          launcher.launch(['h1'])
+          self.assertEqual(launcher.started, ['h1'])
+          self.assertEqual(self.attempts('h1'), 2)
+
+
+      def test_next_host_takes_over_when_head_never_reports(self):
+          launcher = self.launcher(self.fake('dead'), '--fanout', '1', '--launch_retries', '0')
+          launcher.launch(['h1', 'h2'])
+          self.assertEqual(launcher.failed, ['h1'])
+          self.assertEqual(launcher.started, ['h2'])
+          self.assertEqual(self.attempts('h1'), 1)
+
+
+      def test_no_retry_once_agent_reported_running(self):
+          # the hung agent may still be starting h2, so neither it nor h2 is started again
+          launcher = self.launcher(self.fake('hang'), '--fanout', '1', '--launch_retries', '2', '--launch_timeout', '1')
+          start = time.time()
+          launcher.launch(['h1', 'h2'])
+          self.assertTrue(time.time() - start < 30)
+          self.assertEqual(launcher.failed, ['h1'])
+          self.assertEqual(launcher.started, [])
+          self.assertEqual(self.attempts('h1'), 1)
+          self.assertEqual(self.attempts('h2'), 0)
+          self.assertTrue('JT_STATUS h1 timeout' in self.lines)
+
+
+      def test_start_does_not_wait_for_the_tree(self):
+          launcher = self.launcher(self.fake('hang'), '--fanout', '1', '--launch_retries', '0', '--launch_timeout', '2')
+          finished = []
+          start = time.time()
+          thread = launcher.start(['h1'], lambda: finished.append(time.time()))
+          self.assertTrue(time.time() - start < 1.0)
+          self.assertEqual(finished, [])
+          thread.join(30)
+          self.assertEqual(len(finished), 1)
+          self.assertTrue(finished[0] - start >= 2.0)
+          self.assertEqual(launcher.failed, ['h1'])
+
+
+      def test_retry_when_transport_cannot_start(self):
+          class MissingTransport(object):
+                def command(self, host, cmd):
+                    return ['/nonexistent/job_tracker_ssh', host, cmd]
+          launcher = self.launcher('agent', '--fanout', '1', '--launch_retries', '1')
+          launcher.transport = MissingTransport()
+          launcher.launch(['h1'])
+          self.assertEqual(launcher.failed, ['h1'])
+          self.assertEqual(len([line for line in self.lines if line.startswith('h1: ')]), 2)
@@ -0,0 +1,85 @@
+import os
+import unittest
+import urllib2
+
+from util import job_tracker, T0
+
+
+class FakeLayout(object):
+
+      def __init__(self, wall_time, running):
+          self.summary = [wall_time, 8, sum(running.values()), len(running), 0, 0, 0, 0]
+          self.running = running
+
+
+def scrape(exporter, path='/metrics'):
+    port = exporter.server.server_address[1]
+    return urllib2.urlopen('http://127.0.0.1:%d%s' % (port, path), timeout=5).read()
+
+
+def runningThreads(text):
+    cores = {}
+    for line in text.splitlines():
+        if line.startswith(job_tracker.METRICS_PREFIX + 'running_threads{'):
+           labels, value = line.rsplit(' ', 1)
+           cores[int(labels.split('core="')[1].split('"')[0])] = int(value)
+    return cores
+
+
+class MetricsExporterTest(unittest.TestCase):
+
+      def exporter(self, layout=None):
+          exporter = job_tracker.MetricsExporter(0, '1001.pbs', 'r1i0n0', False, layout)
+          self.addCleanup(exporter.close)
+          return exporter
+
+
+      def test_scrape_before_first_sample(self):
+          exporter = self.exporter()
+          self.assertEqual(scrape(exporter), b'# EOF\n')
+
+
+      def test_scrape_other_path(self):
+          exporter = self.exporter()
+          with self.assertRaises(urllib2.HTTPError) as cm:
+               scrape(exporter, '/other')
+          self.assertEqual(cm.exception.code, 404)
+
+
+      def test_scrape_full_layout(self):
+          exporter = self.exporter()
+          exporter.update([T0, 2048, 4096, 1.5, 1024, 100.0, 1.0, '11', 0, '12', 0, '13', 3])
+          text = scrape(exporter)
+          self.assertTrue(text.endswith('# EOF\n'))
+          self.assertIn('%sjob_rss_bytes{pbs_jobid="1001.pbs",host="r1i0n0"} 2097152' % job_tracker.METRICS_PREFIX, text)
+          self.assertIn('%snode_load1{pbs_jobid="1001.pbs",host="r1i0n0"} 1.5' % job_tracker.METRICS_PREFIX, text)
+          self.assertEqual(runningThreads(text), {0: 2, 3: 1})
+
+
+      def test_scrape_summary_layout(self):
+          # --task_layout summary leaves no tid,core pairs in the row
+          exporter = self.exporter(FakeLayout(T0, {1: 2, 5: 1}))
+          exporter.update([T0, 2048, 4096, 1.5, 1024, 100.0, 1.0])
+          self.assertEqual(runningThreads(scrape(exporter)), {1: 2, 5: 1})
+
+
+      def test_stale_summary_is_not_exported(self):
+          # the layout was not sampled for this row (overhead budget exceeded)
+          exporter = self.exporter(FakeLayout(T0 - 1.0, {1: 2}))
+          exporter.update([T0, 2048, 4096, 1.5, 1024, 100.0, 1.0])
+          self.assertEqual(runningThreads(scrape(exporter)), {})
+
+
+      def test_task_layout_sample(self):
+          layout = job_tracker.TaskLayout(8)
+          self.addCleanup(layout.close)
+          layout.sample([str(os.getpid())], True, T0)
+          exporter = self.exporter(layout)
+          exporter.update([T0, 2048, 4096, 1.5, 1024, 100.0, 1.0])
+          cores = runningThreads(scrape(exporter))
+          self.assertEqual(cores, layout.running)
+          self.assertEqual(sum(cores.values()), layout.summary[2])
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,71 @@
+import os
+
+from util import job_tracker, TempDirTestCase
+
+
+class FakeAgent(object):
+
+      def __init__(self):
+          self.task_layout = True
+
+
+class OverheadMonitorTest(TempDirTestCase):
+
+      def setUp(self):
+          TempDirTestCase.setUp(self)
+          # a fake clock: samples take no time, the collector uses a given
+          # share of every interval
+          self.now = 1000.0
+          self.cpu = 0.0
+          saved = job_tracker.monotonic
+          job_tracker.monotonic = lambda: self.now
+          self.addCleanup(setattr, job_tracker, 'monotonic', saved)
+          self.agent = FakeAgent()
+          self.monitor = job_tracker.OverheadMonitor(os.path.join(self.tmp, 'r1i0n0' + job_tracker.RAW_OVERHEAD_EXT), self.agent, 5.0, 8.0)
+          self.monitor.cpu_time = lambda: self.cpu
+          self.addCleanup(self.monitor.close)
+          self.interval = 1.0
+
+
+      def run_samples(self, overhead, count):
+          # as the collection loop does with a fixed --interval 1
+          intervals = []
+          for sample in range(count):
+              self.monitor.start()
+              self.now = self.now + self.interval
+              self.cpu = self.cpu + overhead / 100.0 * self.interval
+              self.monitor.finish(self.interval)
+              self.interval = max(1.0, self.monitor.floor)
+              intervals.append(self.interval)
+          return intervals
+
+
+      def changes(self, intervals):
+          return [interval for indx, interval in enumerate(intervals) if indx == 0 or interval != intervals[indx - 1]]
+
+
+      def test_under_budget_changes_nothing(self):
+          self.assertEqual(self.changes(self.run_samples(2.0, 50)), [1.0])
+          self.assertTrue(self.agent.task_layout)
+
+
+      def test_interval_grows_over_budget_and_recovers_under_it(self):
+          intervals = self.run_samples(20.0, 60)
+          self.assertFalse(self.agent.task_layout)
+          self.assertEqual(self.changes(intervals), [1.0, 2.0, 4.0, 8.0])
+          # already at --max_interval
+          self.assertEqual(intervals[-10:], [8.0] * 10)
+          intervals = self.run_samples(1.0, 60)
+          self.assertEqual(self.changes(intervals), [8.0, 4.0, 2.0, 1.0])
+          self.assertEqual(self.monitor.floor, 0.0)
+          # the task layout is not taken up again
+          self.assertFalse(self.agent.task_layout)
+
+
+      def test_no_recovery_near_budget(self):
+          self.run_samples(20.0, 30)
+          floor = self.monitor.floor
+          self.assertTrue(floor > 1.0)
+          # under the budget but not under half of it
+          self.run_samples(4.0, 60)
+          self.assertEqual(self.monitor.floor, floor)
@@ -0,0 +1,55 @@
+import os
+
+import numpy
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+NAMES = ['job_mem', 'node_mem', 'node_load', 'cgroup_mem']
+
+
+class GenPlotDataTest(TempDirTestCase):
+
+      def assertTotalsMatch(self, dir_path, *argv):
+          # the totals streamed by --gen_plot_data against RawData/JobTotals
+          prefix = os.path.join(self.tmp, 'plot')
+          job_tracker.GenPlotData(commandArgs('--rawdata', dir_path, '--gen_plot_data', prefix, '--workers', '1', *argv))
+          rawdata = job_tracker.RawData(commandArgs('--rawdata', dir_path, '--workers', '1', *argv))
+          totals = job_tracker.JobTotals(rawdata, NAMES)
+          for name in NAMES:
+              data = numpy.loadtxt(prefix + '_total_' + name + '.csv', delimiter=',', ndmin=2)
+              expected = totals.totals[name]
+              if name != 'node_load':
+                 expected = job_tracker.to_MB(expected)
+              numpy.testing.assert_allclose(data[:,0], totals.times, atol=1e-6)
+              numpy.testing.assert_allclose(data[:,1], expected, atol=1e-5)
+
+
+      def test_totals_of_nodes_ending_after_primary(self):
+          self.assertTotalsMatch(self.uneven_job())
+
+
+      def test_totals_on_grid_step(self):
+          self.assertTotalsMatch(self.uneven_job(), '--grid_step', '0.7')
+
+
+      def test_totals_linear_alignment(self):
+          self.assertTotalsMatch(self.uneven_job(), '--align', 'linear')
+
+
+      def test_totals_follow_node_sampling_next(self):
+          dir_path = self.job_dir()
+          writeCsvNode(dir_path, 'n0', [T0 + sample for sample in range(5000)], 100)
+          writeCsvNode(dir_path, 'n1', [T0 + sample + 0.25 for sample in range(6000)], 200)
+          writeCsvNode(dir_path, 'n2', [T0 + sample + 0.5 for sample in range(9000)], 300)
+          self.assertTotalsMatch(dir_path)
+
+
+      def test_total_cgroup_mem(self):
+          dir_path = self.job_dir()
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1']):
+              samples = range(1000 + indx * 300)
+              writeCsvNode(dir_path, node, [T0 + sample + indx * 0.5 for sample in samples], 100000, cgroup_mem=[300000 + indx * 1000 + sample for sample in samples])
+          self.assertTotalsMatch(dir_path)
+          data = numpy.loadtxt(os.path.join(self.tmp, 'plot_total_cgroup_mem.csv'), delimiter=',', ndmin=2)
+          # only r1i0n1 is left at the end
+          self.assertAlmostEqual(data[-1,1], job_tracker.to_MB(301000 + 1299), places=5)
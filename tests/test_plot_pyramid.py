@@ -0,0 +1,99 @@
+import os
+import unittest
+
+import numpy
+
+from util import job_tracker, TempDirTestCase
+
+
+def series(count, seed=7):
+    random = numpy.random.RandomState(seed)
+    times = numpy.cumsum(random.uniform(0.5, 1.5, count))
+    values = random.normal(1000.0, 50.0, count)
+    return times, values
+
+
+class LttbTest(unittest.TestCase):
+
+      def test_short_series_is_kept(self):
+          times, values = series(10)
+          for threshold in [2, 10, 11]:
+              kept_times, kept_values = job_tracker.lttb(times, values, threshold)
+              numpy.testing.assert_array_equal(kept_times, times)
+              numpy.testing.assert_array_equal(kept_values, values)
+
+
+      def test_one_sample_per_bucket(self):
+          times, values = series(10000)
+          kept_times, kept_values = job_tracker.lttb(times, values, 100)
+          self.assertEqual(len(kept_times), 100)
+          self.assertEqual(kept_times[0], times[0])
+          self.assertEqual(kept_times[-1], times[-1])
+          self.assertTrue((numpy.diff(kept_times) > 0).all())
+          indx = numpy.searchsorted(times, kept_times)
+          numpy.testing.assert_array_equal(values[indx], kept_values)
+          # the inner samples come one from each of the 98 buckets
+          edges = (numpy.arange(99) * (9998.0 / 98)).astype(numpy.int64) + 1
+          edges[-1] = 9999
+          numpy.testing.assert_array_equal(numpy.searchsorted(edges, indx[1:-1], 'right') - 1, numpy.arange(98))
+
+
+      def test_spike_is_kept(self):
+          times = numpy.arange(5000, dtype=numpy.float64)
+          values = numpy.ones(5000)
+          values[3217] = 50.0
+          kept_times, kept_values = job_tracker.lttb(times, values, 50)
+          self.assertIn(3217.0, list(kept_times))
+          self.assertEqual(kept_values.max(), 50.0)
+
+
+class PlotPyramidTest(TempDirTestCase):
+
+      def pyramid(self, times, values):
+          outfile = os.path.join(self.tmp, 'plot' + job_tracker.PLOT_PYRAMID_EXT)
+          job_tracker.writePlotPyramid(outfile, times, values)
+          return numpy.load(outfile)
+
+
+      def test_levels_match_buckets(self):
+          # not a multiple of any bucket size and more than one stream chunk
+          times, values = series(3 * job_tracker.PLOT_STREAM_CHUNK + 1234)
+          pyramid = self.pyramid(times, values)
+          sizes = list(pyramid['sizes'])
+          self.assertEqual(sizes, [job_tracker.PLOT_PYRAMID_FACTOR ** level for level in range(len(sizes))])
+          self.assertTrue((len(times) + sizes[-1] - 1) // sizes[-1] <= job_tracker.PLOT_PYRAMID_MIN_BUCKETS)
+          numpy.testing.assert_array_equal(pyramid['time'], times)
+          for level in range(1, len(sizes)):
+              size = sizes[level]
+              starts = numpy.arange(0, len(times), size)
+              self.assertEqual(len(pyramid['start%d' % level]), len(starts))
+              numpy.testing.assert_array_equal(pyramid['start%d' % level], times[starts])
+              numpy.testing.assert_array_equal(pyramid['end%d' % level], times[numpy.minimum(starts + size, len(times)) - 1])
+              numpy.testing.assert_allclose(pyramid['min%d' % level], [values[first:first + size].min() for first in starts])
+              numpy.testing.assert_allclose(pyramid['max%d' % level], [values[first:first + size].max() for first in starts])
+              numpy.testing.assert_allclose(pyramid['mean%d' % level], [values[first:first + size].mean() for first in starts])
+              self.assertEqual(len(pyramid['lttb_time%d' % level]), len(starts))
+
+
+      def test_short_series_has_one_level(self):
+          times, values = series(job_tracker.PLOT_PYRAMID_MIN_BUCKETS)
+          pyramid = self.pyramid(times, values)
+          self.assertEqual(list(pyramid['sizes']), [1])
+          self.assertEqual(job_tracker.plotPyramidLevel(pyramid, times[0], times[-1], 10), 0)
+
+
+      def test_level_fits_width(self):
+          times, values = series(100000)
+          pyramid = self.pyramid(times, values)
+          self.assertEqual(job_tracker.plotPyramidLevel(pyramid, times[0], times[-1], len(times)), 0)
+          for width in [300, 1000, 5000, 30000]:
+              level = job_tracker.plotPyramidLevel(pyramid, times[0], times[-1], width)
+              self.assertTrue(level > 0)
+              self.assertTrue(len(pyramid['start%d' % level]) <= width)
+              if level > 1:
+                 # the finer level would not have fit
+                 self.assertTrue(len(pyramid['start%d' % (level - 1)]) > width)
+          # a window of the data needs a finer level than all of it
+          start, end = times[50000], times[51000]
+          self.assertEqual(job_tracker.plotPyramidLevel(pyramid, start, end, 2000), 0)
+          self.assertTrue(job_tracker.plotPyramidLevel(pyramid, start, end, 300) < job_tracker.plotPyramidLevel(pyramid, times[0], times[-1], 300))
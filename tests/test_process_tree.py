@@ -0,0 +1,102 @@
+import os
+import re
+import threading
+import unittest
+
+from util import commandArgs, job_tracker, TempDirTestCase
+
+
+class FakeSampler(object):
+
+      # processes as pid -> (comm, ppid, args)
+      def __init__(self, processes, cgroup=None):
+          self.processes = processes
+          self.cgroup = cgroup
+
+
+      def listCgroupPids(self):
+          return self.cgroup
+
+
+      def listPids(self):
+          return sorted(self.processes, key=int)
+
+
+      def getProcessStatus(self, pid):
+          if pid not in self.processes:
+             return None
+          return (self.processes[pid][0], self.processes[pid][1], pid)
+
+
+      def getProcessArgs(self, pid):
+          return self.processes[pid][2]
+
+
+class JobProcessTreeTest(unittest.TestCase):
+
+      def tree(self, sampler, root_pids=None, exe_pattern=None):
+          tree = job_tracker.JobProcessTree(sampler, root_pids, exe_pattern)
+          tree.tracker_pid = '200'
+          tree.update()
+          return tree
+
+
+      def test_tracker_attached_to_job_cgroup_is_excluded(self):
+          # pbs_attach (a member) starts the agent, which starts ssh and an aggregator
+          processes = {'100': ('bash', '1', 'bash job.sh'), '101': ('mpirun', '100', 'mpirun mcnp6'), '102': ('mcnp6', '101', 'mcnp6 i=inp'),
+                       '150': ('pbs_attach', '100', 'pbs_attach job_tracker.py'), '200': ('python2', '150', 'python2 job_tracker.py'),
+                       '201': ('ssh', '200', 'ssh r1i0n1'), '202': ('python2', '200', 'python2 job_tracker.py --aggregate')}
+          tree = self.tree(FakeSampler(processes, sorted(processes, key=int)))
+          self.assertEqual(tree.jobPids(), ['102'])
+          self.assertEqual(tree.excluded, set(['200', '201', '202']))
+
+
+      def test_executable_started_by_tracker_is_member(self):
+          processes = {'1': ('init', '0', 'init'), '200': ('python2', '1', 'python2 job_tracker.py'), '210': ('sh', '200', '/bin/sh -c mcnp6'),
+                       '211': ('mcnp6', '210', 'mcnp6 i=inp'), '220': ('ssh', '200', 'ssh r1i0n1')}
+          tree = self.tree(FakeSampler(processes), root_pids=['210'])
+          self.assertEqual(tree.jobPids(), ['211'])
+          self.assertTrue('220' in tree.excluded)
+
+
+      def test_pattern_match_and_children(self):
+          processes = {'1': ('init', '0', 'init'), '300': ('mcnp6', '1', 'mcnp6 i=inp'), '301': ('mcnp6', '300', 'mcnp6 worker'),
+                       '400': ('vi', '1', 'vi notes'), '200': ('python2', '1', 'python2 job_tracker.py --exe_pattern mcnp6')}
+          tree = self.tree(FakeSampler(processes), exe_pattern=re.compile('mcnp6'))
+          self.assertEqual(tree.jobPids(), ['300', '301'])
+          processes['302'] = ('mcnp6', '301', 'mcnp6 worker')
+          del processes['301']
+          tree.update()
+          self.assertEqual(tree.jobPids(), ['300', '302'])
+
+
+      def test_rescan_ticks_at_least_one(self):
+          self.assertEqual(commandArgs('--rescan_ticks', '1').args.rescan_ticks, 1)
+          for ticks in ['0', '-3']:
+              with self.assertRaises(SystemExit) as cm:
+                   commandArgs('--rescan_ticks', ticks)
+              self.assertEqual(str(cm.exception), 'Error: --rescan_ticks must be at least 1')
+
+
+class ProcSamplerTest(TempDirTestCase):
+
+      def test_cgroup_tasks_lists_processes_once(self):
+          # an old cgroup without cgroup.procs, its tasks file lists threads
+          cgroup_dir = os.path.join(self.tmp, '1001.pbs')
+          os.mkdir(cgroup_dir)
+          open(os.path.join(cgroup_dir, 'memory.usage_in_bytes'), 'w').write('4096\n')
+          saved = job_tracker.CGROUP_MEMORY_ROOTS
+          job_tracker.CGROUP_MEMORY_ROOTS = [self.tmp]
+          self.addCleanup(setattr, job_tracker, 'CGROUP_MEMORY_ROOTS', saved)
+          release = threading.Event()
+          thread = threading.Thread(target=release.wait, args=(10,))
+          thread.start()
+          try:
+             tids = sorted(os.listdir('/proc/self/task'), key=int)
+             self.assertTrue(len(tids) >= 2)
+             open(os.path.join(cgroup_dir, 'tasks'), 'w').write('\n'.join(tids) + '\n')
+             sampler = job_tracker.ProcSampler('1001.pbs')
+             self.assertEqual(sampler.listCgroupPids(), [str(os.getpid())])
+          finally:
+             release.set()
+             thread.join()
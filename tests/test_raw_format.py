@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+from util import commandArgs, job_tracker, ROOT, TempDirTestCase, T0
+
+LAYOUTS = [[], [101, 0], [101, 0], [101, 0, 7000, 3], [101, 0, 7000, 3], [101, 0, 7000, 3],
+           [101, 1, 7000, 3, 123456, 63], [], [101, 2]]
+
+
+class RawFormatTest(TempDirTestCase):
+
+      def write_binary(self, layouts):
+          filename = os.path.join(self.job_dir(), 'r1i0n0' + job_tracker.RAW_BINARY_EXT)
+          writer = job_tracker.BinaryRawWriter(filename)
+          for indx, layout in enumerate(layouts):
+              writer.writerow([T0 + indx, 1000, 2000, 1.0, 0, 100.0 + indx, 1.0] + layout)
+          writer.close()
+          return filename
+
+
+      def read_layouts(self, filename, read_size):
+          saved = job_tracker.RAW_LAYOUT_READ_SIZE
+          job_tracker.RAW_LAYOUT_READ_SIZE = read_size
+          try:
+             return [list(layout) for layout in job_tracker.readRawLayouts(filename[:-4] + job_tracker.RAW_LAYOUT_EXT)]
+          finally:
+             job_tracker.RAW_LAYOUT_READ_SIZE = saved
+
+
+      def test_layouts_across_read_blocks(self):
+          layouts = LAYOUTS + [[tid, tid % 64] for tid in range(1000, 1400)] + [range(200000, 200600)]
+          filename = self.write_binary(layouts)
+          expected = [list(layout) for layout in layouts]
+          for read_size in [1, 3, 7, 64, 65536]:
+              self.assertEqual(self.read_layouts(filename, read_size), expected)
+
+
+      def test_layout_entry_being_written_is_dropped(self):
+          filename = self.write_binary(LAYOUTS)
+          f = open(filename[:-4] + job_tracker.RAW_LAYOUT_EXT, 'ab')
+          # four pairs announced, one and a half written
+          f.write(b'\x08\x05\x01\x02')
+          f.close()
+          self.assertEqual(self.read_layouts(filename, 3), LAYOUTS)
+
+
+      def test_convert_legacy_rows(self):
+          dir_path = self.job_dir()
+          f = open(os.path.join(dir_path, 'r1i0n0.csv'), 'w')
+          for sample, delay in enumerate([0.0, 1.0, 2.5, 3.0]):
+              f.write('%.6f,%d,%d,%.2f,%d,%d,%d\n' % (T0 + delay, 1000 + sample, 2000, 1.5, 0, 4000 + sample, sample % 4))
+          f.close()
+          job_tracker.ConvertRawData(commandArgs('--convert_rawdata', '--rawdata', dir_path))
+          rows = list(job_tracker.readRawRows(os.path.join(dir_path, 'r1i0n0' + job_tracker.RAW_BINARY_EXT)))
+          self.assertEqual([row[0] - T0 for row in rows], [0.0, 1.0, 2.5, 3.0])
+          self.assertEqual([row[0] for row in rows], [row[5] for row in rows])
+          self.assertEqual([round(row[6], 6) for row in rows], [1.0, 1.5, 0.5, 0.5])
+          self.assertEqual([row[1] for row in rows], [1000, 1001, 1002, 1003])
+          self.assertEqual([list(row[job_tracker.RAW_LAYOUT_START:]) for row in rows], [[4000 + sample, sample] for sample in range(4)])
+
+
+      def test_layout_start(self):
+          # legacy rows without and with running threads
+          self.assertEqual(job_tracker.rawLayoutStart(['1700000000.0', '1000', '2000', '0.5', '0']), job_tracker.LEGACY_RAW_LAYOUT_START)
+          self.assertEqual(job_tracker.rawLayoutStart(['1700000000.0', '1000', '2000', '0.5', '0', '4000', '1']), job_tracker.LEGACY_RAW_LAYOUT_START)
+          # current rows, the monotonic time does not need a '.'
+          self.assertEqual(job_tracker.rawLayoutStart(['1700000000.0', '1000', '2000', '0.5', '0', '100.5', '1.0']), job_tracker.RAW_LAYOUT_START)
+          self.assertEqual(job_tracker.rawLayoutStart(['1700000000.0', '1000', '2000', '0.5', '0', '1e+16', '1.0', '4000', '1']), job_tracker.RAW_LAYOUT_START)
+          self.assertEqual(job_tracker.rawLayoutStart([1700000000.0, 1000, 2000, 0.5, 0, 100.0, 1.0]), job_tracker.RAW_LAYOUT_START)
+
+
+      def test_legacy_rows_without_threads(self):
+          dir_path = self.job_dir()
+          f = open(os.path.join(dir_path, 'r1i0n0.csv'), 'w')
+          f.write('%.1f,1000,2000,0.50,0\n%.1f,1001,2000,0.50,0,4000,1\n%.1f,1002,2000,0.50,0\n' % (T0, T0 + 1, T0 + 2))
+          f.close()
+          series = job_tracker.loadCsvRawSeries(os.path.join(dir_path, 'r1i0n0.csv'), False)
+          self.assertEqual(list(series['job_mem']), [1000, 1001, 1002])
+          self.assertEqual(list(series['mono_time']), list(series['time']))
+          job_tracker.ConvertRawData(commandArgs('--convert_rawdata', '--rawdata', dir_path))
+          rows = list(job_tracker.readRawRows(os.path.join(dir_path, 'r1i0n0' + job_tracker.RAW_BINARY_EXT)))
+          self.assertEqual([row[1] for row in rows], [1000, 1001, 1002])
+          self.assertEqual([list(row[job_tracker.RAW_LAYOUT_START:]) for row in rows], [[], [4000, 1], []])
+
+
+      def test_rows_record_next_interval(self):
+          # flat values back --adaptive off 0.1, 0.2, 0.4, 0.8s
+          dir_path = self.job_dir('job_tracker_77')
+          agent = subprocess.Popen([sys.executable, os.path.join(ROOT, 'job_tracker.py'), '--pbsjobid', '77', '--exe_pattern', 'no_such_executable_zz', '--collect',
+                                    '--cwd', self.tmp, '--collection_time', '2', '--interval', '0.1', '--adaptive', '--max_interval', '0.8', '--sensitivity', '1000',
+                                    '--hostname', 'h1'], stdin=open(os.devnull), stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+          self.assertEqual(agent.wait(), 0)
+          files = job_tracker.rawDataFiles(dir_path)
+          self.assertEqual(len(files), 1)
+          rows = list(job_tracker.readRawRows(files[0]))
+          self.assertTrue(len(rows) >= 5)
+          for indx in range(len(rows) - 1):
+              self.assertAlmostEqual(float(rows[indx][6]), float(rows[indx + 1][5]) - float(rows[indx][5]), delta=0.05)
+          self.assertAlmostEqual(float(rows[-1][6]), 0.8, places=6)
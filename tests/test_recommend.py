@@ -0,0 +1,100 @@
+import math
+import os
+import re
+import sys
+import StringIO
+
+import numpy
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+
+class NormalQuantileTest(TempDirTestCase):
+
+      def test_known_values(self):
+          for p, z in [(0.5, 0.0), (0.9, 1.2815515655), (0.95, 1.6448536270), (0.975, 1.9599639845), (0.99, 2.3263478740), (0.001, -3.0902323062), (0.9999, 3.7190164855)]:
+              self.assertAlmostEqual(job_tracker.normalQuantile(p), z, places=7)
+
+
+      def test_symmetry(self):
+          for p in [0.01, 0.02, 0.1, 0.3]:
+              self.assertAlmostEqual(job_tracker.normalQuantile(p), -job_tracker.normalQuantile(1 - p), places=9)
+
+
+class RecommendMemTest(TempDirTestCase):
+
+      def recommend(self, *argv):
+          saved = sys.stdout
+          sys.stdout = StringIO.StringIO()
+          try:
+             job_tracker.RecommendMem(commandArgs('--workers', '1', '--recommend_mem', *argv))
+             return sys.stdout.getvalue()
+          finally:
+             sys.stdout = saved
+
+
+      def requests(self, output):
+          node = re.search('per-node memory request: mem=(\\d+)mb', output)
+          job = re.search('job memory request: mem=(\\d+)mb', output)
+          return int(node.group(1)), job and int(job.group(1))
+
+
+      def test_fit(self):
+          recommend = object.__new__(job_tracker.RecommendMem)
+          recommend.args = commandArgs('--percentile', '90')
+          numpy.random.seed(7)
+          peaks = numpy.exp(numpy.random.normal(10.0, 0.5, 20000))
+          samples, mean, peak, observed, fitted = recommend.fit(numpy.concatenate((peaks, numpy.zeros(10))))
+          self.assertEqual(samples, 20000)
+          self.assertAlmostEqual(peak, peaks.max())
+          self.assertAlmostEqual(observed, numpy.percentile(peaks, 90))
+          logs = numpy.log(peaks)
+          self.assertAlmostEqual(fitted / math.exp(logs.mean() + 1.2815515655 * logs.std()), 1.0, places=9)
+          self.assertAlmostEqual(fitted / math.exp(10.0 + 0.5 * 1.2815515655), 1.0, places=1)
+          self.assertTrue(recommend.fit(numpy.zeros(5)) is None)
+
+
+      def test_request_adds_headroom(self):
+          recommend = object.__new__(job_tracker.RecommendMem)
+          recommend.args = commandArgs('--headroom', '25')
+          self.assertEqual(recommend.request([(3, 0, 0, 1024 * 100.0, 1024 * 80.0), None]), 125)
+          self.assertTrue(recommend.request([None, None]) is None)
+
+
+      def test_job_request_covers_node_peaks(self):
+          dir_path = self.uneven_job()
+          node, job = self.requests(self.recommend(dir_path, '--headroom', '0'))
+          self.assertGreaterEqual(node, 878)
+          self.assertGreaterEqual(job, 878)
+          node, job = self.requests(self.recommend(dir_path, '--headroom', '0', '--grid_step', '13'))
+          self.assertGreaterEqual(job, node)
+
+
+      def test_percentile_over_jobs(self):
+          dirs = []
+          for jobid in range(1, 21):
+              dir_path = self.job_dir('job_tracker_%d' % jobid)
+              writeCsvNode(dir_path, 'n0', [T0 + sample for sample in range(20)], 1024 * 10 * jobid)
+              writeCsvNode(dir_path, 'n1', [T0 + sample for sample in range(20)], 1024 * 5 * jobid)
+              dirs.append(dir_path)
+          output = self.recommend(*(dirs + ['--percentile', '50', '--headroom', '10']))
+          self.assertTrue('from 20 jobs (40 nodes)' in output)
+          peaks = numpy.array([10 * jobid for jobid in range(1, 21)] + [5 * jobid for jobid in range(1, 21)], dtype=numpy.float64)
+          logs = numpy.log(peaks)
+          expected = max(numpy.percentile(peaks, 50), math.exp(logs.mean()))
+          self.assertEqual(self.requests(output)[0], int(math.ceil(expected * 1.1)))
+          quick = self.recommend(*(dirs + ['--percentile', '50', '--headroom', '10', '--quick']))
+          self.assertEqual(self.requests(quick), (self.requests(output)[0], None))
+
+
+      def test_skips_other_executables(self):
+          dirs = []
+          for jobid, executable in [(1, 'mcnp6'), (2, 'vasp'), (3, None)]:
+              dir_path = self.job_dir('job_tracker_%d' % jobid)
+              writeCsvNode(dir_path, 'n0', [T0 + sample for sample in range(20)], 1024)
+              if executable is not None:
+                 job_tracker.writeJson(os.path.join(dir_path, job_tracker.JOB_INFO_FILE), {'pbsjobid': str(jobid), 'executable': executable})
+              dirs.append(dir_path)
+          output = self.recommend(*(dirs + ['--executable', 'mcnp6']))
+          self.assertTrue('skipping %s (job of vasp)' % dirs[1] in output)
+          self.assertTrue('from 2 jobs' in output)
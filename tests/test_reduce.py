@@ -0,0 +1,146 @@
+import csv
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+NAMES = ['job_mem', 'node_mem', 'node_load', 'cgroup_mem']
+
+
+class ReduceTest(TempDirTestCase):
+
+      def root(self, stream='unix', bucket=1.0):
+          # the root of the tree publishes into self.published
+          self.published = []
+          listener, address = job_tracker.listenSocket(stream, self.tmp, 'root')
+          root = job_tracker.Reducer('root', bucket, publish=lambda partial, width: self.published.append(partial), listener=listener)
+          thread = threading.Thread(target=root.run, args=(1.0,))
+          thread.start()
+          return thread, address
+
+
+      def test_reset_source_does_not_stop_reducer(self):
+          thread, address = self.root('tcp')
+          port = int(address.rsplit(':', 1)[1])
+          sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+          sock.connect(('127.0.0.1', port))
+          sock.sendall(b'JTR')
+          # close with a reset, as the kernel does for a killed agent
+          sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+          sock.close()
+          child = job_tracker.Reducer('c1', 1.0, parent_address='127.0.0.1:%d' % port)
+          child.start()
+          for sample in range(5):
+              child.add_sample([T0 + sample, 1000 + sample, 2000, 1.0, 0])
+          child.close()
+          thread.join(30)
+          self.assertFalse(thread.is_alive())
+          self.assertEqual([partial[2][0] for partial in self.published], [1000.0 + sample for sample in range(5)])
+
+
+      def test_sample_not_blocked_by_send(self):
+          sending = threading.Event()
+          release = threading.Event()
+          def publish(partial, width):
+              sending.set()
+              release.wait(10)
+          reducer = job_tracker.Reducer('root', 1.0, publish=publish)
+          reducer.add_sample([T0, 1000, 2000, 1.0, 0])
+          reducer.add_sample([T0 + 1, 1000, 2000, 1.0, 0])
+          thread = threading.Thread(target=reducer.step, args=(True,))
+          thread.start()
+          self.assertTrue(sending.wait(10))
+          added = threading.Event()
+          sampler = threading.Thread(target=lambda: (reducer.add_sample([T0 + 2, 1000, 2000, 1.0, 0]), added.set()))
+          sampler.start()
+          try:
+             self.assertTrue(added.wait(2))
+          finally:
+             release.set()
+             thread.join()
+             sampler.join()
+
+
+      def test_parent_reached_later(self):
+          saved = job_tracker.REDUCE_RETRY
+          job_tracker.REDUCE_RETRY = 0.2
+          self.addCleanup(setattr, job_tracker, 'REDUCE_RETRY', saved)
+          address = 'unix:' + os.path.join(self.tmp, 'root.sock')
+          child = job_tracker.Reducer('c1', 1.0, parent_address=address)
+          child.start()
+          for sample in range(3):
+              child.add_sample([T0 + sample, 1000 + sample, 2000, 1.0, 0])
+          # the first buckets cannot be sent until the root is up
+          time.sleep(0.5)
+          thread, root_address = self.root()
+          self.assertEqual(root_address, address)
+          for sample in range(3, 6):
+              child.add_sample([T0 + sample, 1000 + sample, 2000, 1.0, 0])
+          child.close()
+          thread.join(30)
+          self.assertEqual([partial[2][0] for partial in self.published], [1000.0 + sample for sample in range(6)])
+
+
+      def test_two_level_reduction_matches_job_totals(self):
+          # n1 and n2 report to n0, n0 and n3 to the root; n1 misses two
+          # samples, which the reduction holds from its last one
+          random = numpy.random.RandomState(3)
+          samples = {}
+          dir_path = self.job_dir()
+          for node in ['n0', 'n1', 'n2', 'n3']:
+              kept = [sample for sample in range(40) if node != 'n1' or sample not in (10, 11)]
+              job_mem = random.randint(100000, 900000, len(kept)).tolist()
+              node_mem = random.randint(1000000, 4000000, len(kept)).tolist()
+              node_load = (random.randint(0, 64, len(kept)) * 0.25).tolist()
+              cgroup_mem = random.randint(100000, 900000, len(kept)).tolist()
+              times = [T0 + sample for sample in kept]
+              writeCsvNode(dir_path, node, times, job_mem, node_mem, node_load, cgroup_mem)
+              samples[node] = [[times[i], job_mem[i], node_mem[i], node_load[i], cgroup_mem[i]] for i in range(len(kept))]
+          published = []
+          totals = job_tracker.ReducedTotals(self.tmp)
+          def publish(partial, width):
+              published.append(partial)
+              totals.publish(partial, width)
+          root = job_tracker.Reducer('root', 1.0, publish=publish)
+          interior = job_tracker.Reducer('n0', 1.0, publish=lambda partial, width: root.add_partial('n0', partial))
+          leaves = {'n1': job_tracker.Reducer('n1', 1.0, publish=lambda partial, width: interior.add_partial('n1', partial)),
+                    'n2': job_tracker.Reducer('n2', 1.0, publish=lambda partial, width: interior.add_partial('n2', partial)),
+                    'n3': job_tracker.Reducer('n3', 1.0, publish=lambda partial, width: root.add_partial('n3', partial))}
+          for node in ['n1', 'n2', 'n3']:
+              for record in samples[node]:
+                  leaves[node].add_sample(record)
+              leaves[node].close()
+          for record in samples['n0']:
+              interior.add_sample(record)
+          interior.close()
+          root.close()
+          totals.close()
+
+          rawdata = job_tracker.RawData(commandArgs('--rawdata', dir_path, '--workers', '1'))
+          expected = job_tracker.JobTotals(rawdata, NAMES)
+          self.assertEqual([partial[0] for partial in published], list(range(int(T0), int(T0) + 40)))
+          self.assertEqual([partial[1] for partial in published], [4] * 40)
+          for indx, name in enumerate(NAMES):
+              numpy.testing.assert_allclose([partial[2][indx] for partial in published], expected.totals[name])
+              columns = numpy.array([rawdata.column(node, name) for node in sorted(samples)])
+              numpy.testing.assert_allclose([partial[3][indx] for partial in published], columns.max(axis=0))
+          nodes = numpy.array(sorted(samples))[numpy.array([rawdata.column(node, 'job_mem') for node in sorted(samples)]).argmax(axis=0)]
+          self.assertEqual([partial[4][0] for partial in published], list(nodes))
+
+          f = open(os.path.join(self.tmp, job_tracker.RAW_REDUCED_FILE))
+          rows = list(csv.reader(f))
+          f.close()
+          numpy.testing.assert_allclose([float(row[2]) for row in rows], expected.totals['job_mem'])
+          f = open(os.path.join(self.tmp, job_tracker.RAW_AGGREGATE_FILE + job_tracker.RAW_AGGREGATE_TOTALS_EXT))
+          reduced = json.load(f)
+          f.close()
+          for name in NAMES:
+              value, offset = expected.peak(name)
+              self.assertAlmostEqual(reduced['peaks'][name][0], value, places=6)
+              self.assertAlmostEqual(reduced['peaks'][name][1] - T0, offset, places=6)
@@ -0,0 +1,61 @@
+import os
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+NAMES = ['job_mem', 'node_mem', 'node_load', 'cgroup_mem']
+
+
+class ReportCacheTest(TempDirTestCase):
+
+      def assertMatchesRawData(self, dir_path, *argv):
+          args = commandArgs('--rawdata', dir_path, '--workers', '1', *argv)
+          cache = job_tracker.ReportCache(args, NAMES)
+          self.assertTrue(cache.complete)
+          rawdata = job_tracker.RawData(args)
+          totals = job_tracker.JobTotals(rawdata, NAMES)
+          for name in NAMES:
+              self.assertAlmostEqual(cache.peak(name)[0], totals.peak(name)[0], places=3)
+              self.assertAlmostEqual(cache.peak(name)[1], totals.peak(name)[1], places=6)
+          self.assertEqual(cache.max_mem_load_dict, rawdata.max_mem_load_dict)
+          return cache
+
+
+      def write_job(self, dir_path, first, last, mode='w'):
+          # rows first..last of three nodes, job memory rising on r1i0n2
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1', 'r1i0n2']):
+              samples = range(first, last)
+              job_mem = [100000 + indx * sample for sample in samples]
+              writeCsvNode(dir_path, node, [T0 + sample + indx * 0.1 for sample in samples], job_mem, node_load=[0.5 + indx] * len(samples), mode=mode)
+
+
+      def test_matches_rawdata(self):
+          dir_path = self.job_dir()
+          self.write_job(dir_path, 0, 500)
+          self.assertMatchesRawData(dir_path)
+          self.assertTrue(os.path.exists(os.path.join(dir_path, job_tracker.REPORT_CACHE_FILE)))
+
+
+      def test_resumes_after_data_is_appended(self):
+          dir_path = self.job_dir()
+          self.write_job(dir_path, 0, 300)
+          first = self.assertMatchesRawData(dir_path)
+          self.assertGreater(first.state['grid_done'], 0)
+          self.write_job(dir_path, 300, 700, 'a')
+          resumed = self.assertMatchesRawData(dir_path)
+          self.assertGreater(resumed.state['grid_done'], first.state['grid_done'])
+          os.remove(os.path.join(dir_path, job_tracker.REPORT_CACHE_FILE))
+          fresh = job_tracker.ReportCache(commandArgs('--rawdata', dir_path, '--workers', '1'), NAMES)
+          self.assertEqual(fresh.peaks, resumed.peaks)
+
+
+      def test_grid_step(self):
+          dir_path = self.job_dir()
+          self.write_job(dir_path, 0, 400)
+          self.assertMatchesRawData(dir_path, '--grid_step', '0.5')
+          self.write_job(dir_path, 400, 600, 'a')
+          self.assertMatchesRawData(dir_path, '--grid_step', '0.5')
+
+
+      def test_nodes_ending_after_primary(self):
+          cache = self.assertMatchesRawData(self.uneven_job())
+          self.assertGreaterEqual(cache.peak('job_mem')[0], 900000)
@@ -0,0 +1,146 @@
+import os
+import socket
+import struct
+import subprocess
+import sys
+import json
+import time
+
+from util import commandArgs, job_tracker, ROOT, TempDirTestCase, T0, writeCsvNode
+
+
+def sampleRow(time, job_mem, node_mem=4000000, node_load=1.0, cgroup_mem=0):
+    return [time, job_mem, node_mem, node_load, cgroup_mem, time - T0 + 100.0, 1.0]
+
+
+class StreamTest(TempDirTestCase):
+
+      def start_aggregator(self, stream, *argv):
+          # as startAggregator() does, the aggregator reports its address and
+          # exits a --launch_timeout after its last agent went away
+          self.directory = self.job_dir('job_tracker_77')
+          cmd = [sys.executable, os.path.join(ROOT, 'job_tracker.py'), '--aggregate', '--pbsjobid', '77', '--cwd', self.tmp, '--stream', stream, '--launch_timeout', '1'] + list(argv)
+          self.aggregator = subprocess.Popen(cmd, stdin=open(os.devnull), stdout=subprocess.PIPE)
+          fields = self.aggregator.stdout.readline().split()
+          self.aggregator.stdout.close()
+          self.assertEqual(fields[0], job_tracker.AGGREGATOR_STATUS)
+          return fields[1]
+
+
+      def wait_aggregator(self):
+          deadline = time.time() + 30
+          while self.aggregator.poll() is None and time.time() < deadline:
+                time.sleep(0.1)
+          if self.aggregator.poll() is None:
+             self.aggregator.kill()
+          self.assertEqual(self.aggregator.wait(), 0)
+
+
+      def writer(self, address, host, batch=1):
+          args = commandArgs('--stream_batch', str(batch)).args
+          fallback = os.path.join(self.tmp, host + '.csv')
+          return job_tracker.StreamRawWriter(address, host, args, lambda: job_tracker.CsvRawWriter(fallback))
+
+
+      def test_agent_reset_does_not_stop_aggregator(self):
+          address = self.start_aggregator('tcp')
+          family, sock_address = job_tracker.streamAddress(address)
+          sock = socket.socket(family, socket.SOCK_STREAM)
+          sock.connect(('127.0.0.1', sock_address[1]))
+          sock.sendall(struct.pack(job_tracker.STREAM_HEADER_FORMAT, job_tracker.STREAM_MAGIC, 2, 5) + b'n9')
+          # close with a reset, as the kernel does for a killed agent
+          sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+          sock.close()
+          time.sleep(0.5)
+          writer = self.writer('127.0.0.1:%d' % sock_address[1], 'n0')
+          for sample in range(5):
+              writer.writerow(sampleRow(T0 + sample, 1000 + sample))
+          writer.close()
+          self.wait_aggregator()
+          series = job_tracker.loadAggregateSeries(self.directory)
+          self.assertEqual(sorted(series), ['n0'])
+          self.assertEqual(list(series['n0']['job_mem']), [1000, 1001, 1002, 1003, 1004])
+
+
+      def test_totals_in_sample_time_order(self):
+          # r1i0n1 is high until sample 9, r1i0n0 from sample 11 on, so the
+          # two are never high at once; taken in arrival order the second
+          # batch of r1i0n0 meets the last (high) sample of r1i0n1's first
+          address = self.start_aggregator('unix')
+          samples = range(30)
+          job_mem = {'r1i0n0': [500000 if sample >= 11 else 100000 for sample in samples],
+                     'r1i0n1': [500000 if sample <= 9 else 100000 for sample in samples]}
+          times = {'r1i0n0': [T0 + sample for sample in samples], 'r1i0n1': [T0 + sample + 0.5 for sample in samples]}
+          writers = {}
+          for node in ['r1i0n0', 'r1i0n1']:
+              writers[node] = self.writer(address, node, batch=10)
+          for first in range(0, 30, 10):
+              for node in ['r1i0n0', 'r1i0n1']:
+                  for sample in samples[first:first + 10]:
+                      writers[node].writerow(sampleRow(times[node][sample], job_mem[node][sample]))
+                  time.sleep(0.2)
+          for node in writers:
+              writers[node].close()
+          self.wait_aggregator()
+          f = open(os.path.join(self.directory, job_tracker.RAW_AGGREGATE_FILE + job_tracker.RAW_AGGREGATE_TOTALS_EXT))
+          totals = json.load(f)
+          f.close()
+          dir_path = self.job_dir()
+          for node in job_mem:
+              writeCsvNode(dir_path, node, times[node], job_mem[node])
+          expected = job_tracker.JobTotals(job_tracker.RawData(commandArgs('--rawdata', dir_path, '--workers', '1')), ['job_mem', 'node_mem'])
+          self.assertEqual(totals['peaks']['job_mem'][0], expected.peak('job_mem')[0])
+          self.assertEqual(totals['peaks']['job_mem'][0], 600000)
+          self.assertEqual(totals['peaks']['node_mem'][0], expected.peak('node_mem')[0])
+          self.assertEqual(totals['time'], times['r1i0n1'][-1])
+          self.assertEqual(totals['totals']['job_mem'], 600000)
+
+
+      def test_round_trip_over_unix_socket(self):
+          address = self.start_aggregator('unix')
+          # a real agent streaming its samples ...
+          agent = subprocess.Popen([sys.executable, os.path.join(ROOT, 'job_tracker.py'), '--pbsjobid', '77', '--exe_pattern', 'no_such_executable_zz', '--collect',
+                                    '--cwd', self.tmp, '--collection_time', '1', '--interval', '0.2', '--stream_batch', '2', '--hostname', 'h1', '--aggregator', address],
+                                   stdin=open(os.devnull), stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+          # ... and two written here, with every column known
+          rows = {}
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1']):
+              rows[node] = [sampleRow(T0 + sample + indx * 0.1, 1000 * (indx + 1) + sample, 4000000 + sample, 0.5 + sample, 300 + sample) for sample in range(7)]
+              writer = self.writer(address, node, batch=3)
+              for row in rows[node]:
+                  writer.writerow(row)
+              writer.close()
+          self.assertEqual(agent.wait(), 0)
+          self.wait_aggregator()
+          series = job_tracker.loadAggregateSeries(self.directory)
+          self.assertEqual(sorted(series), ['h1', 'r1i0n0', 'r1i0n1'])
+          self.assertTrue(len(series['h1']) >= 3)
+          self.assertFalse(os.path.exists(os.path.join(self.directory, 'h1.csv')))
+          for node in rows:
+              for indx, name in enumerate(['time', 'job_mem', 'node_mem', 'node_load', 'cgroup_mem', 'mono_time', 'interval']):
+                  self.assertEqual(list(series[node][name]), [row[indx] for row in rows[node]])
+
+
+      def test_fallback_when_aggregator_unreachable(self):
+          writer = self.writer('unix:' + os.path.join(self.tmp, 'no_such.sock'), 'r1i0n0', batch=3)
+          rows = [sampleRow(T0 + sample, 1000 + sample) for sample in range(5)]
+          for row in rows:
+              writer.writerow(row)
+          writer.close()
+          written = list(job_tracker.readCsvRawRows(os.path.join(self.tmp, 'r1i0n0.csv')))
+          self.assertEqual([int(row[1]) for row in written], [row[1] for row in rows])
+          self.assertEqual([float(row[0]) for row in written], [row[0] for row in rows])
+
+
+      def test_fallback_keeps_buffered_samples(self):
+          # the aggregator goes away while samples wait for a full batch
+          listener, address = job_tracker.listenSocket('unix', self.tmp, 'gone')
+          writer = self.writer(address, 'r1i0n0', batch=100)
+          listener.accept()[0].close()
+          listener.close()
+          rows = [sampleRow(T0 + sample, 1000 + sample) for sample in range(5)]
+          for row in rows:
+              writer.writerow(row)
+          writer.close()
+          written = list(job_tracker.readCsvRawRows(os.path.join(self.tmp, 'r1i0n0.csv')))
+          self.assertEqual([int(row[1]) for row in written], [row[1] for row in rows])
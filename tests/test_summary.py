@@ -0,0 +1,59 @@
+import os
+
+import numpy
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+
+class RawSummaryTest(TempDirTestCase):
+
+      def write_node(self, writer, seed, count, indx):
+          # peaks repeat, so the first sample reaching each one has to win
+          random = numpy.random.RandomState(seed)
+          job_mem = random.randint(100000, 110000, count)
+          node_mem = random.randint(1000000, 1000100, count)
+          node_load = random.randint(0, 20, count) * 0.1
+          cgroup_mem = random.randint(100000, 100050, count)
+          for sample in range(count):
+              time = T0 + sample * 0.7 + indx * 0.1
+              writer.writerow([time, int(job_mem[sample]), int(node_mem[sample]), round(float(node_load[sample]), 2), int(cgroup_mem[sample]), time - T0 + 100.0, 0.7])
+          writer.close()
+
+
+      def assertMatchesRawData(self, dir_path, *argv):
+          args = commandArgs('--rawdata', dir_path, '--workers', '1', *argv)
+          quick = job_tracker.summaryReportDict(dir_path, args.args.node_mem_load_only)
+          self.assertEqual(quick, job_tracker.RawData(args).max_mem_load_dict)
+
+
+      def test_sidecars_match_rawdata(self):
+          dir_path = self.job_dir()
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1', 'r1i0n2']):
+              self.write_node(job_tracker.CsvRawWriter(os.path.join(dir_path, node + '.csv')), indx, 3000 + indx * 7, indx)
+          for indx, node in enumerate(['r1i0n3', 'r1i0n4']):
+              self.write_node(job_tracker.BinaryRawWriter(os.path.join(dir_path, node + job_tracker.RAW_BINARY_EXT)), 10 + indx, 2000 + indx * 3, indx)
+          for file in job_tracker.rawDataFiles(dir_path):
+              self.assertTrue(job_tracker.readRawSummary(file) is not None)
+          self.assertMatchesRawData(dir_path)
+
+
+      def test_node_mem_load_only(self):
+          dir_path = self.job_dir()
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1']):
+              writer = job_tracker.CsvRawWriter(os.path.join(dir_path, node + '.csv'), True)
+              random = numpy.random.RandomState(indx)
+              for sample in range(500):
+                  writer.writerow([T0 + sample, int(random.randint(1000000, 1000100)), round(float(random.randint(0, 20) * 0.1), 2), T0 + sample, 1.0])
+              writer.close()
+          self.assertMatchesRawData(dir_path, '--node_mem_load_only')
+
+
+      def test_missing_and_stale_sidecars_fall_back(self):
+          dir_path = self.job_dir()
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1', 'r1i0n2']):
+              self.write_node(job_tracker.CsvRawWriter(os.path.join(dir_path, node + '.csv')), indx, 1000, indx)
+          os.remove(os.path.join(dir_path, 'r1i0n0.csv' + job_tracker.RAW_SUMMARY_EXT))
+          # rows the sidecar of r1i0n1 has not seen, with a new job memory peak
+          writeCsvNode(dir_path, 'r1i0n1', [T0 + 1000 + sample for sample in range(5)], 900000, mode='a')
+          self.assertTrue(job_tracker.readRawSummary(os.path.join(dir_path, 'r1i0n1.csv')) is None)
+          self.assertMatchesRawData(dir_path)
@@ -0,0 +1,77 @@
+import os
+
+from util import job_tracker, TempDirTestCase, T0
+
+
+class TaskLayoutTest(TempDirTestCase):
+
+      def write_thread(self, pid, tid, state, core):
+          # fields after the state field, the processor TASK_STAT_PROCESSOR of them on
+          task_dir = os.path.join(self.tmp, pid, 'task', tid)
+          if not os.path.isdir(task_dir):
+             os.makedirs(task_dir)
+          fields = [state] + ['0'] * 40
+          fields[job_tracker.TASK_STAT_PROCESSOR] = str(core)
+          f = open(os.path.join(task_dir, 'stat'), 'w')
+          f.write('%s (a.out (rank 0)) %s\n' % (tid, ' '.join(fields)))
+          f.close()
+
+
+      def job(self):
+          # 100: 100 running on core 0, 101 running on 0, 102 sleeping on 1
+          # 200: 200 running on 2, 201 sleeping on 3
+          for pid, tid, state, core in [('100', '100', 'R', 0), ('100', '101', 'R', 0), ('100', '102', 'S', 1), ('200', '200', 'R', 2), ('200', '201', 'S', 3)]:
+              self.write_thread(pid, tid, state, core)
+          layout = job_tracker.TaskLayout(8, proc=self.tmp)
+          self.addCleanup(layout.close)
+          return layout
+
+
+      def test_summary(self):
+          layout = self.job()
+          pairs = layout.sample(['100', '200'], True, T0)
+          self.assertEqual(sorted(zip(pairs[0::2], pairs[1::2])), [('100', 0), ('101', 0), ('200', 2)])
+          # time, threads, running, busy cores, oversubscribed, idle, most on one core, migrations
+          self.assertEqual(layout.summary, [T0, 5, 3, 2, 1, 6, 2, 0])
+          self.assertEqual(layout.running, {0: 2, 2: 1})
+
+
+      def test_migrations(self):
+          layout = self.job()
+          layout.sample(['100', '200'], True, T0)
+          self.write_thread('100', '101', 'R', 4)
+          self.write_thread('200', '201', 'S', 5)
+          layout.sample(['100', '200'], False, T0 + 1)
+          self.assertEqual(layout.summary, [T0 + 1, 5, 3, 3, 0, 5, 1, 2])
+          # a thread that moves back counts again, one that stays does not
+          self.write_thread('100', '101', 'R', 0)
+          layout.sample(['100', '200'], False, T0 + 2)
+          self.assertEqual(layout.summary[7], 1)
+
+
+      def test_open_stat_files_are_capped(self):
+          layout = self.job()
+          layout.max_open = 2
+          layout.sample(['100', '200'], True, T0)
+          self.assertEqual(len(layout.stat), 2)
+          self.assertEqual(layout.summary, [T0, 5, 3, 2, 1, 6, 2, 0])
+          self.assertTrue(layout.capped)
+          # threads read per sample still see their changes
+          for pid, tid in [('100', '100'), ('100', '101'), ('100', '102'), ('200', '200'), ('200', '201')]:
+              self.write_thread(pid, tid, 'R', 7)
+          layout.sample(['100', '200'], False, T0 + 1)
+          self.assertEqual(len(layout.stat), 2)
+          self.assertEqual(layout.running, {7: 5})
+          self.assertEqual(layout.summary[7], 5)
+
+
+      def test_exited_thread_frees_its_file(self):
+          layout = self.job()
+          layout.max_open = 2
+          layout.sample(['100', '200'], True, T0)
+          cached = sorted(layout.stat)
+          os.remove(os.path.join(self.tmp, '100', 'task', cached[0], 'stat'))
+          os.rmdir(os.path.join(self.tmp, '100', 'task', cached[0]))
+          layout.sample(['100', '200'], True, T0 + 1)
+          self.assertEqual(len(layout.stat), 2)
+          self.assertEqual(layout.summary[1], 4)
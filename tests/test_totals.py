@@ -0,0 +1,58 @@
+import numpy
+
+from util import commandArgs, job_tracker, TempDirTestCase, T0, writeCsvNode
+
+
+class JobTotalsTest(TempDirTestCase):
+
+      def rawdata(self, dir_path, *argv):
+          return job_tracker.RawData(commandArgs('--rawdata', dir_path, '--workers', '1', *argv))
+
+
+      def test_grid_covers_nodes_ending_after_primary(self):
+          rawdata = self.rawdata(self.uneven_job())
+          self.assertEqual(rawdata.primary_node, 'r1i0n0')
+          self.assertAlmostEqual(rawdata.times()[-1], T0 + 3199.1)
+          totals = job_tracker.JobTotals(rawdata, ['job_mem'])
+          node_peak = max([rawdata.max_mem_load_dict[node]['max_job_mem'][1] for node in rawdata.max_mem_load_dict])
+          self.assertGreaterEqual(totals.peak('job_mem')[0], node_peak)
+          self.assertEqual(totals.totals['job_mem'][-1], 900000)
+
+
+      def test_grid_follows_node_sampling_next(self):
+          # the primary stops first, n1 takes over and stops before n2
+          dir_path = self.job_dir()
+          writeCsvNode(dir_path, 'n0', [T0 + sample for sample in range(10)], 100)
+          writeCsvNode(dir_path, 'n1', [T0 + sample + 0.25 for sample in range(15)], 200)
+          writeCsvNode(dir_path, 'n2', [T0 + sample + 0.5 for sample in range(20)], 300)
+          grid = self.rawdata(dir_path).times() - T0
+          expected = list(range(10)) + [sample + 0.25 for sample in range(9, 15)] + [sample + 0.5 for sample in range(14, 20)]
+          numpy.testing.assert_allclose(grid, expected)
+
+
+      def test_last_sample_held_for_next_interval(self):
+          # n1 backs off to 2s and then 4s, its last sample stays valid 4s
+          dir_path = self.job_dir()
+          writeCsvNode(dir_path, 'n0', [T0 + sample for sample in range(12)], 100)
+          writeCsvNode(dir_path, 'n1', [T0, T0 + 1], 200, interval=[1.0, 2.0])
+          writeCsvNode(dir_path, 'n1', [T0 + 3], 200, interval=4.0, mode='a')
+          column = self.rawdata(dir_path).column('n1', 'job_mem')
+          numpy.testing.assert_array_equal(column, [200] * 8 + [0] * 4)
+
+
+      def test_grid_step_matches_default_peak(self):
+          dir_path = self.uneven_job()
+          default = job_tracker.JobTotals(self.rawdata(dir_path), ['job_mem'])
+          stepped = job_tracker.JobTotals(self.rawdata(dir_path, '--grid_step', '1'), ['job_mem'])
+          self.assertEqual(default.totals['job_mem'][-1], stepped.totals['job_mem'][-1])
+          self.assertGreaterEqual(default.peak('job_mem')[0], 900000)
+          self.assertGreaterEqual(stepped.peak('job_mem')[0], 900000)
+
+
+      def test_total_is_sum_of_node_columns(self):
+          for argv in [(), ('--grid_step', '0.3'), ('--align', 'linear')]:
+              rawdata = self.rawdata(self.uneven_job() if not argv else self.tmp + '/job_tracker_1001', *argv)
+              for name in ['job_mem', 'node_load']:
+                  expected = sum([rawdata.column(node, name) for node in sorted(rawdata.series)])
+                  numpy.testing.assert_allclose(rawdata.total(name), expected)
+                  self.assertEqual(rawdata.total(name).shape, rawdata.times().shape)
@@ -0,0 +1,68 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+import job_tracker
+
+T0 = 1700000000.0
+
+
+def commandArgs(*argv):
+    saved = sys.argv
+    sys.argv = [os.path.join(ROOT, 'job_tracker.py')] + list(argv)
+    try:
+       return job_tracker.CommandArgs()
+    finally:
+       sys.argv = saved
+
+
+def writeCsvNode(dir_path, node, times, job_mem, node_mem=4000000, node_load=1.0, cgroup_mem=0, interval=1.0, mode='w'):
+    # one current format row per sample, columns that are not given are constant
+    f = open(os.path.join(dir_path, node + '.csv'), mode)
+    for indx, time in enumerate(times):
+        values = []
+        for value in [job_mem, node_mem, node_load, cgroup_mem, interval]:
+            if isinstance(value, (list, tuple)):
+               value = value[indx]
+            values.append(value)
+        f.write('%.6f,%d,%d,%.2f,%d,%.6f,%.2f\n' % (time, values[0], values[1], values[2], values[3], time - T0 + 100.0, values[4]))
+    f.close()
+
+
+class TempDirTestCase(unittest.TestCase):
+
+      def setUp(self):
+          self.tmp = tempfile.mkdtemp(prefix='job_tracker_test_')
+          self.cwd = os.getcwd()
+
+
+      def tearDown(self):
+          os.chdir(self.cwd)
+          shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+      def job_dir(self, name='job_tracker_1001'):
+          dir_path = os.path.join(self.tmp, name)
+          os.mkdir(dir_path)
+          return dir_path
+
+
+      def uneven_job(self):
+          # three nodes, r1i0n1 keeps sampling 200s longer at a much higher job memory
+          dir_path = self.job_dir()
+          for indx, node in enumerate(['r1i0n0', 'r1i0n1', 'r1i0n2']):
+              count = 3000
+              if node == 'r1i0n1':
+                 count = 3200
+              times = [T0 + sample + indx * 0.1 for sample in range(count)]
+              job_mem = [260000 + indx * 100] * count
+              if node == 'r1i0n1':
+                 job_mem = job_mem[:3000] + [900000] * 200
+              writeCsvNode(dir_path, node, times, job_mem)
+          return dir_path